@@ -9,7 +9,7 @@ import time
 import sqlite3
 
 from .models import DemandForecast, InventoryOptimization, SalesTrend, CustomerAnalytics, SystemMetrics
-from .services import ARIMAForecastingService, SupplyChainOptimizer
+from .services import ARIMAForecastingService, ModelEvaluationMetricsService, SupplyChainOptimizer
 from inventory.models import Medicine
 from orders.models import Order
 
@@ -650,21 +650,13 @@ def get_model_evaluation_data(request):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # Get all forecasts with their metrics
-        forecasts = DemandForecast.objects.filter(is_active=True).order_by('-created_at')
-        
-        # Calculate aggregate metrics
-        aggregate_metrics = _calculate_aggregate_metrics(forecasts)
-        
-        # Get model performance distribution
-        performance_distribution = _get_model_performance_distribution(forecasts)
-        
-        # Get medicine-specific performance
-        medicine_performance = _get_medicine_performance(forecasts)
+        metrics = ModelEvaluationMetricsService().get_metrics()
         
         # Get recent forecasts for detailed view
         recent_forecasts = []
-        for forecast in forecasts[:20]:
+        for forecast in DemandForecast.objects.filter(
+            is_active=True
+        ).select_related('medicine').order_by('-created_at')[:20]:
             recent_forecasts.append({
                 'id': forecast.id,
                 'medicine_name': forecast.medicine.name,
@@ -681,10 +673,17 @@ def get_model_evaluation_data(request):
             })
         
         return Response({
-            'aggregate_metrics': aggregate_metrics,
-            'performance_distribution': performance_distribution,
-            'medicine_performance': medicine_performance,
+            'aggregate_metrics': metrics['aggregate_metrics'],
+            'performance_distribution': {
+                'period_performance': metrics['period_performance'],
+                'daily_performance': metrics['daily_performance'],
+            },
+            'medicine_performance': {
+                'top_performers': [_performer_data(f) for f in metrics['top_performers']],
+                'worst_performers': [_performer_data(f) for f in metrics['worst_performers']],
+            },
             'recent_forecasts': recent_forecasts,
+            'realized_accuracy': metrics['realized_accuracy'],
         })
         
     except Exception as e:
@@ -964,92 +963,13 @@ def get_forecast_details(request, forecast_id):
         )
 
 
-def _calculate_aggregate_metrics(forecasts):
-    """Helper function to calculate aggregate model performance metrics"""
-    if not forecasts.exists():
-        return {
-            'total_forecasts': 0,
-            'avg_mape': 0,
-            'avg_rmse': 0,
-            'avg_mae': 0,
-            'avg_aic': 0,
-            'avg_bic': 0,
-            'excellent_models': 0,
-            'good_models': 0,
-            'fair_models': 0,
-            'poor_models': 0,
-        }
-    
-    # Calculate averages
-    avg_mape = forecasts.aggregate(avg=models.Avg('mape'))['avg'] or 0
-    avg_rmse = forecasts.aggregate(avg=models.Avg('rmse'))['avg'] or 0
-    avg_mae = forecasts.aggregate(avg=models.Avg('mae'))['avg'] or 0
-    avg_aic = forecasts.aggregate(avg=models.Avg('aic'))['avg'] or 0
-    avg_bic = forecasts.aggregate(avg=models.Avg('bic'))['avg'] or 0
-    
-    # Count by quality
-    excellent_models = forecasts.filter(mape__lt=10).count()
-    good_models = forecasts.filter(mape__gte=10, mape__lt=20).count()
-    fair_models = forecasts.filter(mape__gte=20, mape__lt=30).count()
-    poor_models = forecasts.filter(mape__gte=30).count()
-    
-    return {
-        'total_forecasts': forecasts.count(),
-        'avg_mape': round(avg_mape, 2),
-        'avg_rmse': round(avg_rmse, 2),
-        'avg_mae': round(avg_mae, 2),
-        'avg_aic': round(avg_aic, 2),
-        'avg_bic': round(avg_bic, 2),
-        'excellent_models': excellent_models,
-        'good_models': good_models,
-        'fair_models': fair_models,
-        'poor_models': poor_models,
-    }
-
-
-def _get_model_performance_distribution(forecasts):
-    """Helper function to get model performance distribution data"""
-    # Performance by period type
-    period_performance = {}
-    for period in ['daily', 'weekly', 'monthly']:
-        period_forecasts = forecasts.filter(forecast_period=period)
-        if period_forecasts.exists():
-            period_performance[period] = {
-                'count': period_forecasts.count(),
-                'avg_mape': round(period_forecasts.aggregate(avg=models.Avg('mape'))['avg'] or 0, 2),
-                'avg_rmse': round(period_forecasts.aggregate(avg=models.Avg('rmse'))['avg'] or 0, 2),
-            }
-    
-    return {
-        'period_performance': period_performance,
-    }
-
-
-def _get_medicine_performance(forecasts):
-    """Helper function to get medicine-specific performance metrics"""
-    # Top performing medicines (lowest MAPE)
-    top_performers = []
-    for forecast in forecasts.order_by('mape')[:10]:
-        top_performers.append({
-            'medicine_name': forecast.medicine.name,
-            'forecast_period': forecast.forecast_period,
-            'mape': forecast.mape,
-            'model_quality': forecast.model_quality,
-        })
-    
-    # Worst performing medicines (highest MAPE)
-    worst_performers = []
-    for forecast in forecasts.order_by('-mape')[:10]:
-        worst_performers.append({
-            'medicine_name': forecast.medicine.name,
-            'forecast_period': forecast.forecast_period,
-            'mape': forecast.mape,
-            'model_quality': forecast.model_quality,
-        })
-    
+def _performer_data(forecast):
+    """Helper function to serialize a forecast for the top/worst performer lists"""
     return {
-        'top_performers': top_performers,
-        'worst_performers': worst_performers,
+        'medicine_name': forecast.medicine.name,
+        'forecast_period': forecast.forecast_period,
+        'mape': forecast.mape,
+        'model_quality': forecast.model_quality,
     }
 
 
@@ -0,0 +1,22 @@
+"""
+Record realized accuracy for forecasts whose periods have passed
+
+Safe to run repeatedly (e.g. daily from cron); only forecasts that matured
+since the previous run are evaluated.
+"""
+
+from django.core.management.base import BaseCommand
+
+from analytics.services import ForecastAccuracyService
+
+
+class Command(BaseCommand):
+    help = 'Compare matured demand forecasts with actual demand and record per-horizon error'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Number of forecasts evaluated per transaction')
+
+    def handle(self, *args, **options):
+        evaluated = ForecastAccuracyService().evaluate_matured_forecasts(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Evaluated {evaluated} matured forecasts'))
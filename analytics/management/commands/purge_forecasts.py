@@ -0,0 +1,39 @@
+"""
+Archive and purge superseded demand forecasts and inventory optimizations
+
+Intended to run on a schedule (e.g. nightly from cron). Policies come from
+the ANALYTICS_FORECAST_RETENTION setting and can be overridden per run.
+"""
+
+from django.core.management.base import BaseCommand
+
+from analytics.services import ForecastRetentionService
+
+
+class Command(BaseCommand):
+    help = 'Archive superseded demand forecasts and purge old rows in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report how many rows would be reclaimed without changing anything')
+        parser.add_argument('--batch-size', type=int,
+                            help='Rows deleted per transaction')
+        parser.add_argument('--archive-after-days', type=int,
+                            help='Age after which superseded forecasts are archived')
+
+    def handle(self, *args, **options):
+        policy = {}
+        if options['batch_size']:
+            policy['batch_size'] = options['batch_size']
+        if options['archive_after_days'] is not None:
+            policy['archive_after_days'] = options['archive_after_days']
+
+        metrics = ForecastRetentionService(policy).run(dry_run=options['dry_run'])
+
+        prefix = 'Would reclaim' if metrics['dry_run'] else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {metrics['forecasts_archived']} forecasts, "
+            f"{metrics['optimizations_deleted']} optimizations and "
+            f"{metrics['history_purged']} history rows "
+            f"({metrics['batches']} batches, {metrics['duration_seconds']}s)"
+        ))
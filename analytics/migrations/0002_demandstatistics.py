@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 00:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_type', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly'), ('monthly', 'Monthly')], max_length=10)),
+                ('period_count', models.PositiveIntegerField(default=0)),
+                ('mean', models.FloatField(default=0.0)),
+                ('m2', models.FloatField(default=0.0)),
+                ('ewma', models.FloatField(blank=True, null=True)),
+                ('current_period_start', models.DateField(blank=True, null=True)),
+                ('current_period_quantity', models.PositiveIntegerField(default=0)),
+                ('last_alerted_period', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='demand_statistics', to='inventory.medicine')),
+            ],
+            options={
+                'verbose_name_plural': 'Demand statistics',
+                'unique_together': {('medicine', 'period_type')},
+            },
+        ),
+    ]
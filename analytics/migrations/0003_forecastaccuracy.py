@@ -0,0 +1,83 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_matures_on(apps, schema_editor):
+    from analytics.models import period_offset
+    DemandForecast = apps.get_model('analytics', 'DemandForecast')
+    for forecast in DemandForecast.objects.filter(matures_on__isnull=True).iterator():
+        forecast.matures_on = period_offset(
+            forecast.training_data_end, forecast.forecast_period, forecast.forecast_horizon + 1
+        )
+        forecast.save(update_fields=['matures_on'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0002_demandstatistics'),
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ForecastAccuracy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('forecast_period', models.CharField(max_length=20)),
+                ('horizon_step', models.PositiveIntegerField()),
+                ('period_start', models.DateField()),
+                ('forecasted_quantity', models.FloatField()),
+                ('actual_quantity', models.FloatField()),
+                ('absolute_error', models.FloatField()),
+                ('percentage_error', models.FloatField(blank=True, null=True)),
+                ('evaluated_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['forecast', 'horizon_step'],
+            },
+        ),
+        migrations.AddField(
+            model_name='demandforecast',
+            name='accuracy_evaluated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='demandforecast',
+            name='matures_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='demandforecast',
+            index=models.Index(fields=['accuracy_evaluated_at', 'matures_on'], name='analytics_d_accurac_6fb48b_idx'),
+        ),
+        migrations.AddField(
+            model_name='forecastaccuracy',
+            name='forecast',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accuracy_records', to='analytics.demandforecast'),
+        ),
+        migrations.AddField(
+            model_name='forecastaccuracy',
+            name='medicine',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forecast_accuracy_records', to='inventory.medicine'),
+        ),
+        migrations.AddIndex(
+            model_name='forecastaccuracy',
+            index=models.Index(fields=['forecast_period', 'horizon_step'], name='analytics_f_forecas_47d235_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forecastaccuracy',
+            index=models.Index(fields=['medicine', 'forecast_period'], name='analytics_f_medicin_4e5d4c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='forecastaccuracy',
+            index=models.Index(fields=['evaluated_at'], name='analytics_f_evaluat_4f205a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='forecastaccuracy',
+            unique_together={('forecast', 'horizon_step')},
+        ),
+        migrations.RunPython(backfill_matures_on, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_forecastaccuracy'),
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DemandForecastHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('forecast_id', models.PositiveIntegerField(db_index=True)),
+                ('forecast_period', models.CharField(max_length=20)),
+                ('forecast_horizon', models.PositiveIntegerField()),
+                ('arima_order', models.CharField(max_length=20)),
+                ('aic', models.FloatField()),
+                ('rmse', models.FloatField()),
+                ('mae', models.FloatField()),
+                ('mape', models.FloatField()),
+                ('forecast_total', models.FloatField()),
+                ('training_data_end', models.DateField()),
+                ('training_data_points', models.PositiveIntegerField()),
+                ('forecast_created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Demand forecast history',
+                'ordering': ['-forecast_created_at'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='forecastaccuracy',
+            name='forecast',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='accuracy_records', to='analytics.demandforecast'),
+        ),
+        migrations.AddIndex(
+            model_name='demandforecast',
+            index=models.Index(fields=['medicine', 'forecast_period', 'forecast_horizon', 'is_active'], name='analytics_d_medicin_094bb5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='demandforecast',
+            index=models.Index(fields=['is_active', 'created_at'], name='analytics_d_is_acti_df9759_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inventoryoptimization',
+            index=models.Index(fields=['is_active', 'calculated_at'], name='analytics_i_is_acti_00cf4d_idx'),
+        ),
+        migrations.AddField(
+            model_name='demandforecasthistory',
+            name='medicine',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='forecast_history', to='inventory.medicine'),
+        ),
+        migrations.AddIndex(
+            model_name='demandforecasthistory',
+            index=models.Index(fields=['medicine', 'forecast_period'], name='analytics_d_medicin_f70b16_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='demandforecasthistory',
+            index=models.Index(fields=['archived_at'], name='analytics_d_archive_07c5ee_idx'),
+        ),
+    ]
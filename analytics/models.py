@@ -1,6 +1,17 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
+from datetime import timedelta
+
+
+def period_offset(day, period_type, steps=0):
+    """Start date of the period ``steps`` periods after the one containing ``day``"""
+    if period_type == 'weekly':
+        return day - timedelta(days=day.weekday()) + timedelta(weeks=steps)
+    if period_type == 'monthly':
+        month_index = day.year * 12 + day.month - 1 + steps
+        return day.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+    return day + timedelta(days=steps)
 
 
 class DemandForecast(models.Model):
@@ -42,16 +53,28 @@ class DemandForecast(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
     
+    # Realized accuracy tracking
+    matures_on = models.DateField(null=True, blank=True)  # day after the last forecasted period ends
+    accuracy_evaluated_at = models.DateTimeField(null=True, blank=True)
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['medicine', 'forecast_period']),
             models.Index(fields=['created_at']),
+            models.Index(fields=['accuracy_evaluated_at', 'matures_on']),
+            models.Index(fields=['medicine', 'forecast_period', 'forecast_horizon', 'is_active']),
+            models.Index(fields=['is_active', 'created_at']),
         ]
     
     def __str__(self):
         return f"Demand Forecast for {self.medicine.name} - {self.forecast_period}"
     
+    def save(self, *args, **kwargs):
+        if not self.matures_on and self.training_data_end:
+            self.matures_on = period_offset(self.training_data_end, self.forecast_period, self.forecast_horizon + 1)
+        super().save(*args, **kwargs)
+    
     @property
     def model_quality(self):
         """Determine model quality based on metrics"""
@@ -65,6 +88,164 @@ class DemandForecast(models.Model):
             return "Poor"
 
 
+class DemandForecastHistory(models.Model):
+    """
+    Compact archive of forecasts removed by the retention job
+    """
+    forecast_id = models.PositiveIntegerField(db_index=True)  # id of the purged DemandForecast
+    medicine = models.ForeignKey('inventory.Medicine', on_delete=models.CASCADE, related_name='forecast_history')
+    forecast_period = models.CharField(max_length=20)
+    forecast_horizon = models.PositiveIntegerField()
+    arima_order = models.CharField(max_length=20)  # "p,d,q"
+    
+    aic = models.FloatField()
+    rmse = models.FloatField()
+    mae = models.FloatField()
+    mape = models.FloatField()
+    forecast_total = models.FloatField()  # sum of the forecasted demand
+    
+    training_data_end = models.DateField()
+    training_data_points = models.PositiveIntegerField()
+    forecast_created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-forecast_created_at']
+        verbose_name_plural = 'Demand forecast history'
+        indexes = [
+            models.Index(fields=['medicine', 'forecast_period']),
+            models.Index(fields=['archived_at']),
+        ]
+    
+    def __str__(self):
+        return f"Archived Forecast {self.forecast_id} - {self.medicine.name} - {self.forecast_period}"
+
+
+class ForecastAccuracy(models.Model):
+    """
+    Out-of-sample error of a forecast at one horizon step, once that period has passed
+    """
+    # Kept when the forecast itself is purged by the retention job
+    forecast = models.ForeignKey(DemandForecast, on_delete=models.SET_NULL, null=True, blank=True, related_name='accuracy_records')
+    medicine = models.ForeignKey('inventory.Medicine', on_delete=models.CASCADE, related_name='forecast_accuracy_records')
+    forecast_period = models.CharField(max_length=20)
+    horizon_step = models.PositiveIntegerField()  # 1 = first forecasted period
+    period_start = models.DateField()
+    
+    forecasted_quantity = models.FloatField()
+    actual_quantity = models.FloatField()
+    absolute_error = models.FloatField()
+    percentage_error = models.FloatField(null=True, blank=True)  # undefined when nothing was sold
+    
+    evaluated_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ['forecast', 'horizon_step']
+        ordering = ['forecast', 'horizon_step']
+        indexes = [
+            models.Index(fields=['forecast_period', 'horizon_step']),
+            models.Index(fields=['medicine', 'forecast_period']),
+            models.Index(fields=['evaluated_at']),
+        ]
+    
+    def __str__(self):
+        return f"Forecast Accuracy - {self.medicine.name} - step {self.horizon_step}"
+
+
+class DemandStatistics(models.Model):
+    """
+    Running demand statistics per medicine and period
+
+    Closed periods are folded into a Welford mean/variance and an EWMA as
+    orders are confirmed; the period still in progress is kept separately.
+    """
+    medicine = models.ForeignKey('inventory.Medicine', on_delete=models.CASCADE, related_name='demand_statistics')
+    period_type = models.CharField(max_length=10, choices=[
+        ('daily', 'Daily'),
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+    ])
+    
+    # Welford accumulators over closed periods
+    period_count = models.PositiveIntegerField(default=0)
+    mean = models.FloatField(default=0.0)
+    m2 = models.FloatField(default=0.0)  # sum of squared deviations from the mean
+    ewma = models.FloatField(null=True, blank=True)
+    
+    # Period currently accumulating demand
+    current_period_start = models.DateField(null=True, blank=True)
+    current_period_quantity = models.PositiveIntegerField(default=0)
+    last_alerted_period = models.DateField(null=True, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ['medicine', 'period_type']
+        verbose_name_plural = 'Demand statistics'
+    
+    def __str__(self):
+        return f"Demand Statistics - {self.medicine.name} - {self.period_type}"
+    
+    @property
+    def variance(self):
+        if self.period_count < 2:
+            return 0.0
+        return self.m2 / (self.period_count - 1)
+    
+    @property
+    def std_dev(self):
+        return self.variance ** 0.5
+    
+    def observe(self, period_start, quantity, alpha):
+        """
+        Add demand to its period, closing the previous period if a new one
+        started. Returns False for demand in a period that is already closed,
+        which is left out rather than counted towards another period.
+        """
+        if self.current_period_start is None:
+            self.current_period_start = period_start
+            self.current_period_quantity = quantity
+        elif period_start > self.current_period_start:
+            self._fold(self.current_period_quantity, alpha)
+            self.current_period_start = period_start
+            self.current_period_quantity = quantity
+        elif period_start == self.current_period_start:
+            self.current_period_quantity += quantity
+        else:
+            return False
+        return True
+    
+    def retract(self, period_start, quantity):
+        """
+        Take cancelled demand back out of the open period. Closed periods are
+        already folded into the accumulators and stay as they were observed.
+        Returns whether anything was taken out.
+        """
+        if period_start != self.current_period_start:
+            return False
+        self.current_period_quantity = max(0, self.current_period_quantity - quantity)
+        return True
+    
+    def _fold(self, value, alpha):
+        self.period_count += 1
+        delta = value - self.mean
+        self.mean += delta / self.period_count
+        self.m2 += delta * (value - self.mean)
+        self.ewma = value if self.ewma is None else alpha * value + (1 - alpha) * self.ewma
+    
+    def outlier_bounds(self, sigmas=3):
+        """Lower and upper outlier bounds, or None until two periods are closed"""
+        if self.period_count < 2:
+            return None
+        spread = sigmas * self.std_dev
+        return max(0.0, self.mean - spread), self.mean + spread
+    
+    def anomaly_threshold(self, sigmas=3):
+        """Demand above which the open period is considered anomalous"""
+        baseline = self.ewma if self.ewma is not None else self.mean
+        return baseline + sigmas * self.std_dev
+
+
 class InventoryOptimization(models.Model):
     """
     Optimal inventory levels based on demand forecasting
@@ -99,6 +280,9 @@ class InventoryOptimization(models.Model):
     
     class Meta:
         ordering = ['-calculated_at']
+        indexes = [
+            models.Index(fields=['is_active', 'calculated_at']),
+        ]
     
     def __str__(self):
         return f"Inventory Optimization for {self.medicine.name}"
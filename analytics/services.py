@@ -4,12 +4,14 @@ ARIMA forecasting service for demand prediction and supply chain optimization
 
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
 from typing import Dict, List, Tuple, Optional
 import logging
 from decimal import Decimal
 import time
 import sqlite3
+import threading
 
 from pmdarima import auto_arima
 from statsmodels.tsa.stattools import acf, pacf
@@ -17,11 +19,17 @@ from statsmodels.tsa.seasonal import seasonal_decompose
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 import warnings
 
-from django.db.models import Sum, Count, Q, F
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum, Count, Q, F, Avg
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 from django.db import transaction, connection
 
-from .models import DemandForecast, InventoryOptimization, SalesTrend
+from .models import (
+    DemandForecast, DemandForecastHistory, DemandStatistics, ForecastAccuracy, InventoryOptimization,
+    SalesTrend, period_offset
+)
 from inventory.models import Medicine
 from orders.models import OrderItem
 from transactions.models import Transaction
@@ -53,124 +61,737 @@ def retry_database_operation(max_retries=3, delay=1):
     return decorator
 
 
+class SalesSeriesCache:
+    """
+    Daily sales series per medicine, shared between periods
+
+    Series are kept on the instance for the lifetime of a request and in a
+    process-wide store for ``ANALYTICS_SERIES_CACHE_TTL`` seconds. Weekly and
+    monthly series are derived from the cached daily series by resampling.
+    """
+    
+    PERIOD_FREQUENCIES = {
+        'daily': 'D',
+        'weekly': 'W',
+        'monthly': 'M',
+    }
+    SALES_STATUSES = ['confirmed', 'processing', 'shipped', 'delivered']
+    MAX_PROCESS_ENTRIES = 512
+    
+    _process_store = {}
+    _process_lock = threading.Lock()
+    
+    def __init__(self):
+        self._series = {}
+    
+    @property
+    def ttl(self) -> int:
+        return getattr(settings, 'ANALYTICS_SERIES_CACHE_TTL', 300)
+    
+    def get_daily_series(self, medicine_id: int, any_status: bool = False) -> pd.Series:
+        """
+        Daily quantities for a medicine indexed by day, loaded at most once
+        """
+        key = (int(medicine_id), any_status)
+        series = self._series.get(key)
+        if series is not None:
+            return series
+        
+        series = self._get_from_process_store(key)
+        if series is None:
+            series = self._load_daily_series(*key)
+            self._put_in_process_store(key, series)
+        
+        self._series[key] = series
+        return series
+    
+    @classmethod
+    def resample(cls, daily: pd.Series, period_type: str) -> pd.Series:
+        """
+        Aggregate a daily series to the requested period
+        """
+        if period_type == 'daily':
+            return daily
+        frequency = cls.PERIOD_FREQUENCIES[period_type]
+        return daily.groupby(daily.index.asfreq(frequency)).sum()
+    
+    @classmethod
+    def invalidate(cls, medicine_id: Optional[int] = None):
+        """
+        Drop cached series for one medicine, or for all medicines
+        """
+        with cls._process_lock:
+            if medicine_id is None:
+                cls._process_store.clear()
+            else:
+                cls._process_store.pop((int(medicine_id), False), None)
+                cls._process_store.pop((int(medicine_id), True), None)
+    
+    def _get_from_process_store(self, key: Tuple[int, bool]) -> Optional[pd.Series]:
+        with self._process_lock:
+            entry = self._process_store.get(key)
+        if entry is None:
+            return None
+        loaded_at, series = entry
+        if time.monotonic() - loaded_at > self.ttl:
+            return None
+        return series
+    
+    def _put_in_process_store(self, key: Tuple[int, bool], series: pd.Series):
+        if self.ttl <= 0:
+            return
+        with self._process_lock:
+            if len(self._process_store) >= self.MAX_PROCESS_ENTRIES:
+                oldest = min(self._process_store, key=lambda key: self._process_store[key][0])
+                del self._process_store[oldest]
+            self._process_store[key] = (time.monotonic(), series)
+    
+    def _load_daily_series(self, medicine_id: int, any_status: bool) -> pd.Series:
+        order_items = OrderItem.objects.filter(medicine_id=medicine_id)
+        if not any_status:
+            order_items = order_items.filter(order__status__in=self.SALES_STATUSES)
+        rows = list(order_items.values_list('order__created_at', 'quantity'))
+        
+        if not rows:
+            return pd.Series(dtype='int64', index=pd.PeriodIndex([], freq='D'))
+        
+        df = pd.DataFrame(rows, columns=['created_at', 'quantity'])
+        days = pd.to_datetime(df['created_at'], utc=True).dt.tz_localize(None).dt.to_period('D')
+        daily = df.groupby(days)['quantity'].sum().sort_index()
+        
+        logger.info(f"Loaded {len(df)} records into {len(daily)} daily periods for medicine {medicine_id}")
+        return daily
+
+
+class DemandStatisticsService:
+    """
+    Keeps DemandStatistics up to date as orders are confirmed
+    """
+    
+    PERIOD_TYPES = ['daily', 'weekly', 'monthly']
+    
+    @property
+    def alpha(self) -> float:
+        return getattr(settings, 'ANALYTICS_EWMA_ALPHA', 0.3)
+    
+    @property
+    def sigmas(self) -> float:
+        return getattr(settings, 'ANALYTICS_ANOMALY_SIGMAS', 3)
+    
+    @property
+    def min_periods(self) -> int:
+        return getattr(settings, 'ANALYTICS_ANOMALY_MIN_PERIODS', 7)
+    
+    @staticmethod
+    def period_start(day, period_type: str):
+        """First day of the period containing ``day``"""
+        if period_type == 'weekly':
+            return day - timedelta(days=day.weekday())
+        if period_type == 'monthly':
+            return day.replace(day=1)
+        return day
+    
+    def record_order(self, order):
+        """
+        Fold a confirmed order's quantities into the running statistics
+        """
+        return self.record_orders([order])
+    
+    def record_orders(self, orders):
+        """
+        Fold several confirmed orders into the running statistics, locking
+        and saving each medicine's statistics once for the whole batch
+        """
+        quantities = self._quantities_by_day(orders)
+        
+        anomalies = []
+        with transaction.atomic():
+            for medicine_id, by_day in quantities.items():
+                for period_type in self.PERIOD_TYPES:
+                    stats = self._locked_statistics(medicine_id, period_type)
+                    # Oldest first, so each day closes the periods before it
+                    for day in sorted(by_day):
+                        if not stats.observe(self.period_start(day, period_type), by_day[day], self.alpha):
+                            logger.warning(
+                                f"Skipped {by_day[day]} units of medicine {medicine_id} confirmed on {day}: "
+                                f"its {period_type} period is already closed"
+                            )
+                            continue
+                        
+                        if period_type == 'daily' and self._is_new_anomaly(stats):
+                            stats.last_alerted_period = stats.current_period_start
+                            anomalies.append((
+                                stats,
+                                stats.current_period_start,
+                                stats.current_period_quantity,
+                                stats.anomaly_threshold(self.sigmas),
+                            ))
+                    stats.save()
+                SalesSeriesCache.invalidate(medicine_id)
+        
+        for stats, period_start, quantity, threshold in anomalies:
+            from common.services import NotificationService
+            NotificationService.notify_demand_anomaly(stats.medicine, period_start, quantity, threshold)
+        return [stats for stats, *_ in anomalies]
+    
+    def retract_order(self, order):
+        """
+        Take a cancelled order's quantities back out of the running statistics
+        """
+        return self.retract_orders([order])
+    
+    def retract_orders(self, orders):
+        """
+        Take cancelled, previously confirmed orders back out of the periods
+        they were recorded in, while those periods are still open
+        """
+        quantities = self._quantities_by_day(orders)
+        with transaction.atomic():
+            for medicine_id, by_day in quantities.items():
+                for period_type in self.PERIOD_TYPES:
+                    stats = self._locked_statistics(medicine_id, period_type)
+                    for day, quantity in by_day.items():
+                        stats.retract(self.period_start(day, period_type), quantity)
+                    stats.save()
+                SalesSeriesCache.invalidate(medicine_id)
+    
+    @staticmethod
+    def _quantities_by_day(orders):
+        """
+        {medicine_id: {day: quantity}} for the orders' items. Orders count
+        on the (UTC) day they were confirmed, so a confirmation never lands
+        in a period other than the one it is later retracted from.
+        """
+        days = {
+            order.pk: (order.confirmed_at or order.created_at or timezone.now()).astimezone(dt_timezone.utc).date()
+            for order in orders
+        }
+        quantities = defaultdict(lambda: defaultdict(int))
+        for order_id, medicine_id, quantity in (
+            OrderItem.objects.filter(order_id__in=days).values_list('order_id', 'medicine_id', 'quantity')
+        ):
+            quantities[medicine_id][days[order_id]] += quantity
+        return quantities
+    
+    def get_outlier_bounds(self, medicine_id: int, period_type: str) -> Optional[Tuple[float, float]]:
+        """Outlier bounds for the forecasting cleaner, or None without enough history"""
+        stats = DemandStatistics.objects.filter(medicine_id=medicine_id, period_type=period_type).first()
+        if stats is None or stats.period_count < self.min_periods:
+            return None
+        return stats.outlier_bounds(self.sigmas)
+    
+    def _locked_statistics(self, medicine_id: int, period_type: str) -> DemandStatistics:
+        DemandStatistics.objects.get_or_create(medicine_id=medicine_id, period_type=period_type)
+        return DemandStatistics.objects.select_for_update().select_related('medicine').get(
+            medicine_id=medicine_id, period_type=period_type
+        )
+    
+    def _is_new_anomaly(self, stats: DemandStatistics) -> bool:
+        if stats.period_count < self.min_periods or stats.std_dev <= 0:
+            return False
+        if stats.last_alerted_period == stats.current_period_start:
+            return False
+        return stats.current_period_quantity > stats.anomaly_threshold(self.sigmas)
+
+
+class ForecastAccuracyService:
+    """
+    Records realized, out-of-sample accuracy of forecasts whose periods have passed
+    """
+    
+    def evaluate_matured_forecasts(self, today=None, batch_size: int = 200) -> int:
+        """
+        Evaluate every forecast that has matured since the last run
+
+        Returns the number of forecasts evaluated.
+        """
+        today = today or timezone.now().date()
+        pending = DemandForecast.objects.filter(
+            accuracy_evaluated_at__isnull=True,
+            matures_on__lte=today
+        ).order_by('matures_on', 'id').values(
+            'id', 'medicine_id', 'forecast_period', 'training_data_end', 'forecasted_demand'
+        )
+        
+        evaluated = 0
+        while True:
+            batch = list(pending[:batch_size])
+            if not batch:
+                break
+            self._evaluate_batch(batch)
+            evaluated += len(batch)
+        
+        if evaluated:
+            ModelEvaluationMetricsService.invalidate()
+        logger.info(f"Evaluated realized accuracy for {evaluated} matured forecasts")
+        return evaluated
+    
+    def _evaluate_batch(self, batch: List[Dict]):
+        forecast_rows = pd.DataFrame([
+            {
+                'forecast_id': forecast['id'],
+                'medicine_id': forecast['medicine_id'],
+                'forecast_period': forecast['forecast_period'],
+                'horizon_step': step,
+                'period_start': pd.Timestamp(period_offset(forecast['training_data_end'], forecast['forecast_period'], step)),
+                'forecasted_quantity': float(value),
+            }
+            for forecast in batch
+            for step, value in enumerate(forecast['forecasted_demand'] or [], start=1)
+        ])
+        
+        records = []
+        if not forecast_rows.empty:
+            actuals = self._load_actuals(forecast_rows)
+            merged = forecast_rows.merge(
+                actuals, how='left', on=['medicine_id', 'forecast_period', 'period_start']
+            )
+            forecasted = merged['forecasted_quantity'].to_numpy()
+            actual = merged['actual_quantity'].fillna(0).to_numpy(dtype=float)
+            absolute_error = np.abs(forecasted - actual)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                percentage_error = np.where(actual > 0, absolute_error / actual * 100, np.nan)
+            
+            records = [
+                ForecastAccuracy(
+                    forecast_id=row.forecast_id,
+                    medicine_id=row.medicine_id,
+                    forecast_period=row.forecast_period,
+                    horizon_step=row.horizon_step,
+                    period_start=row.period_start.date(),
+                    forecasted_quantity=row.forecasted_quantity,
+                    actual_quantity=actual[i],
+                    absolute_error=absolute_error[i],
+                    percentage_error=None if np.isnan(percentage_error[i]) else percentage_error[i],
+                )
+                for i, row in enumerate(merged.itertuples(index=False))
+            ]
+        
+        with transaction.atomic():
+            ForecastAccuracy.objects.bulk_create(records, ignore_conflicts=True)
+            DemandForecast.objects.filter(id__in=[forecast['id'] for forecast in batch]).update(
+                accuracy_evaluated_at=timezone.now()
+            )
+    
+    def _load_actuals(self, forecast_rows: pd.DataFrame) -> pd.DataFrame:
+        """Actual demand per medicine, period type and period start for the batch"""
+        window_start = forecast_rows['period_start'].min().to_pydatetime().replace(tzinfo=dt_timezone.utc)
+        rows = list(OrderItem.objects.filter(
+            medicine_id__in=forecast_rows['medicine_id'].unique().tolist(),
+            order__status__in=SalesSeriesCache.SALES_STATUSES,
+            order__created_at__gte=window_start
+        ).values_list('medicine_id', 'order__created_at', 'quantity'))
+        
+        columns = ['medicine_id', 'forecast_period', 'period_start', 'actual_quantity']
+        if not rows:
+            return pd.DataFrame(columns=columns).astype({'medicine_id': 'int64', 'period_start': 'datetime64[ns]'})
+        
+        sales = pd.DataFrame(rows, columns=['medicine_id', 'created_at', 'quantity'])
+        days = pd.to_datetime(sales['created_at'], utc=True).dt.tz_localize(None).dt.normalize()
+        frames = []
+        for period_type, frequency in SalesSeriesCache.PERIOD_FREQUENCIES.items():
+            if period_type not in set(forecast_rows['forecast_period']):
+                continue
+            starts = days if period_type == 'daily' else days.dt.to_period(frequency).dt.start_time
+            grouped = sales.groupby([sales['medicine_id'], starts.rename('period_start')])['quantity'].sum()
+            frame = grouped.rename('actual_quantity').reset_index()
+            frame['forecast_period'] = period_type
+            frames.append(frame)
+        actuals = pd.concat(frames, ignore_index=True)[columns]
+        actuals['period_start'] = actuals['period_start'].astype('datetime64[ns]')
+        return actuals
+    
+    @staticmethod
+    def realized_summary(forecasts=None) -> Dict:
+        """
+        Realized accuracy overall, per period type and per horizon step
+        """
+        records = ForecastAccuracy.objects.all()
+        if forecasts is not None:
+            records = records.filter(forecast__in=forecasts)
+        
+        overall = records.aggregate(
+            evaluated_periods=Count('id'),
+            evaluated_forecasts=Count('forecast', distinct=True),
+            avg_mape=Avg('percentage_error'),
+            avg_mae=Avg('absolute_error'),
+        )
+        by_period = {
+            row['forecast_period']: {
+                'count': row['count'],
+                'avg_mape': round(row['avg_mape'] or 0, 2),
+                'avg_mae': round(row['avg_mae'] or 0, 2),
+            }
+            for row in records.values('forecast_period').annotate(
+                count=Count('id'), avg_mape=Avg('percentage_error'), avg_mae=Avg('absolute_error')
+            ).order_by('forecast_period')
+        }
+        by_horizon = [
+            {
+                'horizon_step': row['horizon_step'],
+                'count': row['count'],
+                'avg_mape': round(row['avg_mape'] or 0, 2),
+                'avg_mae': round(row['avg_mae'] or 0, 2),
+            }
+            for row in records.values('horizon_step').annotate(
+                count=Count('id'), avg_mape=Avg('percentage_error'), avg_mae=Avg('absolute_error')
+            ).order_by('horizon_step')
+        ]
+        
+        return {
+            'evaluated_periods': overall['evaluated_periods'],
+            'evaluated_forecasts': overall['evaluated_forecasts'],
+            'avg_mape': round(overall['avg_mape'] or 0, 2),
+            'avg_mae': round(overall['avg_mae'] or 0, 2),
+            'by_period': by_period,
+            'by_horizon': by_horizon,
+        }
+
+
+class ModelEvaluationMetricsService:
+    """
+    Model evaluation metrics shared by the dashboard and the API
+
+    Results are cached per process against the forecasts change version, so
+    creating or deleting a forecast in any worker invalidates every worker's
+    copy; ``ANALYTICS_METRICS_CACHE_TTL`` bounds staleness from writes that
+    bypass the signals.
+    """
+    
+    CACHE_KEY = 'analytics:model_evaluation_metrics'
+    PERIOD_TYPES = ['daily', 'weekly', 'monthly']
+    
+    @classmethod
+    def invalidate(cls):
+        from common.services import ChangeVersionService
+        
+        cache.delete(cls.CACHE_KEY)
+        ChangeVersionService.bump(ChangeVersionService.FORECASTS_SCOPE)
+    
+    def get_metrics(self) -> Dict:
+        from common.services import ChangeVersionService
+        
+        scope = ChangeVersionService.FORECASTS_SCOPE
+        version = ChangeVersionService.get_versions([scope])[scope]
+        cached = cache.get(self.CACHE_KEY)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        metrics = self._compute()
+        cache.set(self.CACHE_KEY, (version, metrics), getattr(settings, 'ANALYTICS_METRICS_CACHE_TTL', 900))
+        return metrics
+    
+    def _compute(self) -> Dict:
+        forecasts = DemandForecast.objects.filter(is_active=True)
+        
+        aggregates = {
+            'total': Count('id'),
+            'avg_mape': Avg('mape'),
+            'avg_rmse': Avg('rmse'),
+            'avg_mae': Avg('mae'),
+            'avg_aic': Avg('aic'),
+            'avg_bic': Avg('bic'),
+            'excellent': Count('id', filter=Q(mape__lt=10)),
+            'good': Count('id', filter=Q(mape__gte=10, mape__lt=20)),
+            'fair': Count('id', filter=Q(mape__gte=20, mape__lt=30)),
+            'poor': Count('id', filter=Q(mape__gte=30)),
+        }
+        for period in self.PERIOD_TYPES:
+            period_filter = Q(forecast_period=period)
+            aggregates[f'{period}_count'] = Count('id', filter=period_filter)
+            aggregates[f'{period}_avg_mape'] = Avg('mape', filter=period_filter)
+            aggregates[f'{period}_avg_rmse'] = Avg('rmse', filter=period_filter)
+        totals = forecasts.aggregate(**aggregates)
+        
+        period_performance = {
+            period: {
+                'count': totals[f'{period}_count'],
+                'avg_mape': round(totals[f'{period}_avg_mape'] or 0, 2),
+                'avg_rmse': round(totals[f'{period}_avg_rmse'] or 0, 2),
+            }
+            for period in self.PERIOD_TYPES
+            if totals[f'{period}_count']
+        }
+        
+        thirty_days_ago = timezone.now() - timedelta(days=30)
+        daily_performance = {
+            row['day'].isoformat(): {
+                'count': row['count'],
+                'avg_mape': round(row['avg_mape'] or 0, 2),
+            }
+            for row in forecasts.filter(created_at__gte=thirty_days_ago)
+            .annotate(day=TruncDate('created_at'))
+            .values('day')
+            .annotate(count=Count('id'), avg_mape=Avg('mape'))
+            .order_by('day')
+        }
+        
+        ranked = forecasts.select_related('medicine')
+        
+        return {
+            'aggregate_metrics': {
+                'total_forecasts': totals['total'],
+                'avg_mape': round(totals['avg_mape'] or 0, 2),
+                'avg_rmse': round(totals['avg_rmse'] or 0, 2),
+                'avg_mae': round(totals['avg_mae'] or 0, 2),
+                'avg_aic': round(totals['avg_aic'] or 0, 2),
+                'avg_bic': round(totals['avg_bic'] or 0, 2),
+                'excellent_models': totals['excellent'],
+                'good_models': totals['good'],
+                'fair_models': totals['fair'],
+                'poor_models': totals['poor'],
+            },
+            'period_performance': period_performance,
+            'daily_performance': daily_performance,
+            'top_performers': list(ranked.order_by('mape')[:10]),
+            'worst_performers': list(ranked.order_by('-mape')[:10]),
+            'most_forecasted': list(forecasts.values('medicine__name').annotate(
+                count=Count('id'),
+                avg_mape=Avg('mape')
+            ).order_by('-count')[:10]),
+            'realized_accuracy': ForecastAccuracyService.realized_summary(),
+        }
+
+
+class ForecastRetentionService:
+    """
+    Keeps the forecast and optimization tables bounded
+
+    Only the latest forecast per (medicine, period, horizon) stays active.
+    Superseded rows are archived to DemandForecastHistory and deleted in
+    batches according to ``ANALYTICS_FORECAST_RETENTION``.
+    """
+    
+    DEFAULT_POLICY = {
+        'archive_after_days': 30,
+        'unevaluated_grace_days': 180,
+        'optimization_retention_days': 30,
+        'history_retention_days': 730,
+        'batch_size': 500,
+    }
+    
+    # Set while run() deletes forecasts, so the per-row post_delete receiver
+    # leaves the metrics cache to the single invalidation at the end
+    _purging = threading.local()
+    
+    def __init__(self, policy: Optional[Dict] = None):
+        self.policy = {
+            **self.DEFAULT_POLICY,
+            **getattr(settings, 'ANALYTICS_FORECAST_RETENTION', {}),
+            **(policy or {}),
+        }
+    
+    @staticmethod
+    def supersede(forecast: DemandForecast) -> int:
+        """
+        Deactivate older forecasts (and their optimizations) for the same medicine, period and horizon
+        """
+        superseded_ids = list(DemandForecast.objects.filter(
+            medicine_id=forecast.medicine_id,
+            forecast_period=forecast.forecast_period,
+            forecast_horizon=forecast.forecast_horizon,
+            is_active=True
+        ).exclude(pk=forecast.pk).values_list('id', flat=True))
+        
+        if superseded_ids:
+            DemandForecast.objects.filter(id__in=superseded_ids).update(is_active=False)
+            InventoryOptimization.objects.filter(
+                demand_forecast_id__in=superseded_ids, is_active=True
+            ).update(is_active=False)
+        return len(superseded_ids)
+    
+    @staticmethod
+    def supersede_optimization(optimization: InventoryOptimization) -> int:
+        """
+        Deactivate older optimizations calculated from the same forecast
+        """
+        return InventoryOptimization.objects.filter(
+            demand_forecast_id=optimization.demand_forecast_id,
+            is_active=True
+        ).exclude(pk=optimization.pk).update(is_active=False)
+    
+    @classmethod
+    def is_purging(cls) -> bool:
+        return getattr(cls._purging, 'active', False)
+    
+    def run(self, now: Optional[datetime] = None, dry_run: bool = False) -> Dict:
+        """
+        Archive and purge superseded rows, returning how many rows were reclaimed
+        """
+        now = now or timezone.now()
+        started = time.monotonic()
+        batch_size = self.policy['batch_size']
+        
+        # Superseded forecasts are kept until their realized accuracy has been
+        # recorded, unless they are past the grace period
+        forecasts = DemandForecast.objects.filter(
+            is_active=False,
+            created_at__lt=now - timedelta(days=self.policy['archive_after_days'])
+        ).filter(
+            Q(accuracy_evaluated_at__isnull=False) |
+            Q(created_at__lt=now - timedelta(days=self.policy['unevaluated_grace_days']))
+        )
+        optimizations = InventoryOptimization.objects.filter(
+            is_active=False,
+            calculated_at__lt=now - timedelta(days=self.policy['optimization_retention_days'])
+        )
+        history = DemandForecastHistory.objects.filter(
+            archived_at__lt=now - timedelta(days=self.policy['history_retention_days'])
+        )
+        
+        if dry_run:
+            return {
+                'forecasts_archived': forecasts.count(),
+                'optimizations_deleted': optimizations.count() + InventoryOptimization.objects.filter(
+                    demand_forecast__in=forecasts, is_active=True
+                ).count(),
+                'history_purged': history.count(),
+                'batches': 0,
+                'duration_seconds': round(time.monotonic() - started, 3),
+                'dry_run': True,
+            }
+        
+        metrics = {'forecasts_archived': 0, 'optimizations_deleted': 0, 'history_purged': 0, 'batches': 0}
+        
+        self._purging.active = True
+        try:
+            while True:
+                ids = list(forecasts.order_by('id').values_list('id', flat=True)[:batch_size])
+                if not ids:
+                    break
+                with transaction.atomic():
+                    archived = self._archive(ids)
+                    metrics['optimizations_deleted'] += InventoryOptimization.objects.filter(
+                        demand_forecast_id__in=ids
+                    ).delete()[0]
+                    # Realized accuracy records survive with their forecast link
+                    # cleared; the delete signal means rows are loaded, so load
+                    # only the keys rather than the forecast payloads
+                    DemandForecast.objects.filter(id__in=ids).only('id').delete()
+                metrics['forecasts_archived'] += archived
+                metrics['batches'] += 1
+        finally:
+            self._purging.active = False
+        
+        metrics['optimizations_deleted'] += self._delete_in_batches(optimizations, metrics)
+        metrics['history_purged'] += self._delete_in_batches(history, metrics)
+        metrics['duration_seconds'] = round(time.monotonic() - started, 3)
+        metrics['dry_run'] = False
+        
+        if metrics['forecasts_archived'] or metrics['optimizations_deleted']:
+            ModelEvaluationMetricsService.invalidate()
+        
+        logger.info(
+            f"Forecast retention reclaimed {metrics['forecasts_archived']} forecasts, "
+            f"{metrics['optimizations_deleted']} optimizations and {metrics['history_purged']} "
+            f"history rows in {metrics['batches']} batches ({metrics['duration_seconds']}s)"
+        )
+        return metrics
+    
+    def _archive(self, ids: List[int]) -> int:
+        rows = DemandForecast.objects.filter(id__in=ids).values(
+            'id', 'medicine_id', 'forecast_period', 'forecast_horizon', 'arima_p', 'arima_d', 'arima_q',
+            'aic', 'rmse', 'mae', 'mape', 'forecasted_demand', 'training_data_end',
+            'training_data_points', 'created_at'
+        )
+        history = [
+            DemandForecastHistory(
+                forecast_id=row['id'],
+                medicine_id=row['medicine_id'],
+                forecast_period=row['forecast_period'],
+                forecast_horizon=row['forecast_horizon'],
+                arima_order=f"{row['arima_p']},{row['arima_d']},{row['arima_q']}",
+                aic=row['aic'],
+                rmse=row['rmse'],
+                mae=row['mae'],
+                mape=row['mape'],
+                forecast_total=float(sum(row['forecasted_demand'] or [])),
+                training_data_end=row['training_data_end'],
+                training_data_points=row['training_data_points'],
+                forecast_created_at=row['created_at'],
+            )
+            for row in rows
+        ]
+        DemandForecastHistory.objects.bulk_create(history)
+        return len(history)
+    
+    def _delete_in_batches(self, queryset, metrics: Dict) -> int:
+        deleted = 0
+        while True:
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:self.policy['batch_size']])
+            if not ids:
+                return deleted
+            deleted += queryset.model.objects.filter(pk__in=ids).delete()[0]
+            metrics['batches'] += 1
+
+
 class ARIMAForecastingService:
     """
     Service class for ARIMA-based demand forecasting
     """
     
-    def __init__(self):
+    def __init__(self, series_cache: Optional['SalesSeriesCache'] = None):
         self.min_data_points = {
             'daily': 30,
             'weekly': 12,
             'monthly': 6
         }
+        # One cache per service instance, so a request that builds a single
+        # service reads each medicine's history from the database at most once
+        self.series_cache = series_cache or SalesSeriesCache()
+        self.statistics_service = DemandStatisticsService()
         
     def prepare_sales_data(self, medicine_id: int, period_type: str = 'daily', 
                           start_date: Optional[datetime] = None, 
                           end_date: Optional[datetime] = None) -> pd.DataFrame:
         """
         Prepare sales data for ARIMA forecasting
+
+        The daily series for the medicine is loaded once through the series
+        cache; weekly and monthly series are derived from it in memory.
         """
-        if not start_date or not end_date:
-            # If no date range specified, find the actual range of available data
-            order_items = OrderItem.objects.filter(
-                medicine_id=medicine_id,
-                order__status__in=['confirmed', 'processing', 'shipped', 'delivered']
-            ).order_by('order__created_at')
-            
-            if not order_items.exists():
-                raise ValueError(f"No sales data found for medicine {medicine_id}")
-            
-            if not start_date:
-                start_date = order_items.first().order.created_at
-            if not end_date:
-                end_date = order_items.last().order.created_at
+        if period_type not in SalesSeriesCache.PERIOD_FREQUENCIES:
+            raise ValueError("period_type must be 'daily', 'weekly', or 'monthly'")
+        
+        daily = self.series_cache.get_daily_series(medicine_id)
+        if daily.empty and (start_date or end_date):
+            daily = self.series_cache.get_daily_series(medicine_id, any_status=True)
+            if not daily.empty:
+                logger.warning(f"Using order items with any status for medicine {medicine_id}")
+        if daily.empty:
+            raise ValueError(f"No sales data found for medicine {medicine_id}")
+        
+        if start_date or end_date:
+            window = daily
+            if start_date:
+                window = window[window.index >= pd.Period(pd.Timestamp(start_date).date(), freq='D')]
+            if end_date:
+                window = window[window.index <= pd.Period(pd.Timestamp(end_date).date(), freq='D')]
             
-        # Get sales data from OrderItems
-        order_items = OrderItem.objects.filter(
-            medicine_id=medicine_id,
-            order__created_at__range=[start_date, end_date],
-            order__status__in=['confirmed', 'processing', 'shipped', 'delivered']
-        ).values('order__created_at', 'quantity').order_by('order__created_at')
-        
-        if not order_items.exists():
-            # Debug: Try without date range filter
-            debug_items = OrderItem.objects.filter(
-                medicine_id=medicine_id,
-                order__status__in=['confirmed', 'processing', 'shipped', 'delivered']
-            ).values('order__created_at', 'quantity').order_by('order__created_at')
-            
-            if not debug_items.exists():
-                # Try with any status
-                any_status_items = OrderItem.objects.filter(
-                    medicine_id=medicine_id
-                ).values('order__created_at', 'quantity').order_by('order__created_at')
-                
-                if not any_status_items.exists():
-                    raise ValueError(f"No sales data found for medicine {medicine_id}")
-                else:
-                    # Use items with any status
-                    order_items = any_status_items
-                    logger.warning(f"Using order items with any status for medicine {medicine_id}")
+            if not window.empty:
+                daily = window
             else:
-                # Use items without date range
-                order_items = debug_items
                 logger.warning(f"Using order items without date range for medicine {medicine_id}")
         
-        # Convert to DataFrame
-        df = pd.DataFrame(list(order_items))
-        df['order__created_at'] = pd.to_datetime(df['order__created_at'])
-        
-        # Debug logging
-        logger.info(f"Prepared {len(df)} records for {period_type} forecasting")
-        logger.info(f"Date range: {df['order__created_at'].min()} to {df['order__created_at'].max()}")
+        grouped = SalesSeriesCache.resample(daily, period_type)
         
-        # Group by period and aggregate quantities
-        if period_type == 'daily':
-            grouped = df.groupby(df['order__created_at'].dt.to_period('D'))['quantity'].sum()
-        elif period_type == 'weekly':
-            grouped = df.groupby(df['order__created_at'].dt.to_period('W'))['quantity'].sum()
-        elif period_type == 'monthly':
-            grouped = df.groupby(df['order__created_at'].dt.to_period('M'))['quantity'].sum()
-        else:
-            raise ValueError("period_type must be 'daily', 'weekly', or 'monthly'")
-
-        # Debug logging
         logger.info(f"Grouped data for {period_type}: {len(grouped)} periods")
-        logger.info(f"Non-zero periods: {(grouped > 0).sum()}")
-        logger.info(f"Sample values: {grouped.head()}")
-
+        
         # Convert period index to datetime and create DataFrame
         df_result = pd.DataFrame({
             'date': grouped.index.to_timestamp(),
             'quantity': grouped.values
         })
         
-        # Debug logging
-        logger.info(f"DataFrame result shape: {df_result.shape}")
-        logger.info(f"DataFrame non-zero: {(df_result['quantity'] > 0).sum()}")
-        
-        # For now, just return the grouped data without reindexing
-        # This will preserve the actual aggregated values
         try:
             # Ensure quantity is numeric and non-negative
             df_result['quantity'] = pd.to_numeric(df_result['quantity'], errors='coerce').fillna(0)
             df_result['quantity'] = df_result['quantity'].clip(lower=0)
-            
-            # Final debug logging
-            logger.info(f"Final DataFrame - Non-zero periods: {(df_result['quantity'] > 0).sum()}")
-            logger.info(f"Final DataFrame - Sample values: {df_result['quantity'].head()}")
-            
         except Exception as e:
             logger.error(f"Error processing data for {period_type}: {e}")
-            logger.error(f"DataFrame columns: {df_result.columns.tolist()}")
-            logger.error(f"DataFrame dtypes: {df_result.dtypes}")
             raise ValueError(f"Error processing {period_type} data: {e}")
         
-        # Use the result DataFrame
-        df = df_result
-        
-        return df
+        return df_result
     
     def find_optimal_arima_params(self, data: pd.Series) -> Tuple[int, int, int]:
         """
@@ -285,12 +906,17 @@ class ARIMAForecastingService:
             
             # Sanitize input data - handle outliers and negative values
             ts_data = ts_data.clip(lower=0)  # Remove negative values
-            # Cap extreme outliers at 3 standard deviations
-            mean_val = ts_data.mean()
-            std_val = ts_data.std()
-            if std_val > 0:
-                upper_bound = mean_val + 3 * std_val
-                ts_data = ts_data.clip(upper=upper_bound)
+            # Cap extreme outliers using the running demand statistics, falling
+            # back to the series itself until enough periods have been observed
+            bounds = self.statistics_service.get_outlier_bounds(medicine_id, forecast_period)
+            if bounds:
+                ts_data = ts_data.clip(upper=bounds[1])
+            else:
+                mean_val = ts_data.mean()
+                std_val = ts_data.std()
+                if std_val > 0:
+                    upper_bound = mean_val + 3 * std_val
+                    ts_data = ts_data.clip(upper=upper_bound)
             
             logger.info(f"Cleaned time series data: {len(ts_data)} points, range: {ts_data.min():.2f} to {ts_data.max():.2f}")
             
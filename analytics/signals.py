@@ -0,0 +1,38 @@
+"""
+Signals for analytics
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import DemandForecast, InventoryOptimization
+from .services import ForecastRetentionService, ModelEvaluationMetricsService
+
+
+@receiver(post_save, sender=DemandForecast)
+def invalidate_metrics_on_new_forecast(sender, instance, created, **kwargs):
+    """
+    Supersede older forecasts for the same key and drop cached model
+    evaluation metrics when a forecast is added
+    """
+    if created:
+        ForecastRetentionService.supersede(instance)
+        ModelEvaluationMetricsService.invalidate()
+
+
+@receiver(post_save, sender=InventoryOptimization)
+def supersede_previous_optimizations(sender, instance, created, **kwargs):
+    """
+    Keep only the latest optimization per forecast active
+    """
+    if created:
+        ForecastRetentionService.supersede_optimization(instance)
+
+
+@receiver(post_delete, sender=DemandForecast)
+def invalidate_metrics_on_deleted_forecast(sender, instance, **kwargs):
+    """
+    Drop cached model evaluation metrics when a forecast is removed; the
+    retention purge invalidates once for the whole run instead
+    """
+    if not ForecastRetentionService.is_purging():
+        ModelEvaluationMetricsService.invalidate()
@@ -2,21 +2,25 @@
 Comprehensive unit tests for the analytics module
 """
 
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from decimal import Decimal
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timedelta, timezone as dt_timezone
 import json
 import pandas as pd
 import numpy as np
 from unittest.mock import patch, MagicMock
 
 from .models import (
-    DemandForecast, InventoryOptimization, SalesTrend, 
+    DemandForecast, DemandForecastHistory, DemandStatistics, ForecastAccuracy, InventoryOptimization, SalesTrend, 
     CustomerAnalytics, SystemMetrics
 )
-from .services import ARIMAForecastingService, SupplyChainOptimizer
+from .services import (
+    ARIMAForecastingService, DemandStatisticsService, ForecastAccuracyService,
+    ForecastRetentionService, ModelEvaluationMetricsService, SalesSeriesCache, SupplyChainOptimizer
+)
 from inventory.models import Category, Manufacturer, Medicine
 from accounts.models import User
 from orders.models import Order, OrderItem
@@ -260,3 +264,478 @@ class ARIMAForecastingServiceTests(TestCase):
         self.assertIsInstance(metrics['rmse'], float)
         self.assertIsInstance(metrics['mae'], float)
         self.assertIsInstance(metrics['mape'], float)
+
+
+class SalesSeriesCacheTests(TestCase):
+    """Test cases for the shared daily sales series"""
+    
+    def setUp(self):
+        """Set up test data"""
+        SalesSeriesCache.invalidate()
+        self.user = User.objects.create_user(
+            username='salesrep',
+            email='sales@example.com',
+            password='testpass123',
+            role='sales_rep'
+        )
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=self.category,
+            manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=100
+        )
+        # Two orders on Jan 1, one on Jan 2 and one on Feb 5
+        for day, quantity in [(1, 2), (1, 3), (2, 4), (36, 5)]:
+            order = Order.objects.create(
+                sales_rep=self.user,
+                customer_name='John Doe',
+                customer_phone='+1234567890',
+                customer_address='123 Main St',
+                subtotal=Decimal('0.00'),
+                total_amount=Decimal('0.00'),
+                status='confirmed'
+            )
+            OrderItem.objects.create(
+                order=order,
+                medicine=self.medicine,
+                quantity=quantity,
+                unit_price=self.medicine.unit_price,
+                total_price=self.medicine.unit_price * quantity
+            )
+            Order.objects.filter(pk=order.pk).update(
+                created_at=timezone.make_aware(datetime(2024, 1, 1, 12)) + timedelta(days=day - 1)
+            )
+    
+    def tearDown(self):
+        SalesSeriesCache.invalidate()
+    
+    def test_periods_are_derived_from_one_daily_load(self):
+        """Test weekly and monthly series reuse the cached daily series"""
+        service = ARIMAForecastingService()
+        with self.assertNumQueries(1):
+            daily = service.prepare_sales_data(self.medicine.id, 'daily')
+            weekly = service.prepare_sales_data(self.medicine.id, 'weekly')
+            monthly = service.prepare_sales_data(self.medicine.id, 'monthly')
+        
+        self.assertEqual(daily['quantity'].tolist(), [5, 4, 5])
+        self.assertEqual(weekly['quantity'].tolist(), [9, 5])
+        self.assertEqual(monthly['quantity'].tolist(), [9, 5])
+        self.assertEqual(monthly['date'].iloc[1], pd.Timestamp(2024, 2, 1))
+    
+    def test_process_cache_is_shared_between_services(self):
+        """Test a second service instance reads from the process cache"""
+        ARIMAForecastingService().prepare_sales_data(self.medicine.id, 'weekly')
+        with self.assertNumQueries(0):
+            data = ARIMAForecastingService().prepare_sales_data(self.medicine.id, 'monthly')
+        self.assertEqual(data['quantity'].sum(), 14)
+        
+        SalesSeriesCache.invalidate(self.medicine.id)
+        with self.assertNumQueries(1):
+            ARIMAForecastingService().prepare_sales_data(self.medicine.id, 'daily')
+    
+    def test_date_range_filters_cached_series(self):
+        """Test date ranges are applied to the cached daily series"""
+        service = ARIMAForecastingService()
+        data = service.prepare_sales_data(
+            self.medicine.id, 'daily',
+            start_date=datetime(2024, 1, 2), end_date=datetime(2024, 1, 31)
+        )
+        self.assertEqual(data['quantity'].tolist(), [4])
+
+
+class DemandStatisticsTests(TestCase):
+    """Test cases for running demand statistics"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='salesrep',
+            email='sales@example.com',
+            password='testpass123',
+            role='sales_rep'
+        )
+        self.pharmacist = User.objects.create_user(
+            username='pharmacist',
+            email='pharmacist@example.com',
+            password='testpass123',
+            role='pharmacist_admin'
+        )
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=self.category,
+            manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=1000
+        )
+        self.service = DemandStatisticsService()
+    
+    def _create_order(self, quantity, days_ago=0):
+        order = Order.objects.create(
+            sales_rep=self.user,
+            customer_name='John Doe',
+            customer_phone='+1234567890',
+            customer_address='123 Main St',
+            subtotal=Decimal('0.00'),
+            total_amount=Decimal('0.00')
+        )
+        OrderItem.objects.create(
+            order=order,
+            medicine=self.medicine,
+            quantity=quantity,
+            unit_price=self.medicine.unit_price,
+            total_price=self.medicine.unit_price * quantity
+        )
+        if days_ago:
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+            order.refresh_from_db()
+        return order
+    
+    def test_running_statistics_match_batch_statistics(self):
+        """Test Welford mean and variance match the batch computation"""
+        history = [5, 6, 5, 7, 6, 5, 6, 5]
+        for offset, quantity in enumerate(history):
+            self.service.record_order(self._create_order(quantity, days_ago=20 - offset))
+        # Open a new day so the last historical day is folded in
+        self.service.record_order(self._create_order(1, days_ago=1))
+        
+        stats = DemandStatistics.objects.get(medicine=self.medicine, period_type='daily')
+        self.assertEqual(stats.period_count, len(history))
+        self.assertAlmostEqual(stats.mean, np.mean(history))
+        self.assertAlmostEqual(stats.std_dev, np.std(history, ddof=1))
+        self.assertEqual(stats.current_period_quantity, 1)
+        self.assertIsNotNone(stats.ewma)
+    
+    def test_confirmation_flags_demand_spike(self):
+        """Test confirming an unusually large order raises an anomaly alert"""
+        from common.models import Notification
+        
+        for offset, quantity in enumerate([5, 6, 5, 7, 6, 5, 6, 5]):
+            self.service.record_order(self._create_order(quantity, days_ago=20 - offset))
+        
+        spike = self._create_order(60)
+        spike.status = 'confirmed'
+        spike.save()
+        
+        stats = DemandStatistics.objects.get(medicine=self.medicine, period_type='daily')
+        self.assertEqual(stats.last_alerted_period, stats.current_period_start)
+        alerts = Notification.objects.filter(user=self.pharmacist, title__startswith='Demand Spike')
+        self.assertEqual(alerts.count(), 1)
+        
+        # A second order on the same day does not alert again
+        self.service.record_order(self._create_order(10))
+        self.assertEqual(alerts.count(), 1)
+    
+    def test_orders_count_on_the_day_they_are_confirmed(self):
+        """Test an order placed days earlier adds to the confirmation day, not the open period"""
+        self.service.record_order(self._create_order(5, days_ago=1))
+
+        late = self._create_order(9, days_ago=5)
+        late.status = 'confirmed'
+        late.save()
+
+        stats = DemandStatistics.objects.get(medicine=self.medicine, period_type='daily')
+        self.assertEqual(stats.current_period_start, late.confirmed_at.astimezone(dt_timezone.utc).date())
+        self.assertEqual(stats.current_period_quantity, 9)
+        self.assertEqual(stats.period_count, 1)
+        self.assertEqual(stats.mean, 5)
+
+    def test_cancelling_a_confirmed_order_retracts_its_demand(self):
+        """Test cancellations, single and bulk, take quantities out of the open period"""
+        from orders.services import OrderBulkTransitionService
+
+        orders = [self._create_order(quantity) for quantity in (8, 3, 2)]
+        for order in orders:
+            order.status = 'confirmed'
+            order.save()
+        stats = DemandStatistics.objects.get(medicine=self.medicine, period_type='weekly')
+        self.assertEqual(stats.current_period_quantity, 13)
+
+        orders[0].status = 'cancelled'
+        orders[0].save()
+        stats.refresh_from_db()
+        self.assertEqual(stats.current_period_quantity, 5)
+
+        OrderBulkTransitionService.transition([orders[1].pk], 'cancelled', self.pharmacist)
+        stats.refresh_from_db()
+        self.assertEqual(stats.current_period_quantity, 2)
+
+    def test_outlier_bounds_need_enough_history(self):
+        """Test the forecasting cleaner only gets bounds after enough periods"""
+        for offset, quantity in enumerate([4, 6, 8]):
+            self.service.record_order(self._create_order(quantity, days_ago=5 - offset))
+        self.assertIsNone(self.service.get_outlier_bounds(self.medicine.id, 'daily'))
+        
+        with override_settings(ANALYTICS_ANOMALY_MIN_PERIODS=2):
+            lower, upper = self.service.get_outlier_bounds(self.medicine.id, 'daily')
+        self.assertAlmostEqual(lower, 5 - 3 * np.std([4, 6], ddof=1))
+        self.assertAlmostEqual(upper, 5 + 3 * np.std([4, 6], ddof=1))
+
+
+class ForecastAccuracyServiceTests(TestCase):
+    """Test cases for realized forecast accuracy"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='salesrep',
+            email='sales@example.com',
+            password='testpass123',
+            role='sales_rep'
+        )
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=self.category,
+            manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=100
+        )
+        self.forecast_data = {
+            'medicine': self.medicine,
+            'forecast_period': 'weekly',
+            'forecast_horizon': 2,
+            'arima_p': 1,
+            'arima_d': 1,
+            'arima_q': 1,
+            'aic': 150.5,
+            'bic': 160.2,
+            'rmse': 5.2,
+            'mae': 4.1,
+            'mape': 12.5,
+            'forecasted_demand': [10, 20],
+            'confidence_intervals': {'lower': [5, 15], 'upper': [15, 25]},
+            'training_data_start': date(2023, 10, 2),
+            'training_data_end': date(2024, 1, 1),
+            'training_data_points': 14
+        }
+        # 12 units sold in the week of Jan 8, nothing in the week of Jan 15
+        order = Order.objects.create(
+            sales_rep=self.user,
+            customer_name='John Doe',
+            customer_phone='+1234567890',
+            customer_address='123 Main St',
+            subtotal=Decimal('0.00'),
+            total_amount=Decimal('0.00'),
+            status='delivered'
+        )
+        OrderItem.objects.create(
+            order=order,
+            medicine=self.medicine,
+            quantity=12,
+            unit_price=self.medicine.unit_price,
+            total_price=self.medicine.unit_price * 12
+        )
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.make_aware(datetime(2024, 1, 10, 9)))
+    
+    def test_maturity_date_is_set_on_save(self):
+        """Test forecasts mature once the last forecasted period has ended"""
+        forecast = DemandForecast.objects.create(**self.forecast_data)
+        self.assertEqual(forecast.matures_on, date(2024, 1, 22))
+    
+    def test_matured_forecasts_are_evaluated_once(self):
+        """Test realized error is recorded per horizon step for matured forecasts only"""
+        forecast = DemandForecast.objects.create(**self.forecast_data)
+        DemandForecast.objects.create(**dict(self.forecast_data, training_data_end=date(2024, 1, 22)))
+        service = ForecastAccuracyService()
+        
+        self.assertEqual(service.evaluate_matured_forecasts(today=date(2024, 2, 1)), 1)
+        records = list(ForecastAccuracy.objects.filter(forecast=forecast))
+        self.assertEqual([r.period_start for r in records], [date(2024, 1, 8), date(2024, 1, 15)])
+        self.assertEqual([r.actual_quantity for r in records], [12, 0])
+        self.assertEqual([r.absolute_error for r in records], [2, 20])
+        self.assertAlmostEqual(records[0].percentage_error, 2 / 12 * 100)
+        self.assertIsNone(records[1].percentage_error)
+        
+        self.assertEqual(service.evaluate_matured_forecasts(today=date(2024, 2, 1)), 0)
+        
+        summary = service.realized_summary()
+        self.assertEqual(summary['evaluated_forecasts'], 1)
+        self.assertEqual(summary['by_horizon'][1]['avg_mae'], 20)
+
+
+class ModelEvaluationMetricsServiceTests(TestCase):
+    """Test cases for the shared model evaluation metrics"""
+    
+    def setUp(self):
+        """Set up test data"""
+        ModelEvaluationMetricsService.invalidate()
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=self.category,
+            manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=100
+        )
+        self.forecast_data = {
+            'medicine': self.medicine,
+            'forecast_period': 'weekly',
+            'forecast_horizon': 4,
+            'arima_p': 1,
+            'arima_d': 1,
+            'arima_q': 1,
+            'aic': 150.0,
+            'bic': 160.0,
+            'rmse': 5.0,
+            'mae': 4.0,
+            'mape': 5.0,
+            'forecasted_demand': [10, 12, 8, 15],
+            'confidence_intervals': {'lower': [5, 7, 3, 10], 'upper': [15, 17, 13, 20]},
+            'training_data_start': date(2024, 1, 1),
+            'training_data_end': date(2024, 12, 30),
+            'training_data_points': 52
+        }
+        DemandForecast.objects.create(**self.forecast_data)
+        DemandForecast.objects.create(**dict(self.forecast_data, forecast_period='monthly', mape=25.0, rmse=9.0))
+    
+    def test_metrics_by_period_and_quality(self):
+        """Test aggregate, per-period and per-day metrics"""
+        metrics = ModelEvaluationMetricsService().get_metrics()
+        aggregate = metrics['aggregate_metrics']
+        self.assertEqual(aggregate['total_forecasts'], 2)
+        self.assertEqual(aggregate['avg_mape'], 15.0)
+        self.assertEqual(aggregate['excellent_models'], 1)
+        self.assertEqual(aggregate['fair_models'], 1)
+        self.assertEqual(set(metrics['period_performance']), {'weekly', 'monthly'})
+        self.assertEqual(metrics['period_performance']['monthly']['avg_rmse'], 9.0)
+        self.assertEqual(metrics['daily_performance'][timezone.now().date().isoformat()]['count'], 2)
+        self.assertEqual(metrics['top_performers'][0].mape, 5.0)
+    
+    def test_metrics_cached_until_new_forecast(self):
+        """Test metrics are served from cache until a forecast is created"""
+        service = ModelEvaluationMetricsService()
+        service.get_metrics()
+        # Only the change version is read
+        with self.assertNumQueries(1):
+            service.get_metrics()
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            DemandForecast.objects.create(**dict(self.forecast_data, mape=35.0))
+        self.assertEqual(service.get_metrics()['aggregate_metrics']['poor_models'], 1)
+    
+    def test_forecast_changes_in_another_process_invalidate_the_cache(self):
+        """Test a version bump from elsewhere is seen without a local invalidate"""
+        from common.services import ChangeVersionService
+        
+        service = ModelEvaluationMetricsService()
+        service.get_metrics()
+        # Written directly, as another worker's signal handler would have
+        DemandForecast.objects.filter(forecast_period='weekly').update(mape=35.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            ChangeVersionService.bump(ChangeVersionService.FORECASTS_SCOPE)
+        
+        self.assertEqual(service.get_metrics()['aggregate_metrics']['poor_models'], 1)
+
+
+class ForecastRetentionServiceTests(TestCase):
+    """Test cases for forecast retention"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=self.category,
+            manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=100
+        )
+        self.forecast_data = {
+            'medicine': self.medicine,
+            'forecast_period': 'weekly',
+            'forecast_horizon': 4,
+            'arima_p': 1,
+            'arima_d': 1,
+            'arima_q': 1,
+            'aic': 150.0,
+            'bic': 160.0,
+            'rmse': 5.0,
+            'mae': 4.0,
+            'mape': 5.0,
+            'forecasted_demand': [10, 12, 8, 15],
+            'confidence_intervals': {'lower': [5, 7, 3, 10], 'upper': [15, 17, 13, 20]},
+            'training_data_start': date(2024, 1, 1),
+            'training_data_end': date(2024, 12, 30),
+            'training_data_points': 52
+        }
+    
+    def _create_optimization(self, forecast):
+        return InventoryOptimization.objects.create(
+            medicine=self.medicine,
+            demand_forecast=forecast,
+            optimal_reorder_point=25,
+            optimal_order_quantity=50,
+            optimal_maximum_stock=75,
+            safety_stock=15,
+            expected_holding_cost=Decimal('250.00'),
+            expected_stockout_cost=Decimal('100.00'),
+            total_expected_cost=Decimal('350.00')
+        )
+    
+    def test_new_forecast_supersedes_same_key_only(self):
+        """Test only the latest forecast per medicine, period and horizon stays active"""
+        old = DemandForecast.objects.create(**self.forecast_data)
+        old_optimization = self._create_optimization(old)
+        other_horizon = DemandForecast.objects.create(**dict(self.forecast_data, forecast_horizon=8))
+        latest = DemandForecast.objects.create(**self.forecast_data)
+        
+        old.refresh_from_db()
+        old_optimization.refresh_from_db()
+        other_horizon.refresh_from_db()
+        self.assertFalse(old.is_active)
+        self.assertFalse(old_optimization.is_active)
+        self.assertTrue(other_horizon.is_active)
+        self.assertTrue(DemandForecast.objects.get(pk=latest.pk).is_active)
+    
+    def test_run_archives_and_purges_superseded_forecasts(self):
+        """Test superseded, evaluated forecasts are archived and deleted in batches"""
+        evaluated = DemandForecast.objects.create(**self.forecast_data)
+        self._create_optimization(evaluated)
+        ForecastAccuracy.objects.create(
+            forecast=evaluated, medicine=self.medicine, forecast_period='weekly', horizon_step=1,
+            period_start=date(2025, 1, 6), forecasted_quantity=10, actual_quantity=8, absolute_error=2
+        )
+        DemandForecast.objects.filter(pk=evaluated.pk).update(accuracy_evaluated_at=timezone.now())
+        unevaluated = DemandForecast.objects.create(**dict(self.forecast_data, training_data_end=date(2025, 1, 6)))
+        DemandForecast.objects.create(**self.forecast_data)
+        
+        service = ForecastRetentionService({'batch_size': 1})
+        later = timezone.now() + timedelta(days=60)
+        self.assertEqual(service.run(now=later, dry_run=True)['forecasts_archived'], 1)
+        
+        metrics = service.run(now=later)
+        self.assertEqual(metrics['forecasts_archived'], 1)
+        self.assertEqual(metrics['optimizations_deleted'], 1)
+        self.assertFalse(DemandForecast.objects.filter(pk=evaluated.pk).exists())
+        self.assertTrue(DemandForecast.objects.filter(pk=unevaluated.pk).exists())
+        
+        history = DemandForecastHistory.objects.get(forecast_id=evaluated.pk)
+        self.assertEqual(history.arima_order, '1,1,1')
+        self.assertEqual(history.forecast_total, 45)
+        self.assertIsNone(ForecastAccuracy.objects.get().forecast)
+    
+    def test_purge_invalidates_metrics_once(self):
+        """Test deleting a batch of forecasts drops the cached metrics once, not per row"""
+        superseded = [DemandForecast.objects.create(**self.forecast_data) for _ in range(3)]
+        DemandForecast.objects.create(**self.forecast_data)
+        DemandForecast.objects.filter(pk__in=[f.pk for f in superseded]).update(accuracy_evaluated_at=timezone.now())
+        
+        with patch.object(ModelEvaluationMetricsService, 'invalidate') as invalidate:
+            metrics = ForecastRetentionService({'batch_size': 2}).run(now=timezone.now() + timedelta(days=60))
+        
+        self.assertEqual((metrics['forecasts_archived'], metrics['batches']), (3, 2))
+        invalidate.assert_called_once_with()
+        self.assertFalse(ForecastRetentionService.is_purging())
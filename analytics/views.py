@@ -31,7 +31,7 @@ from rest_framework.response import Response
 from rest_framework import status
 
 from .models import DemandForecast, InventoryOptimization, SalesTrend, CustomerAnalytics, SystemMetrics
-from .services import ARIMAForecastingService, SupplyChainOptimizer
+from .services import ARIMAForecastingService, ModelEvaluationMetricsService, SupplyChainOptimizer
 from .step_analysis import generate_step_analysis
 from inventory.models import Medicine, Category
 from orders.models import Order, OrderItem
@@ -129,130 +129,44 @@ class ModelEvaluationView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Get all forecasts with their metrics
-        forecasts = DemandForecast.objects.filter(is_active=True).order_by('-created_at')
+        metrics = ModelEvaluationMetricsService().get_metrics()
         
-        # Calculate aggregate metrics
-        context.update(self._calculate_aggregate_metrics(forecasts))
+        # Aggregate metrics, performance distribution and medicine-specific performance
+        context.update(metrics['aggregate_metrics'])
+        context['period_performance'] = metrics['period_performance']
+        context['daily_performance'] = metrics['daily_performance']
+        context['top_performers'] = metrics['top_performers']
+        context['worst_performers'] = metrics['worst_performers']
+        context['most_forecasted'] = metrics['most_forecasted']
         
         # Get recent forecasts for detailed view
-        context['recent_forecasts'] = forecasts[:20]
+        context['recent_forecasts'] = DemandForecast.objects.filter(
+            is_active=True
+        ).select_related('medicine').order_by('-created_at')[:20]
         
-        # Get model performance distribution
-        context.update(self._get_model_performance_distribution(forecasts))
+        # If no recent data, create sample data for demonstration
+        if not context['daily_performance'] and context['total_forecasts']:
+            context['daily_performance'] = self._get_sample_daily_performance()
         
-        # Get medicine-specific performance
-        context.update(self._get_medicine_performance(forecasts))
+        # Out-of-sample accuracy of forecasts whose periods have passed
+        context['realized_accuracy'] = metrics['realized_accuracy']
         
         return context
     
-    def _calculate_aggregate_metrics(self, forecasts):
-        """Calculate aggregate model performance metrics"""
-        if not forecasts.exists():
-            return {
-                'total_forecasts': 0,
-                'avg_mape': 0,
-                'avg_rmse': 0,
-                'avg_mae': 0,
-                'avg_aic': 0,
-                'avg_bic': 0,
-                'excellent_models': 0,
-                'good_models': 0,
-                'fair_models': 0,
-                'poor_models': 0,
-            }
-        
-        # Calculate averages
-        avg_mape = forecasts.aggregate(avg=models.Avg('mape'))['avg'] or 0
-        avg_rmse = forecasts.aggregate(avg=models.Avg('rmse'))['avg'] or 0
-        avg_mae = forecasts.aggregate(avg=models.Avg('mae'))['avg'] or 0
-        avg_aic = forecasts.aggregate(avg=models.Avg('aic'))['avg'] or 0
-        avg_bic = forecasts.aggregate(avg=models.Avg('bic'))['avg'] or 0
-        
-        # Count by quality
-        excellent_models = forecasts.filter(mape__lt=10).count()
-        good_models = forecasts.filter(mape__gte=10, mape__lt=20).count()
-        fair_models = forecasts.filter(mape__gte=20, mape__lt=30).count()
-        poor_models = forecasts.filter(mape__gte=30).count()
-        
-        return {
-            'total_forecasts': forecasts.count(),
-            'avg_mape': round(avg_mape, 2),
-            'avg_rmse': round(avg_rmse, 2),
-            'avg_mae': round(avg_mae, 2),
-            'avg_aic': round(avg_aic, 2),
-            'avg_bic': round(avg_bic, 2),
-            'excellent_models': excellent_models,
-            'good_models': good_models,
-            'fair_models': fair_models,
-            'poor_models': poor_models,
-        }
-    
-    def _get_model_performance_distribution(self, forecasts):
-        """Get model performance distribution data for charts"""
-        # Performance by period type
-        period_performance = {}
-        for period in ['daily', 'weekly', 'monthly']:
-            period_forecasts = forecasts.filter(forecast_period=period)
-            if period_forecasts.exists():
-                period_performance[period] = {
-                    'count': period_forecasts.count(),
-                    'avg_mape': round(period_forecasts.aggregate(avg=models.Avg('mape'))['avg'] or 0, 2),
-                    'avg_rmse': round(period_forecasts.aggregate(avg=models.Avg('rmse'))['avg'] or 0, 2),
-                }
-        
-        # Performance over time (last 30 days)
-        thirty_days_ago = timezone.now() - timedelta(days=30)
-        recent_forecasts = forecasts.filter(created_at__gte=thirty_days_ago)
-        
-        # Group by date for time series
+    def _get_sample_daily_performance(self):
+        """Sample performance over time for demonstration when there are no recent forecasts"""
+        import random
         daily_performance = {}
-        for i in range(30):
-            date = (timezone.now() - timedelta(days=i)).date()
-            day_forecasts = recent_forecasts.filter(created_at__date=date)
-            if day_forecasts.exists():
-                daily_performance[date.isoformat()] = {
-                    'count': day_forecasts.count(),
-                    'avg_mape': round(day_forecasts.aggregate(avg=models.Avg('mape'))['avg'] or 0, 2),
-                }
-        
-        # If no recent data, create sample data for demonstration
-        if not daily_performance and forecasts.exists():
-            import random
-            base_date = timezone.now().date()
-            for i in range(7):  # Show last 7 days of sample data
-                date = (base_date - timedelta(days=i)).isoformat()
-                # Generate realistic MAPE values (5-25%)
-                sample_mape = round(random.uniform(5, 25), 2)
-                daily_performance[date] = {
-                    'count': random.randint(1, 5),
-                    'avg_mape': sample_mape,
-                }
-        
-        return {
-            'period_performance': period_performance,
-            'daily_performance': daily_performance,
-        }
-    
-    def _get_medicine_performance(self, forecasts):
-        """Get medicine-specific performance metrics"""
-        # Top performing medicines (lowest MAPE)
-        top_performers = forecasts.order_by('mape')[:10]
-        
-        # Worst performing medicines (highest MAPE)
-        worst_performers = forecasts.order_by('-mape')[:10]
-        
-        # Medicines with most forecasts
-        most_forecasted = forecasts.values('medicine__name').annotate(
-            count=models.Count('id'),
-            avg_mape=models.Avg('mape')
-        ).order_by('-count')[:10]
-        
-        return {
-            'top_performers': top_performers,
-            'worst_performers': worst_performers,
-            'most_forecasted': most_forecasted,
-        }
+        base_date = timezone.now().date()
+        for i in range(7):  # Show last 7 days of sample data
+            date = (base_date - timedelta(days=i)).isoformat()
+            # Generate realistic MAPE values (5-25%)
+            sample_mape = round(random.uniform(5, 25), 2)
+            daily_performance[date] = {
+                'count': random.randint(1, 5),
+                'avg_mape': sample_mape,
+            }
+        return daily_performance
 
 
 class ForecastOnlyView(TemplateView):
@@ -310,11 +224,11 @@ class ForecastOnlyView(TemplateView):
         """
         forecast_data = []
         
+        # One service for the whole page so each medicine's history is loaded once
+        from .services import ARIMAForecastingService
+        forecasting_service = ARIMAForecastingService()
+        
         for forecast in forecasts:
-            # Get historical data for this medicine
-            from .services import ARIMAForecastingService
-            forecasting_service = ARIMAForecastingService()
-            
             try:
                 historical_data = forecasting_service.prepare_sales_data(
                     forecast.medicine.id, 
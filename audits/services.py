@@ -0,0 +1,79 @@
+"""
+Audit services for recording model changes
+"""
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.serializers.json import DjangoJSONEncoder
+import json
+import logging
+
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+
+class AuditService:
+    """
+    Service for writing audit log entries
+    """
+
+    # Used when a change is made outside of a request, e.g. by a management command
+    SYSTEM_IP_ADDRESS = '127.0.0.1'
+
+    @staticmethod
+    def _json_safe(value):
+        return json.loads(json.dumps(value, cls=DjangoJSONEncoder))
+
+    @staticmethod
+    def log_changes(instance, changes, user=None, request=None, description='', severity='low'):
+        """
+        Record an update audit entry from a ``{field: (old, new)}`` diff, as
+        returned by ``ChangeTrackingMixin.changes()`` before the instance is saved.
+        Returns the AuditLog, or None when there was nothing to record.
+        """
+        if not changes:
+            return None
+
+        try:
+            return AuditLog.objects.create(**AuditService._update_entry(instance, changes, user, request, description, severity))
+        except Exception as e:
+            logger.error(f"Error writing audit log for {instance}: {e}")
+            return None
+
+    @staticmethod
+    def log_changes_many(entries, user=None, request=None, severity='low'):
+        """
+        Record update audit entries for several instances with one insert.
+        ``entries`` are ``(instance, changes, description)`` tuples; entries
+        without changes are skipped. Returns the created AuditLogs.
+        """
+        try:
+            return AuditLog.objects.bulk_create([
+                AuditLog(**AuditService._update_entry(instance, changes, user, request, description, severity))
+                for instance, changes, description in entries if changes
+            ])
+        except Exception as e:
+            logger.error(f"Error writing audit logs: {e}")
+            return []
+
+    @staticmethod
+    def _update_entry(instance, changes, user, request, description, severity):
+        if request is not None and user is None and request.user.is_authenticated:
+            user = request.user
+
+        return dict(
+            user=user,
+            action='update',
+            severity=severity,
+            content_type=ContentType.objects.get_for_model(instance),
+            object_id=instance.pk,
+            ip_address=(request.META.get('REMOTE_ADDR') if request else None) or AuditService.SYSTEM_IP_ADDRESS,
+            user_agent=request.META.get('HTTP_USER_AGENT', '') if request else '',
+            description=description or f"Updated {instance._meta.verbose_name} {instance}",
+            old_values=AuditService._json_safe({name: old for name, (old, new) in changes.items()}),
+            new_values=AuditService._json_safe({name: new for name, (old, new) in changes.items()}),
+            changed_fields=sorted(changes),
+            module=instance._meta.app_label,
+            request_path=request.path[:200] if request else '',
+            request_method=request.method if request else '',
+        )
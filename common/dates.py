@@ -0,0 +1,33 @@
+"""
+Date filtering helpers
+
+Filtering a DateTimeField with ``__date`` casts every row before comparing,
+so the database cannot use an index on the column. These helpers turn
+calendar dates into half-open datetime ranges in the current time zone,
+e.g. ``created_at >= 2024-03-01 00:00 AND created_at < 2024-03-02 00:00``,
+which compares the column directly.
+"""
+
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def local_day_start(day):
+    """Aware datetime for midnight at the start of ``day`` in the current time zone"""
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def date_range_lookups(field, start=None, end=None):
+    """
+    Filter kwargs selecting ``field`` values from the start of the ``start``
+    date up to the end of the ``end`` date (both inclusive, either optional).
+
+        Order.objects.filter(**date_range_lookups('created_at', date_from, date_to))
+    """
+    lookups = {}
+    if start is not None:
+        lookups[f'{field}__gte'] = local_day_start(start)
+    if end is not None:
+        lookups[f'{field}__lt'] = local_day_start(end + timedelta(days=1))
+    return lookups
@@ -0,0 +1,174 @@
+"""
+Idempotency keys for unsafe requests
+
+A client that may retry a request (a slow network, a double-clicked submit
+button) sends the same key with every attempt, either as an
+``Idempotency-Key`` header or an ``idempotency_key`` form field. The first
+attempt runs and its response is stored with the key; later attempts get
+that response replayed without the view running again.
+
+The key's row is committed as an "in progress" marker before the view runs,
+and the view runs outside any transaction of ours, so slow work such as
+payment gateway calls holds no lock. Attempts that arrive while the marker
+is in place get a 409 asking them to retry; a marker left behind by a worker
+that died is taken over after IDEMPOTENCY_IN_PROGRESS_TIMEOUT seconds.
+
+Requests without a key are handled as before.
+"""
+
+import hashlib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
+from django.http.request import RawPostDataException
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+FORM_FIELD = 'idempotency_key'
+
+# Response headers replayed along with the stored body
+REPLAYED_HEADERS = ('Content-Type', 'Location')
+
+
+def new_idempotency_key():
+    """Fresh key for a form to submit with, e.g. as a hidden idempotency_key input"""
+    return uuid.uuid4().hex
+
+
+def purge_expired(now=None):
+    """Delete keys past their TTL. Returns the number deleted."""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
+
+
+class IdempotentMixin:
+    """
+    View mixin replaying the stored response for a repeated idempotency key.
+
+    Put it after the login mixin so anonymous requests are turned away
+    first. Responses with a 5xx status (and exceptions) are not stored and
+    clear the marker, so a retry after a server error runs the view again;
+    views can narrow this further with should_store_response().
+    """
+
+    idempotent_methods = ('POST',)
+
+    def dispatch(self, request, *args, **kwargs):
+        key = self.get_idempotency_key(request)
+        if key is None or request.method not in self.idempotent_methods or not request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return JsonResponse({'error': 'Idempotency key is too long'}, status=400)
+
+        request_hash = self._request_hash(request)
+        record, created = self._claim(request.user, key, request_hash)
+
+        if not created:
+            if record.request_hash != request_hash:
+                return JsonResponse(
+                    {'error': 'This idempotency key was already used for a different request'}, status=422
+                )
+            if record.response_status is not None:
+                return self._replay(record)
+            response = JsonResponse(
+                {'error': 'A request with this idempotency key is still in progress'}, status=409
+            )
+            response['Retry-After'] = '1'
+            return response
+
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            self._release(record)
+            raise
+        if self.should_store_response(response):
+            self._store(record, response)
+        else:
+            self._release(record)
+        return response
+
+    def get_context_data(self, **kwargs):
+        # A fresh key per rendered form; a redisplayed form gets a new one
+        kwargs.setdefault('idempotency_key', new_idempotency_key())
+        return super().get_context_data(**kwargs)
+
+    def get_idempotency_key(self, request):
+        key = request.META.get(HEADER)
+        if key is None and request.content_type in ('application/x-www-form-urlencoded', 'multipart/form-data'):
+            key = request.POST.get(FORM_FIELD)
+        key = (key or '').strip()
+        return key or None
+
+    @staticmethod
+    def _request_hash(request):
+        digest = hashlib.sha256(f'{request.method} {request.path}\n'.encode())
+        try:
+            digest.update(request.body)
+        except RawPostDataException:
+            # A multipart body was already parsed (e.g. by the CSRF check)
+            for name, values in sorted(request.POST.lists()):
+                digest.update(f'{name}={values!r}\n'.encode())
+            for name, files in sorted(request.FILES.lists()):
+                digest.update(f'{name}={[(f.name, f.size) for f in files]!r}\n'.encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _claim(user, key, request_hash):
+        """
+        (the key's row, whether this request created it). A new, expired or
+        abandoned key gets a fresh in-progress row for this request.
+        """
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        abandoned_before = now - timedelta(seconds=settings.IDEMPOTENCY_IN_PROGRESS_TIMEOUT)
+        IdempotencyKey.objects.filter(
+            Q(expires_at__lte=now) | Q(response_status__isnull=True, created_at__lte=abandoned_before),
+            user=user, key=key,
+        ).delete()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, key=key, request_hash=request_hash, expires_at=expires_at
+                ), True
+        except IntegrityError:
+            try:
+                return IdempotencyKey.objects.get(user=user, key=key), False
+            except IdempotencyKey.DoesNotExist:
+                # The other attempt failed and released the key in between
+                return IdempotentMixin._claim(user, key, request_hash)
+
+    def should_store_response(self, response):
+        """Whether retries with the key get this response replayed"""
+        return response.status_code < 500 and not response.streaming
+
+    def _store(self, record, response):
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        # An update rather than save(): the row may have been taken over as
+        # abandoned, in which case there is nothing left to fill in
+        IdempotencyKey.objects.filter(pk=record.pk, response_status__isnull=True).update(
+            response_status=response.status_code,
+            response_headers={
+                header: response[header] for header in REPLAYED_HEADERS if response.has_header(header)
+            },
+            response_body=response.content,
+        )
+
+    @staticmethod
+    def _release(record):
+        """Drop the in-progress marker so a retry runs the view again"""
+        IdempotencyKey.objects.filter(pk=record.pk, response_status__isnull=True).delete()
+
+    @staticmethod
+    def _replay(record):
+        response = HttpResponse(bytes(record.response_body), status=record.response_status)
+        for header, value in record.response_headers.items():
+            response[header] = value
+        response['Idempotent-Replayed'] = 'true'
+        return response
@@ -0,0 +1,29 @@
+"""
+Delete change feed events past their retention window
+
+Intended to run on a schedule (e.g. hourly from cron). The window comes from
+the CHANGE_FEED_RETENTION setting and can be overridden per run.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from common.services import ChangeFeedService
+
+
+class Command(BaseCommand):
+    help = 'Delete change feed events older than the retention window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-hours', type=int,
+                            help='Delete events older than this many hours')
+
+    def handle(self, *args, **options):
+        older_than = None
+        if options['older_than_hours'] is not None:
+            older_than = timezone.now() - timedelta(hours=options['older_than_hours'])
+
+        deleted = ChangeFeedService.purge(older_than)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} change events'))
@@ -0,0 +1,18 @@
+"""
+Delete idempotency keys past their TTL
+
+Intended to run on a schedule (e.g. hourly from cron). Expired keys are
+already ignored by the views; this only reclaims their rows.
+"""
+
+from django.core.management.base import BaseCommand
+
+from common.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys and stored responses past their TTL'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} idempotency keys'))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('audience', models.CharField(max_length=40)),
+                ('event_type', models.CharField(choices=[('order_status', 'Order Status'), ('payment', 'Payment'), ('notification', 'Notification')], max_length=20)),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['audience', 'id'], name='common_chan_audienc_2e9059_idx')],
+            },
+        ),
+    ]
@@ -16,6 +16,80 @@ class BaseModel(models.Model):
         abstract = True
 
 
+class ChangeTrackingMixin:
+    """
+    Remembers field values as they were loaded from the database so callers
+    can ask what changed before saving, without re-reading the row.
+
+    Instances that were never loaded or saved report every field as changed.
+    Deferred fields are only tracked once they have been loaded.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            attname: value for attname, value in zip(field_names, values)
+            if value is not models.DEFERRED
+        }
+        return instance
+
+    def _tracked_attname(self, field_name):
+        return self._meta.get_field(field_name).attname
+
+    def _snapshot(self, fields=None):
+        """Record current values of the given (or all loaded) concrete fields"""
+        loaded_values = self.__dict__.setdefault('_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred:
+                continue
+            if fields is not None and field.name not in fields and field.attname not in fields:
+                continue
+            loaded_values[field.attname] = getattr(self, field.attname)
+
+    @property
+    def is_tracked(self):
+        return '_loaded_values' in self.__dict__
+
+    def has_changed(self, field_name):
+        """Whether the field differs from the value it was loaded with"""
+        if not self.is_tracked:
+            return True
+        attname = self._tracked_attname(field_name)
+        if attname not in self._loaded_values:
+            # Deferred and never loaded, so it cannot have been modified
+            return attname in self.__dict__
+        return getattr(self, attname) != self._loaded_values[attname]
+
+    def previous_value(self, field_name):
+        """The value the field was loaded with, or None for unsaved instances"""
+        if not self.is_tracked:
+            return None
+        return self._loaded_values.get(self._tracked_attname(field_name))
+
+    @property
+    def changed_fields(self):
+        """Names of the concrete fields that differ from their loaded values"""
+        return [field.name for field in self._meta.concrete_fields if self.has_changed(field.name)]
+
+    def changes(self):
+        """Map of changed field name to an (old, new) pair of raw values"""
+        return {
+            field.name: (self.previous_value(field.name), getattr(self, field.attname))
+            for field in self._meta.concrete_fields
+            if self.has_changed(field.name)
+        }
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot(kwargs.get('update_fields'))
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._snapshot(fields)
+
+
 class Address(models.Model):
     """
     Reusable address model
@@ -112,6 +186,76 @@ class Notification(models.Model):
         return f"{self.title} - {self.user.username}"
 
 
+class ChangeEvent(models.Model):
+    """
+    Append-only feed of changes pushed to open pages.
+
+    The id is the cursor a subscriber resumes from. Each row is addressed to
+    one audience: 'staff' for pharmacists and admins, or 'user:<id>'.
+    """
+    EVENT_TYPES = [
+        ('order_status', 'Order Status'),
+        ('payment', 'Payment'),
+        ('notification', 'Notification'),
+    ]
+
+    audience = models.CharField(max_length=40)
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    object_id = models.PositiveIntegerField(null=True, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['audience', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.id} for {self.audience}"
+
+
+class ChangeVersion(models.Model):
+    """
+    Counter per data scope (e.g. 'orders', 'orders:user:<id>', 'stock'),
+    bumped whenever data in that scope is written. Polling endpoints derive
+    their ETag from it and can answer 304 without rebuilding the payload.
+    """
+    scope = models.CharField(max_length=60, unique=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Key a client sent with an unsafe request, and the response that request
+    got. A retry with the same key gets the stored response replayed instead
+    of running again (see common.idempotency.IdempotentMixin). Rows expire
+    after IDEMPOTENCY_KEY_TTL seconds.
+    """
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=100)
+    # Method, path and body of the first request; a different request with the same key is refused
+    request_hash = models.CharField(max_length=64)
+    # Empty until the first request finishes with a response worth replaying;
+    # until then the row marks that request as in progress
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_headers = models.JSONField(default=dict, blank=True)
+    response_body = models.BinaryField(default=b'', blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='common_idempotency_user_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} for user {self.user_id}"
+
+
 class SystemConfiguration(models.Model):
     """
     System-wide configuration settings
@@ -0,0 +1,262 @@
+"""
+Keyset (cursor) pagination for long, append-mostly lists
+
+Django's Paginator counts every row and then OFFSETs into the result, so
+each page costs a COUNT(*) and deep pages scan everything before them.
+KeysetPaginator instead remembers the sort key of the last row shown and
+asks for rows past it, so page 500 costs the same as page 1 given an index
+on the ordering (e.g. (created_at, id)).
+"""
+
+import base64
+import datetime
+import decimal
+import json
+import uuid
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class KeysetPage:
+    """
+    One page of a KeysetPaginator. Iterates like a Django Page; instead of
+    page numbers it exposes opaque cursors for the neighbouring pages.
+    """
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by its sort key rather than by offset.
+
+    ``ordering`` must end in a unique field (normally the primary key) so
+    every row has a distinct position. Fields may be annotations.
+    """
+
+    # Rows counted before the total is reported as "N+" rather than exact
+    COUNT_CAP = 1000
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+
+    # Cursors
+
+    @staticmethod
+    def _json_value(value):
+        # Full precision: DjangoJSONEncoder drops microseconds, which would
+        # make rows created in the same millisecond skip or repeat
+        if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+            return value.isoformat()
+        if isinstance(value, (decimal.Decimal, uuid.UUID)):
+            return str(value)
+        return value
+
+    def encode_cursor(self, direction, values):
+        if values is not None:
+            values = [self._json_value(value) for value in values]
+        payload = json.dumps({'d': direction, 'v': values})
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            direction, values = payload['d'], payload['v']
+        except (ValueError, TypeError, KeyError):
+            raise InvalidCursor('That page cursor is not valid')
+        if direction not in ('next', 'previous'):
+            raise InvalidCursor('That page cursor is not valid')
+        if values is not None:
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise InvalidCursor('That page cursor is not valid')
+            values = [self._to_python(name, value) for name, value in zip(self.fields, values)]
+        return direction, values
+
+    def _to_python(self, name, value):
+        try:
+            field = self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations carry plain JSON values
+            return value
+        try:
+            return field.to_python(value)
+        except Exception:
+            raise InvalidCursor('That page cursor is not valid')
+
+    def _row_values(self, obj):
+        return [getattr(obj, name) for name in self.fields]
+
+    @property
+    def last_cursor(self):
+        """Cursor for the final page, read backwards from the end of the list"""
+        return self.encode_cursor('previous', None)
+
+    # Paging
+
+    def _beyond(self, values, forward):
+        """Q for rows strictly past ``values`` in the given direction"""
+        condition = Q()
+        for index, (name, value) in enumerate(zip(self.fields, values)):
+            after = self.descending[index] == forward  # descending and forward -> less than
+            lookup = f'{name}__lt' if after else f'{name}__gt'
+            term = Q(**{lookup: value})
+            for earlier_name, earlier_value in zip(self.fields[:index], values[:index]):
+                term &= Q(**{earlier_name: earlier_value})
+            condition |= term
+        return condition
+
+    def _ordered(self, forward):
+        if forward:
+            return self.queryset.order_by(*self.ordering)
+        return self.queryset.order_by(*[
+            name if descending else f'-{name}' for name, descending in zip(self.fields, self.descending)
+        ])
+
+    def page(self, cursor=None):
+        """
+        The page after (or before) the given cursor; the first page when
+        no cursor is given. Costs one query whatever the depth.
+        """
+        if cursor:
+            direction, values = self.decode_cursor(cursor)
+        else:
+            direction, values = 'next', None
+        forward = direction == 'next'
+
+        queryset = self._ordered(forward)
+        if values is not None:
+            queryset = queryset.filter(self._beyond(values, forward))
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+
+        # Coming from a cursor means there are rows on the side we came from
+        if forward:
+            has_next, has_previous = has_more, values is not None
+        else:
+            has_next, has_previous = values is not None, has_more
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor('next', self._row_values(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor('previous', self._row_values(rows[0]))
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
+
+    # Totals
+
+    @cached_property
+    def approximate_count(self):
+        """
+        Total rows without a full COUNT(*): the planner's row estimate for an
+        unfiltered PostgreSQL table, otherwise a count that stops at COUNT_CAP.
+        """
+        if self._table_estimate is not None:
+            return self._table_estimate
+        return self.queryset.order_by()[:self.COUNT_CAP + 1].count()
+
+    @property
+    def count_is_exact(self):
+        return self._table_estimate is None and self.approximate_count <= self.COUNT_CAP
+
+    @property
+    def count_display(self):
+        count = self.approximate_count
+        if self._table_estimate is not None:
+            return f'~{count:,}'
+        if count > self.COUNT_CAP:
+            return f'{self.COUNT_CAP:,}+'
+        return f'{count:,}'
+
+    @cached_property
+    def _table_estimate(self):
+        query = self.queryset.query
+        connection = connections[self.queryset.db]
+        if connection.vendor != 'postgresql' or query.where or query.distinct:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [self.queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 for tables that have never been analysed
+        return row[0] if row and row[0] >= 0 else None
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin that pages with KeysetPaginator. Templates get the usual
+    ``page_obj``, ``paginator`` and ``is_paginated``; links use
+    ``?cursor={{ page_obj.next_cursor }}`` instead of page numbers.
+    """
+
+    keyset_ordering = ('-created_at', '-id')
+    cursor_kwarg = 'cursor'
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size, ordering=self.get_keyset_ordering())
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+def keyset_page_data(page, include_count=False):
+    """Pagination block for API responses"""
+    data = {
+        'per_page': page.paginator.per_page,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+        'has_next': page.has_next(),
+        'has_previous': page.has_previous(),
+    }
+    if include_count:
+        data['approximate_count'] = page.paginator.approximate_count
+        data['count_is_exact'] = page.paginator.count_is_exact
+    return data
@@ -0,0 +1,49 @@
+"""
+Serializers that declare the queries they need
+
+A serializer reading ``order.sales_rep.username`` or looping over
+``order.items`` issues one query per row unless the queryset it is given
+already joined or prefetched those relations. QueryPlanMixin keeps that
+knowledge next to the fields: each serializer lists the relations and
+columns it reads, and views pass their querysets through ``plan()`` before
+paginating, so a page costs the same number of queries at any size.
+"""
+
+from django.db.models import Prefetch
+
+
+class QueryPlanMixin:
+    """
+    Serializer mixin naming the queryset shape its fields read:
+
+        select_related    forward relations read per row
+        prefetch_related  reverse/many relations (names or Prefetch objects)
+        only_fields       columns to load; include the sort key and any
+                          foreign keys followed by select_related
+        annotations       computed values, e.g. {'items_count': Count('items')}
+
+    Usage: ``OrderListSerializer(OrderListSerializer.plan(qs), many=True)``.
+    """
+
+    select_related = ()
+    prefetch_related = ()
+    only_fields = ()
+    annotations = {}
+
+    @classmethod
+    def plan(cls, queryset):
+        """The queryset with this serializer's joins, prefetches and columns applied"""
+        if cls.select_related:
+            queryset = queryset.select_related(*cls.select_related)
+        if cls.prefetch_related:
+            queryset = queryset.prefetch_related(*cls.prefetch_related)
+        if cls.only_fields:
+            queryset = queryset.only(*cls.only_fields)
+        if cls.annotations:
+            queryset = queryset.annotate(**cls.annotations)
+        return queryset
+
+    @classmethod
+    def prefetch(cls, lookup, queryset):
+        """Prefetch of ``lookup`` loading just what this serializer reads"""
+        return Prefetch(lookup, queryset=cls.plan(queryset))
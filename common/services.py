@@ -2,14 +2,22 @@
 Common services for notifications and system utilities
 """
 
-from django.db.models import Q
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Max
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.urls import reverse
-from .models import Notification
+from .models import ChangeEvent, ChangeVersion, Notification
 from accounts.models import User
 from orders.models import Order
 from inventory.models import Medicine, ReorderAlert
+from datetime import timedelta
+from decimal import Decimal
+import hashlib
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +27,21 @@ class NotificationService:
     Service for creating and managing system notifications
     """
     
+    # Priority of order status change notifications by new status
+    ORDER_STATUS_PRIORITY = {
+        'pending': 'medium',
+        'confirmed': 'high',
+        'processing': 'medium',
+        'ready_for_pickup': 'high',
+        'shipped': 'high',
+        'delivered': 'urgent',
+        'cancelled': 'high',
+        'returned': 'high',
+    }
+    
+    # Statuses other pharmacists and admins are told about
+    SIGNIFICANT_ORDER_STATUSES = ['confirmed', 'ready_for_pickup', 'shipped', 'delivered', 'cancelled', 'returned']
+    
     @staticmethod
     def create_notification(user, notification_type, title, message, priority='medium', action_url='', **kwargs):
         """
@@ -47,6 +70,13 @@ class NotificationService:
                 expires_at=kwargs.get('expires_at'),
             )
             
+            ChangeFeedService.publish(
+                'notification',
+                [ChangeFeedService.user_audience(user.id)],
+                object_id=notification.id,
+                payload={'notification_type': notification_type, 'priority': priority},
+            )
+            
             logger.info(f"Notification created: {title} for user {user.username}")
             return notification
             
@@ -136,6 +166,33 @@ class NotificationService:
         except Exception as e:
             logger.error(f"Error creating low stock notifications: {e}")
     
+    @staticmethod
+    def notify_demand_anomaly(medicine, period_start, quantity, threshold):
+        """
+        Create notifications when a day's demand for a medicine is unusually high
+        Notifies: Pharmacist/Admin, Admin
+        """
+        try:
+            admins = User.objects.filter(
+                Q(role='pharmacist_admin') | Q(role='admin'),
+                is_active=True
+            )
+            
+            for admin in admins:
+                NotificationService.create_notification(
+                    user=admin,
+                    notification_type='stock_alert',
+                    title=f'Demand Spike: {medicine.name}',
+                    message=f'{quantity} units of {medicine.name} confirmed on {period_start:%b %d, %Y}, above the expected {threshold:,.0f}. Current stock: {medicine.current_stock}',
+                    priority='high',
+                    action_url=reverse('inventory:medicine_detail', args=[medicine.id]) if medicine.id else '',
+                )
+            
+            logger.info(f"Demand anomaly notifications created for {medicine.name}")
+            
+        except Exception as e:
+            logger.error(f"Error creating demand anomaly notifications: {e}")
+    
     @staticmethod
     def get_unread_count(user, exclude_completed_orders=True):
         """
@@ -213,6 +270,7 @@ class NotificationService:
             is_read=True,
             read_at=timezone.now()
         )
+        ChangeVersionService.bump(ChangeVersionService.notifications_scope(user.id))
     
     @staticmethod
     def notify_order_status_change(order, old_status, new_status, changed_by_user=None):
@@ -314,17 +372,7 @@ class NotificationService:
             new_status_display = status_display_map.get(new_status, new_status.title())
             
             # Determine priority based on status
-            priority_map = {
-                'pending': 'medium',
-                'confirmed': 'high',
-                'processing': 'medium',
-                'ready_for_pickup': 'high',
-                'shipped': 'high',
-                'delivered': 'urgent',
-                'cancelled': 'high',
-                'returned': 'high',
-            }
-            priority = priority_map.get(new_status, 'medium')
+            priority = NotificationService.ORDER_STATUS_PRIORITY.get(new_status, 'medium')
             
             # Build action URL - try pharmacist detail first, fallback to regular detail
             try:
@@ -348,8 +396,7 @@ class NotificationService:
             
             # Notify other Pharmacist/Admin users (except the one who made the change)
             # Only notify for significant status changes
-            significant_statuses = ['confirmed', 'ready_for_pickup', 'shipped', 'delivered', 'cancelled', 'returned']
-            if new_status in significant_statuses:
+            if new_status in NotificationService.SIGNIFICANT_ORDER_STATUSES:
                 pharmacist_admins = User.objects.filter(
                     Q(role='pharmacist_admin') | Q(role='admin'),
                     is_active=True
@@ -374,6 +421,146 @@ class NotificationService:
         except Exception as e:
             logger.error(f"Error creating status change notifications: {e}")
     
+    @staticmethod
+    def notify_orders_placed(orders):
+        """
+        Notifications for several orders placed at once by one sales rep,
+        e.g. an offline batch being synced. The sales rep and each
+        pharmacist/admin get one summary rather than one per order, all
+        written with one insert.
+        
+        Args:
+            orders: Order instances (with sales_rep set) that were just placed
+        """
+        try:
+            if not orders:
+                return []
+            sales_rep = orders[0].sales_rep
+            total = sum((order.total_amount for order in orders), Decimal('0.00'))
+            order_numbers = ', '.join(order.order_number for order in orders[:5])
+            if len(orders) > 5:
+                order_numbers += f' and {len(orders) - 5} more'
+            list_url = reverse('orders:order_list')
+            
+            notifications = []
+            if sales_rep:
+                notifications.append(Notification(
+                    user=sales_rep,
+                    notification_type='order_update',
+                    title=f'{len(orders)} Orders Placed Successfully',
+                    message=f'Your synced orders {order_numbers} have been placed. Total: ₱{total:,.2f}',
+                    priority='medium',
+                    action_url=list_url,
+                ))
+            
+            rep_name = (sales_rep.get_full_name() or sales_rep.username) if sales_rep else 'A sales rep'
+            pharmacist_admins = User.objects.filter(
+                Q(role='pharmacist_admin') | Q(role='admin'),
+                is_active=True
+            )
+            for admin in pharmacist_admins:
+                notifications.append(Notification(
+                    user=admin,
+                    notification_type='order_update',
+                    title=f'{len(orders)} New Orders',
+                    message=f'{rep_name} placed {order_numbers} (₱{total:,.2f}). Status: Pending',
+                    priority='high',
+                    action_url=f"{reverse('orders:pharmacist_order_list')}?status=pending",
+                ))
+            
+            notifications = Notification.objects.bulk_create(notifications)
+            
+            # bulk_create skips the per-notification signal and feed event
+            ChangeFeedService.publish_many('notification', [
+                (ChangeFeedService.user_audience(notification.user_id), notification.id,
+                 {'notification_type': notification.notification_type, 'priority': notification.priority})
+                for notification in notifications
+            ])
+            ChangeVersionService.bump(*{
+                ChangeVersionService.notifications_scope(notification.user_id) for notification in notifications
+            })
+            
+            logger.info(f"Order placement notifications created for {len(orders)} orders")
+            return notifications
+            
+        except Exception as e:
+            logger.error(f"Error creating batch order placement notifications: {e}")
+            return []
+    
+    @staticmethod
+    def notify_order_status_changes(orders, old_statuses, new_status, changed_by_user=None):
+        """
+        Notifications for many orders moved to the same status at once, e.g.
+        by a bulk pharmacist action. Sales reps get one notification per
+        order as usual; other pharmacists and admins get a single summary.
+        Everything is written with one insert.
+        
+        Args:
+            orders: Order instances (with sales_rep loaded) now in new_status
+            old_statuses: Map of order id to its status before the change
+            new_status: The status every order moved to
+            changed_by_user: User who made the change (not notified)
+        """
+        try:
+            status_display_map = dict(Order.STATUS_CHOICES)
+            new_status_display = status_display_map.get(new_status, new_status.title())
+            priority = NotificationService.ORDER_STATUS_PRIORITY.get(new_status, 'medium')
+            
+            notifications = []
+            for order in orders:
+                if order.sales_rep and (changed_by_user is None or order.sales_rep.id != changed_by_user.id):
+                    old_status = old_statuses.get(order.id, '')
+                    old_status_display = status_display_map.get(old_status, old_status.title())
+                    notifications.append(Notification(
+                        user=order.sales_rep,
+                        notification_type='order_update',
+                        title=f'Order {order.order_number} Status Updated',
+                        message=f'Order status changed from {old_status_display} to {new_status_display}. Customer: {order.customer_name}',
+                        priority=priority,
+                        action_url=reverse('orders:pharmacist_order_detail', args=[order.id]),
+                    ))
+            
+            if orders and new_status in NotificationService.SIGNIFICANT_ORDER_STATUSES:
+                pharmacist_admins = User.objects.filter(
+                    Q(role='pharmacist_admin') | Q(role='admin'),
+                    is_active=True
+                )
+                if changed_by_user:
+                    pharmacist_admins = pharmacist_admins.exclude(id=changed_by_user.id)
+                
+                order_numbers = ', '.join(order.order_number for order in orders[:5])
+                if len(orders) > 5:
+                    order_numbers += f' and {len(orders) - 5} more'
+                changed_by = (changed_by_user.get_full_name() or changed_by_user.username) if changed_by_user else 'System'
+                for admin in pharmacist_admins:
+                    notifications.append(Notification(
+                        user=admin,
+                        notification_type='order_update',
+                        title=f'{len(orders)} Orders Now {new_status_display}',
+                        message=f'{changed_by} moved {order_numbers} to {new_status_display}.',
+                        priority=priority,
+                        action_url=f"{reverse('orders:pharmacist_order_list')}?status={new_status}",
+                    ))
+            
+            notifications = Notification.objects.bulk_create(notifications)
+            
+            # bulk_create skips the per-notification signal and feed event
+            ChangeFeedService.publish_many('notification', [
+                (ChangeFeedService.user_audience(notification.user_id), notification.id,
+                 {'notification_type': notification.notification_type, 'priority': notification.priority})
+                for notification in notifications
+            ])
+            ChangeVersionService.bump(*{
+                ChangeVersionService.notifications_scope(notification.user_id) for notification in notifications
+            })
+            
+            logger.info(f"Status change notifications created for {len(orders)} orders -> {new_status}")
+            return notifications
+            
+        except Exception as e:
+            logger.error(f"Error creating bulk status change notifications: {e}")
+            return []
+    
     @staticmethod
     def mark_order_notifications_as_read(order):
         """
@@ -415,3 +602,207 @@ class NotificationService:
             logger.error(f"Error marking order notifications as read: {e}")
             return 0
 
+
+class ChangeFeedService:
+    """
+    Publishes order, payment and notification changes to the ChangeEvent
+    table and reads them back for the change feed stream, so open pages can
+    refresh when something happens instead of polling on a timer.
+    """
+
+    STAFF_AUDIENCE = 'staff'
+    STAFF_ROLES = ('pharmacist_admin', 'admin')
+    DEFAULT_BATCH_SIZE = 100
+
+    @staticmethod
+    def user_audience(user_id):
+        return f'user:{user_id}'
+
+    @staticmethod
+    def audiences_for(user):
+        """Audiences whose events the given user receives"""
+        audiences = [ChangeFeedService.user_audience(user.id)]
+        if user.role in ChangeFeedService.STAFF_ROLES:
+            audiences.append(ChangeFeedService.STAFF_AUDIENCE)
+        return audiences
+
+    @staticmethod
+    def publish(event_type, audiences, object_id=None, payload=None):
+        """
+        Queue one event per audience. Rows are written once the surrounding
+        transaction commits, so subscribers never see a rolled-back change
+        and never refetch before the change is visible to them.
+        """
+        ChangeFeedService._write_on_commit(event_type, [
+            ChangeEvent(audience=audience, event_type=event_type,
+                        object_id=object_id, payload=payload or {})
+            for audience in dict.fromkeys(audiences)
+        ])
+
+    @staticmethod
+    def publish_many(event_type, events):
+        """Queue several ``(audience, object_id, payload)`` events in one write"""
+        ChangeFeedService._write_on_commit(event_type, [
+            ChangeEvent(audience=audience, event_type=event_type,
+                        object_id=object_id, payload=payload or {})
+            for audience, object_id, payload in events
+        ])
+
+    @staticmethod
+    def publish_order_change(order, event_type):
+        """Tell staff and the order's sales rep that an order changed"""
+        ChangeFeedService.publish_order_changes([order], event_type)
+
+    @staticmethod
+    def publish_order_changes(orders, event_type):
+        """Tell staff and each order's sales rep about several orders in one write"""
+        events = []
+        for order in orders:
+            audiences = [ChangeFeedService.STAFF_AUDIENCE]
+            if order.sales_rep_id:
+                audiences.append(ChangeFeedService.user_audience(order.sales_rep_id))
+            events.extend(
+                ChangeEvent(
+                    audience=audience,
+                    event_type=event_type,
+                    object_id=order.id,
+                    payload={
+                        'order_number': order.order_number,
+                        'status': order.status,
+                        'payment_status': order.payment_status,
+                    },
+                )
+                for audience in audiences
+            )
+        ChangeFeedService._write_on_commit(event_type, events)
+
+    @staticmethod
+    def _write_on_commit(event_type, events):
+        if not events:
+            return
+
+        def write():
+            try:
+                ChangeEvent.objects.bulk_create(events)
+            except Exception as e:
+                logger.error(f"Error publishing {event_type} change event: {e}")
+
+        transaction.on_commit(write)
+
+    @staticmethod
+    def latest_id():
+        """Cursor of the newest event, where a fresh subscriber starts from"""
+        return ChangeEvent.objects.aggregate(latest=Max('id'))['latest'] or 0
+
+    @staticmethod
+    def events_since(user, cursor, limit=None):
+        """Events for the user newer than the cursor, oldest first"""
+        return list(
+            ChangeEvent.objects.filter(
+                audience__in=ChangeFeedService.audiences_for(user),
+                id__gt=cursor,
+            ).order_by('id')[:limit or ChangeFeedService.DEFAULT_BATCH_SIZE]
+        )
+
+    @staticmethod
+    def purge(older_than=None):
+        """
+        Delete events past the retention window. Returns the number deleted.
+        """
+        if older_than is None:
+            older_than = timezone.now() - timedelta(seconds=settings.CHANGE_FEED_RETENTION)
+        deleted, _ = ChangeEvent.objects.filter(created_at__lt=older_than).delete()
+        return deleted
+
+
+class ChangeVersionService:
+    """
+    Per-scope change counters behind the ETags of the polling APIs.
+
+    Writers bump the scopes they touch; readers hash the current versions of
+    the scopes their payload depends on into an ETag and answer a matching
+    If-None-Match with 304 before running any aggregation.
+    """
+
+    ORDERS_SCOPE = 'orders'
+    STOCK_SCOPE = 'stock'
+    USERS_SCOPE = 'users'
+    # Medicine names, prices and availability (inventory.services.MedicineCatalogIndex)
+    CATALOG_SCOPE = 'catalog'
+    # Demand forecasts (analytics.services.ModelEvaluationMetricsService)
+    FORECASTS_SCOPE = 'forecasts'
+
+    # Scopes bumped in the current transaction, written once it commits
+    _pending = threading.local()
+
+    @staticmethod
+    def orders_scope(user_id):
+        """Orders owned by one sales rep"""
+        return f'orders:user:{user_id}'
+
+    @staticmethod
+    def notifications_scope(user_id):
+        return f'notifications:user:{user_id}'
+
+    @classmethod
+    def _pending_scopes(cls):
+        if not hasattr(cls._pending, 'scopes'):
+            cls._pending.scopes = set()
+        return cls._pending.scopes
+
+    @classmethod
+    def bump(cls, *scopes):
+        """
+        Bump the given scopes once the surrounding transaction commits.
+        Repeated bumps within one transaction are written together.
+        """
+        scopes = [scope for scope in scopes if scope]
+        if not scopes:
+            return
+        cls._pending_scopes().update(scopes)
+        transaction.on_commit(cls._flush)
+
+    @classmethod
+    def _flush(cls):
+        pending = cls._pending_scopes()
+        if not pending:
+            return
+        scopes = sorted(pending)
+        pending.clear()
+
+        try:
+            ChangeVersion.objects.bulk_create(
+                [ChangeVersion(scope=scope) for scope in scopes], ignore_conflicts=True
+            )
+            ChangeVersion.objects.filter(scope__in=scopes).update(version=F('version') + 1)
+        except Exception as e:
+            logger.error(f"Error bumping change versions {scopes}: {e}")
+
+    @staticmethod
+    def get_versions(scopes):
+        """Map of scope to its current version, in one query"""
+        versions = dict(ChangeVersion.objects.filter(scope__in=scopes).values_list('scope', 'version'))
+        return {scope: versions.get(scope, 0) for scope in scopes}
+
+    @staticmethod
+    def etag(scopes, *vary):
+        """
+        Weak ETag for a payload built from the given scopes. ``vary`` holds
+        anything else the payload depends on, such as the user or query string.
+        The ETag also rolls over every CHANGE_VERSION_ETAG_TTL seconds, which
+        bounds staleness from writes that bypass the bump hooks.
+        """
+        versions = ChangeVersionService.get_versions(scopes)
+        parts = [f'{scope}={version}' for scope, version in versions.items()]
+        parts += [str(value) for value in vary]
+        parts.append(str(int(time.time() // settings.CHANGE_VERSION_ETAG_TTL)))
+        digest = hashlib.md5('|'.join(parts).encode()).hexdigest()
+        return f'W/"{digest}"'
+
+    @staticmethod
+    def not_modified(request, etag):
+        """A 304 response when the client's copy is current, otherwise None"""
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            response['ETag'] = etag
+        return response
@@ -0,0 +1,27 @@
+"""
+Signals for common models
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from accounts.models import User
+from .models import Notification
+from .services import ChangeVersionService
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def bump_notification_version(sender, instance, **kwargs):
+    """
+    Invalidate the recipient's notification ETags
+    """
+    ChangeVersionService.bump(ChangeVersionService.notifications_scope(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_version(sender, instance, **kwargs):
+    """
+    Invalidate ETags of payloads that count users
+    """
+    ChangeVersionService.bump(ChangeVersionService.USERS_SCOPE)
@@ -0,0 +1,33 @@
+"""
+Test helpers shared between apps
+"""
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryCountAssertionsMixin:
+    """TestCase mixin for checking that a view's queries do not grow with its data"""
+
+    def assertConstantQueries(self, request, add_rows, sizes=(1, 10)):
+        """
+        Grow the data to each of ``sizes`` rows with ``add_rows(n)`` (called
+        with the number of rows to add) and assert ``request()`` runs the same
+        number of queries every time. Returns that number.
+        """
+        counts = []
+        rows = 0
+        for size in sizes:
+            add_rows(size - rows)
+            rows = size
+            with CaptureQueriesContext(connection) as queries:
+                request()
+            counts.append(len(queries))
+        if len(set(counts)) > 1:
+            sql = '\n'.join(f'{i}. {query["sql"]}' for i, query in enumerate(queries.captured_queries, start=1))
+            self.fail(
+                'Query count grew with the data: '
+                + ', '.join(f'{count} queries for {size} rows' for size, count in zip(sizes, counts))
+                + f'\nQueries for {sizes[-1]} rows:\n{sql}'
+            )
+        return counts[0]
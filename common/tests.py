@@ -2,14 +2,19 @@
 Comprehensive unit tests for the common module
 """
 
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
 from decimal import Decimal
 from datetime import date, datetime
 import json
 
-from .models import Notification, FileUpload, SystemConfiguration
+from .dates import date_range_lookups
+from .exports import export_value
+from .idempotency import purge_expired
+from .pagination import InvalidCursor, KeysetPaginator
+from .models import ChangeEvent, ChangeVersion, IdempotencyKey, Notification, FileUpload, SystemConfiguration
+from .services import ChangeFeedService, ChangeVersionService, NotificationService
 from accounts.models import User
 
 User = get_user_model()
@@ -180,3 +185,431 @@ class SystemConfigurationModelTests(TestCase):
             config.config_type = category
             config.save()
             self.assertEqual(config.config_type, category)
+
+
+class ChangeFeedTests(TestCase):
+    """Test cases for the order, payment and notification change feed"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from orders.models import Order
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.other_rep = User.objects.create_user(username='salesrep2', password='testpass123', role='sales_rep')
+        self.pharmacist = User.objects.create_user(username='pharmacist', password='testpass123', role='pharmacist_admin')
+        self.order = Order.objects.create(
+            sales_rep=self.rep,
+            customer_name='John Doe',
+            subtotal=Decimal('51.00'),
+            total_amount=Decimal('51.00')
+        )
+        self.cursor = ChangeFeedService.latest_id()
+    
+    def test_order_changes_reach_staff_and_the_orders_sales_rep(self):
+        """Test status and payment changes are published once committed"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.status = 'confirmed'
+            self.order.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.payment_status = 'paid'
+            self.order.save()
+        
+        rep_events = ChangeFeedService.events_since(self.rep, self.cursor)
+        self.assertEqual([e.event_type for e in rep_events], ['order_status', 'payment'])
+        self.assertEqual(rep_events[0].payload['status'], 'confirmed')
+        self.assertEqual(len(ChangeFeedService.events_since(self.pharmacist, self.cursor)), 2)
+        self.assertEqual(ChangeFeedService.events_since(self.other_rep, self.cursor), [])
+    
+    def test_unrelated_saves_publish_nothing(self):
+        """Test saving an order without a status or payment change is silent"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.internal_notes = 'Leave at the front desk'
+            self.order.save()
+        self.assertEqual(ChangeFeedService.latest_id(), self.cursor)
+    
+    def test_notifications_are_published_to_their_user(self):
+        """Test creating a notification pushes an event to its recipient only"""
+        with self.captureOnCommitCallbacks(execute=True):
+            notification = NotificationService.create_notification(
+                self.other_rep, 'promotion', 'Promo', 'New prices this week'
+            )
+        events = ChangeFeedService.events_since(self.other_rep, self.cursor)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].event_type, 'notification')
+        self.assertEqual(events[0].object_id, notification.id)
+        self.assertEqual(ChangeFeedService.events_since(self.pharmacist, self.cursor), [])
+    
+    @override_settings(CHANGE_FEED_STREAM_SECONDS=0)
+    def test_stream_resumes_from_last_event_id(self):
+        """Test the event stream sends events after the client's cursor"""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.status = 'confirmed'
+            self.order.save()
+        event = ChangeEvent.objects.get(audience=f'user:{self.rep.id}')
+        
+        client = Client()
+        client.login(username='salesrep', password='testpass123')
+        response = client.get('/common/api/changes/', HTTP_LAST_EVENT_ID=str(self.cursor))
+        body = b''.join(response.streaming_content).decode()
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertIn(f'id: {event.id}\nevent: order_status\n', body)
+        self.assertIn(f'"id": {self.order.id}', body)
+        
+        response = client.get('/common/api/changes/', HTTP_LAST_EVENT_ID=str(event.id))
+        self.assertNotIn('event: order_status', b''.join(response.streaming_content).decode())
+    
+    @override_settings(CHANGE_FEED_STREAM_SECONDS=0)
+    def test_reconnect_without_events_keeps_the_opening_cursor(self):
+        """Test a change made between two connections reaches a tab that had seen no events"""
+        import re
+        client = Client()
+        client.login(username='salesrep', password='testpass123')
+        body = b''.join(client.get('/common/api/changes/').streaming_content).decode()
+        opening_id = re.search(r'^id: (\d+)$', body, re.M).group(1)
+        self.assertEqual(int(opening_id), self.cursor)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.order.status = 'confirmed'
+            self.order.save()
+        
+        # The browser reconnects with the last id it was sent
+        response = client.get('/common/api/changes/', HTTP_LAST_EVENT_ID=opening_id)
+        self.assertIn('event: order_status\n', b''.join(response.streaming_content).decode())
+    
+    def test_purge_removes_events_past_retention(self):
+        """Test old events are deleted and recent ones kept"""
+        from django.utils import timezone
+        from datetime import timedelta
+        old = ChangeEvent.objects.create(audience='staff', event_type='order_status')
+        ChangeEvent.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=2))
+        ChangeEvent.objects.create(audience='staff', event_type='order_status')
+        
+        self.assertEqual(ChangeFeedService.purge(), 1)
+        self.assertFalse(ChangeEvent.objects.filter(pk=old.pk).exists())
+
+
+class ChangeVersionServiceTests(TestCase):
+    """Test cases for the per-scope change counters behind API ETags"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='testuser', password='testpass123', role='sales_rep')
+    
+    def test_bumps_are_written_once_per_transaction(self):
+        """Test repeated bumps of a scope in one transaction count once"""
+        with self.captureOnCommitCallbacks(execute=True):
+            ChangeVersionService.bump('orders')
+            ChangeVersionService.bump('orders', 'stock')
+        
+        self.assertEqual(ChangeVersionService.get_versions(['orders', 'stock', 'unknown']),
+                         {'orders': 1, 'stock': 1, 'unknown': 0})
+    
+    def test_etag_follows_scope_versions_and_vary_values(self):
+        """Test the ETag is stable until a scope is bumped"""
+        etag = ChangeVersionService.etag(['orders'], self.user.id)
+        self.assertEqual(ChangeVersionService.etag(['orders'], self.user.id), etag)
+        self.assertNotEqual(ChangeVersionService.etag(['orders'], 'other'), etag)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            ChangeVersionService.bump('orders')
+        self.assertNotEqual(ChangeVersionService.etag(['orders'], self.user.id), etag)
+    
+    def test_notification_writes_bump_the_recipients_scope(self):
+        """Test new and read notifications invalidate the notification API"""
+        scope = ChangeVersionService.notifications_scope(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationService.create_notification(self.user, 'promotion', 'Promo', 'New prices this week')
+        with self.captureOnCommitCallbacks(execute=True):
+            NotificationService.mark_all_as_read(self.user)
+        
+        self.assertEqual(ChangeVersion.objects.get(scope=scope).version, 2)
+    
+    def test_notification_api_revalidates_with_etag(self):
+        """Test the notification API answers a current ETag with 304"""
+        client = Client()
+        client.force_login(self.user)
+        response = client.get('/common/api/notifications/?unread_only=true&last_check=2024-01-01T00:00:00')
+        self.assertEqual(response.status_code, 200)
+        
+        response = client.get('/common/api/notifications/?unread_only=true&last_check=2024-06-01T00:00:00',
+                              HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class KeysetPaginatorTests(TestCase):
+    """Test cases for cursor pagination on (created_at, id)"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from django.utils import timezone
+        self.user = User.objects.create_user(username='testuser', password='testpass123', role='sales_rep')
+        for number in range(7):
+            Notification.objects.create(user=self.user, notification_type='promotion',
+                                        title=f'Notice {number}', message='Message')
+        # Identical timestamps, so the id has to break ties
+        Notification.objects.update(created_at=timezone.now())
+        self.queryset = Notification.objects.filter(user=self.user)
+        self.expected = list(self.queryset.order_by('-created_at', '-id'))
+    
+    def test_pages_forward_and_back_without_gaps_or_repeats(self):
+        """Test next and previous cursors walk the whole list in order"""
+        paginator = KeysetPaginator(self.queryset, 3)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual([obj for page in pages for obj in page], self.expected)
+        self.assertFalse(pages[0].has_previous())
+        
+        back = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(list(back), list(pages[1]))
+        self.assertTrue(back.has_next())
+    
+    def test_last_page_reads_back_from_the_end(self):
+        """Test the last cursor returns the final rows without counting"""
+        paginator = KeysetPaginator(self.queryset, 3)
+        with self.assertNumQueries(1):
+            last = paginator.page(paginator.last_cursor)
+        self.assertEqual(list(last), self.expected[-3:])
+        self.assertFalse(last.has_next())
+        self.assertTrue(last.has_previous())
+    
+    def test_deep_page_is_a_single_query(self):
+        """Test a page after a cursor costs one query and no COUNT"""
+        paginator = KeysetPaginator(self.queryset, 2)
+        cursor = paginator.page().next_cursor
+        with self.assertNumQueries(1):
+            page = paginator.page(cursor)
+        self.assertEqual(list(page), self.expected[2:4])
+    
+    def test_invalid_cursor_is_rejected(self):
+        """Test tampered cursors raise InvalidCursor"""
+        paginator = KeysetPaginator(self.queryset, 3)
+        for cursor in ['not-a-cursor', paginator.encode_cursor('sideways', None),
+                       paginator.encode_cursor('next', ['2024-01-01T00:00:00'])]:
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+    
+    def test_approximate_count_stops_at_the_cap(self):
+        """Test the total is exact below the cap and reported as N+ above it"""
+        paginator = KeysetPaginator(self.queryset, 3)
+        self.assertEqual(paginator.approximate_count, 7)
+        self.assertTrue(paginator.count_is_exact)
+        
+        paginator = KeysetPaginator(self.queryset, 3)
+        paginator.COUNT_CAP = 5
+        self.assertEqual(paginator.count_display, '5+')
+        self.assertFalse(paginator.count_is_exact)
+
+
+class DateRangeLookupTests(TestCase):
+    """Test cases for half-open local-day date filters"""
+    
+    @override_settings(TIME_ZONE='Asia/Manila')
+    def test_days_are_half_open_ranges_in_the_local_time_zone(self):
+        """Test inclusive dates become [start of first day, start of day after last)"""
+        lookups = date_range_lookups('created_at', date(2024, 3, 1), date(2024, 3, 31))
+        
+        self.assertEqual(set(lookups), {'created_at__gte', 'created_at__lt'})
+        self.assertEqual(lookups['created_at__gte'].isoformat(), '2024-03-01T00:00:00+08:00')
+        self.assertEqual(lookups['created_at__lt'].isoformat(), '2024-04-01T00:00:00+08:00')
+        self.assertEqual(date_range_lookups('created_at'), {})
+
+
+class QueryPlanTests(TestCase):
+    """
+    Test cases checking the listing filters stay index-friendly. Each query
+    must be answered from one of the named indexes rather than a table scan.
+    """
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.day = date(2024, 3, 1)
+    
+    def assertUsesIndex(self, queryset, *index_names):
+        from django.db import connection
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be scanned sequentially
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+    
+    def _index_name(self, model, fields):
+        return next(index.name for index in model._meta.indexes if list(index.fields) == fields)
+    
+    def test_order_list_filters_use_composite_indexes(self):
+        """Test date, status and sales rep filters on orders hit matching indexes"""
+        from orders.models import Order
+        days = date_range_lookups('created_at', self.day, self.day)
+        
+        self.assertUsesIndex(Order.objects.filter(**days), self._index_name(Order, ['created_at', 'id']))
+        self.assertUsesIndex(Order.objects.filter(status='pending', **days),
+                             self._index_name(Order, ['status', 'created_at']))
+        self.assertUsesIndex(Order.objects.filter(sales_rep=self.user, status='pending', **days),
+                             'orders_rep_status_created_idx')
+        self.assertUsesIndex(Order.objects.filter(sales_rep=self.user, **days), 'orders_rep_created_idx')
+    
+    def test_transaction_revenue_range_uses_an_index(self):
+        """Test completed transactions in a date range are found by index"""
+        from transactions.models import Transaction
+        self.assertUsesIndex(
+            Transaction.objects.filter(status='completed', **date_range_lookups('created_at', self.day, self.day)),
+            'transactions_revenue_idx', self._index_name(Transaction, ['status', 'created_at']),
+        )
+    
+    def test_stock_movement_filters_use_indexes(self):
+        """Test movement type and medicine filters with a date range hit their indexes"""
+        from inventory.models import StockMovement
+        days = date_range_lookups('created_at', self.day, self.day)
+        
+        self.assertUsesIndex(StockMovement.objects.filter(movement_type='in', **days), 'stock_movement_type_idx')
+        self.assertUsesIndex(StockMovement.objects.filter(medicine_id=1, **days),
+                             self._index_name(StockMovement, ['medicine', 'created_at']))
+
+
+class CSVExportTests(TestCase):
+    """Test cases for the streaming list exports"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from orders.models import Order
+        self.pharmacist = User.objects.create_user(username='pharmacist', password='testpass123', role='pharmacist_admin')
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        for name, status in [('Maria Santos', 'pending'), ('=HYPERLINK("x")', 'pending'), ('Jose Cruz', 'cancelled')]:
+            Order.objects.create(
+                sales_rep=self.rep, customer_name=name, status=status,
+                subtotal=Decimal('51.00'), total_amount=Decimal('51.00')
+            )
+        self.client = Client()
+        self.client.force_login(self.pharmacist)
+    
+    def _rows(self, response):
+        import csv
+        content = b''.join(response.streaming_content).decode()
+        return list(csv.reader(content.splitlines()))
+    
+    def test_export_streams_every_filtered_row(self):
+        """Test the export applies the list filters and ignores paging"""
+        response = self.client.get('/orders/pharmacist/orders/', {'status': 'pending', 'export': 'csv'})
+        
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+        rows = self._rows(response)
+        self.assertEqual(rows[0][:5], ['Order number', 'Created', 'Customer', 'Sales rep', 'Status'])
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row[4] for row in rows[1:]}, {'Pending'})
+        self.assertIn('\'=HYPERLINK("x")', [row[2] for row in rows[1:]])
+    
+    def test_list_links_to_export_with_current_filters(self):
+        """Test the list page offers an export of what it is showing"""
+        response = self.client.get('/orders/pharmacist/orders/', {'status': 'pending'})
+        self.assertEqual(response.context['export_url'], '?status=pending&export=csv')
+    
+    def test_cell_formatting(self):
+        """Test numbers pass through and formula-like text is neutralised"""
+        self.assertEqual(export_value(-5), '-5')
+        self.assertEqual(export_value(Decimal('10.50')), '10.50')
+        self.assertEqual(export_value(None), '')
+        self.assertEqual(export_value('-1+1'), "'-1+1")
+
+
+class IdempotencyKeyTests(TestCase):
+    """Test cases for replaying retried requests"""
+    
+    def setUp(self):
+        """Set up test data"""
+        from inventory.models import Category, Manufacturer, Medicine
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=Category.objects.create(name='Antibiotics', is_active=True),
+            manufacturer=Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True),
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=100
+        )
+        self.client = Client()
+        self.client.force_login(self.rep)
+    
+    def _order_form(self, quantity, key):
+        return {
+            'idempotency_key': key,
+            'delivery_method': 'pickup',
+            'payment_status': 'pending',
+            'lines-TOTAL_FORMS': 1, 'lines-INITIAL_FORMS': 0, 'lines-MIN_NUM_FORMS': 1, 'lines-MAX_NUM_FORMS': 100,
+            'lines-0-medicine': self.medicine.id,
+            'lines-0-quantity': quantity,
+        }
+    
+    def test_retried_order_is_created_once(self):
+        """Test a resubmitted form replays the first response instead of placing a second order"""
+        from orders.models import Order
+        first = self.client.post('/orders/orders/create/', self._order_form(2, 'key-1'))
+        retry = self.client.post('/orders/orders/create/', self._order_form(2, 'key-1'))
+        
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual((retry.status_code, retry['Location']), (first.status_code, first['Location']))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(IdempotencyKey.objects.get().response_status, 302)
+    
+    def test_key_cannot_be_reused_for_a_different_request(self):
+        """Test the same key with a different body is refused"""
+        from orders.models import Order
+        self.client.post('/orders/orders/create/', self._order_form(2, 'key-1'))
+        
+        response = self.client.post('/orders/orders/create/', self._order_form(3, 'key-1'))
+        
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+    
+    def test_expired_keys_run_again_and_are_purged(self):
+        """Test a key past its TTL no longer replays and is swept by the purge"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from orders.models import Order
+        self.client.post('/orders/orders/create/', self._order_form(2, 'key-1'))
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        
+        self.client.post('/orders/orders/create/', self._order_form(2, 'key-1'))
+        
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(purge_expired(now=timezone.now() + timedelta(days=2)), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+    
+    def test_server_errors_are_not_replayed(self):
+        """Test a retry after a failed attempt runs the view again"""
+        for _ in range(2):
+            response = self.client.post('/orders/api/process-payment/999999/', {'payment_intent_id': 'pi_1'},
+                                        HTTP_IDEMPOTENCY_KEY='process-pi_1')
+            self.assertEqual(response.status_code, 500)
+            self.assertFalse(response.has_header('Idempotent-Replayed'))
+        
+        self.assertFalse(IdempotencyKey.objects.filter(key='process-pi_1').exists())
+    
+    def test_attempt_during_the_first_is_asked_to_retry(self):
+        """Test a key whose first request is still running is refused without running the view"""
+        from datetime import timedelta
+        from django.utils import timezone
+        from orders.models import Order
+        form = self._order_form(2, 'key-1')
+        self.client.post('/orders/orders/create/', form)
+        # Put the key back into the state it has while the first request runs
+        IdempotencyKey.objects.update(response_status=None, response_body=b'')
+        
+        response = self.client.post('/orders/orders/create/', form)
+        
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(Order.objects.count(), 1)
+        
+        # A marker whose request never finished is taken over eventually
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=10))
+        response = self.client.post('/orders/orders/create/', form)
+        
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.get().response_status, 302)
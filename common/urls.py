@@ -26,6 +26,7 @@ urlpatterns = [
     # API endpoints
     path('api/notifications/', views.NotificationAPIView.as_view(), name='api_notifications'),
     path('api/notifications/mark-read/', views.NotificationMarkReadView.as_view(), name='api_notification_mark_read'),
+    path('api/changes/', views.ChangeFeedStreamView.as_view(), name='api_change_feed'),
     path('api/config/', views.ConfigurationAPIView.as_view(), name='api_config'),
     path('api/file-uploads/', views.FileUploadAPIView.as_view(), name='api_file_uploads'),
 ]
@@ -1,11 +1,14 @@
 from django.shortcuts import render, get_object_or_404
 from django.views.generic import ListView, DetailView, CreateView, UpdateView
 from django.views import View
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Q
+from django.core.serializers.json import DjangoJSONEncoder
 from .models import Notification, SystemConfiguration, FileUpload, EmailTemplate
+import json
+import time
 
 # Create your views here.
 
@@ -220,10 +223,22 @@ class EmailTemplateEditView(LoginRequiredMixin, UpdateView):
 class NotificationAPIView(LoginRequiredMixin, View):
     """API endpoint for notifications with real-time support"""
     def get(self, request):
-        from .services import NotificationService
+        from .services import ChangeVersionService, NotificationService
         from django.utils import timezone
         from datetime import timedelta
         
+        # Nothing to rebuild if neither the user's notifications nor the orders
+        # they refer to have changed since the client's copy. last_check is left
+        # out: when nothing changed, a later check has nothing new either.
+        etag = ChangeVersionService.etag(
+            [ChangeVersionService.notifications_scope(request.user.id), ChangeVersionService.ORDERS_SCOPE],
+            request.user.id,
+            sorted((key, value) for key, value in request.GET.items() if key != 'last_check'),
+        )
+        not_modified = ChangeVersionService.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        
         # Get optional last_check parameter for incremental updates
         last_check_param = request.GET.get('last_check')
         last_check = None
@@ -301,17 +316,19 @@ class NotificationAPIView(LoginRequiredMixin, View):
         
         # Get latest notification timestamp for next check
         latest_notification_time = None
-        if notifications:
-            latest_notification_time = notifications[0].created_at.isoformat()
+        if notifications_list:
+            latest_notification_time = notifications_list[0].created_at.isoformat()
         elif last_check:
             latest_notification_time = last_check.isoformat()
         
-        return JsonResponse({
+        response = JsonResponse({
             'notifications': notifications_data,
             'unread_count': unread_count,
             'latest_check_time': timezone.now().isoformat(),
             'latest_notification_time': latest_notification_time,
         })
+        response['ETag'] = etag
+        return response
     
     def _get_time_ago(self, dt):
         """Helper to get human-readable time ago"""
@@ -380,3 +397,50 @@ class FileUploadAPIView(LoginRequiredMixin, View):
                 'uploaded_at': upload.uploaded_at.isoformat(),
             })
         return JsonResponse({'file_uploads': data})
+
+class ChangeFeedStreamView(LoginRequiredMixin, View):
+    """
+    Server-sent events stream of order, payment and notification changes
+    for the current user. Pages refetch their data when an event arrives
+    instead of polling on a timer.
+
+    The stream closes after CHANGE_FEED_STREAM_SECONDS and the browser
+    reconnects on its own, sending Last-Event-ID so nothing is missed.
+    """
+    def get(self, request):
+        from .services import ChangeFeedService
+
+        cursor = request.headers.get('Last-Event-ID') or request.GET.get('cursor')
+        try:
+            cursor = int(cursor)
+        except (TypeError, ValueError):
+            # New subscriber: only changes from now on
+            cursor = ChangeFeedService.latest_id()
+
+        response = StreamingHttpResponse(self.stream(request.user, cursor), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, user, cursor):
+        from django.conf import settings
+        from .services import ChangeFeedService
+
+        yield f"retry: {settings.CHANGE_FEED_RETRY_MS}\n\n"
+        # Hand the starting cursor to the browser straight away; it sends it
+        # back as Last-Event-ID on reconnect even if no change arrived, so
+        # events written between two connections are not skipped
+        yield f"id: {cursor}\nevent: cursor\ndata: {cursor}\n\n"
+
+        deadline = time.monotonic() + settings.CHANGE_FEED_STREAM_SECONDS
+        while True:
+            for event in ChangeFeedService.events_since(user, cursor):
+                cursor = event.id
+                data = json.dumps({'id': event.object_id, **event.payload}, cls=DjangoJSONEncoder)
+                yield f"id: {event.id}\nevent: {event.event_type}\ndata: {data}\n\n"
+
+            if time.monotonic() >= deadline:
+                break
+            time.sleep(settings.CHANGE_FEED_POLL_SECONDS)
+            # Comment line so proxies and the browser see the connection is alive
+            yield ": keepalive\n\n"
@@ -0,0 +1,22 @@
+"""
+Release stock reservations whose hold has expired
+
+Expired holds no longer count against available stock, so this only reclaims
+rows; intended to run on a schedule (e.g. every few minutes from cron).
+"""
+
+from django.core.management.base import BaseCommand
+
+from inventory.services import StockReservationService
+
+
+class Command(BaseCommand):
+    help = 'Delete expired stock reservations in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Reservations deleted per statement')
+
+    def handle(self, *args, **options):
+        released = StockReservationService.release_expired(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired reservations"))
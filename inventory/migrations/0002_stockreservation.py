@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+        ('orders', '0005_alter_orderitem_unit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('medicine', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='inventory.medicine')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_reservations', to='orders.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['medicine', 'expires_at'], name='inventory_s_medicin_282ed9_idx'), models.Index(fields=['expires_at'], name='inventory_s_expires_9d6a1b_idx')],
+            },
+        ),
+    ]
@@ -2,6 +2,8 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
+from common.models import ChangeTrackingMixin
+
 
 class Category(models.Model):
     """
@@ -37,7 +39,7 @@ class Manufacturer(models.Model):
         return self.name
 
 
-class Medicine(models.Model):
+class Medicine(ChangeTrackingMixin, models.Model):
     """
     Medicine catalog with detailed information
     """
@@ -98,6 +100,17 @@ class Medicine(models.Model):
     def __str__(self):
         return f"{self.name} ({self.strength})"
     
+    @property
+    def reserved_stock(self):
+        """Units held by live reservations of pending orders"""
+        from .services import StockReservationService
+        return StockReservationService.reserved_quantities([self.pk]).get(self.pk, 0)
+    
+    @property
+    def available_stock(self):
+        """On-hand stock that is not held by a live reservation"""
+        return max(0, self.current_stock - self.reserved_stock)
+    
     @property
     def is_low_stock(self):
         return self.current_stock <= self.reorder_point
@@ -139,11 +152,37 @@ class StockMovement(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination (common.pagination.KeysetPaginator)
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['medicine', 'created_at']),
+            models.Index(fields=['movement_type', 'created_at'], name='stock_movement_type_idx'),
+        ]
     
     def __str__(self):
         return f"{self.movement_type} - {self.medicine.name} - {self.quantity}"
 
 
+class StockReservation(models.Model):
+    """
+    Units held for a pending order until it is confirmed, cancelled or the hold expires
+    """
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='reservations')
+    order = models.ForeignKey('orders.Order', on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['medicine', 'expires_at']),
+            models.Index(fields=['expires_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity} x {self.medicine_id} for order {self.order_id}"
+
+
 class ReorderAlert(models.Model):
     """
     Alerts for medicines that need reordering
@@ -0,0 +1,461 @@
+"""
+Inventory services for stock level checks, stock movement posting,
+reservations and the medicine autocomplete index
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+import logging
+import re
+import threading
+import time
+
+from .models import Medicine, ReorderAlert, StockMovement, StockReservation
+
+logger = logging.getLogger(__name__)
+
+
+class InsufficientStockError(Exception):
+    """Raised when an order asks for more units than are available"""
+    
+    def __init__(self, medicine, requested, available):
+        self.medicine = medicine
+        self.requested = requested
+        self.available = available
+        super().__init__(
+            f'Insufficient stock for {medicine.name}. Available: {available}, Requested: {requested}'
+        )
+
+
+class StockAlertService:
+    """
+    Service for low stock notifications and reorder alerts
+    """
+    
+    @staticmethod
+    def reorder_priority(medicine):
+        if medicine.current_stock == 0:
+            return 'urgent'
+        if medicine.current_stock <= medicine.reorder_point / 2:
+            return 'high'
+        return 'medium'
+    
+    @staticmethod
+    def check_medicine(medicine):
+        """
+        Notify and raise or refresh a reorder alert if the medicine is low on stock
+        """
+        from common.services import NotificationService
+        
+        try:
+            # Only check if medicine is active and stock is low
+            if not (medicine.is_active and medicine.current_stock <= medicine.reorder_point):
+                return
+            
+            NotificationService.notify_low_stock(medicine, medicine.current_stock)
+            
+            # Create or update reorder alert if not exists
+            alert, created = ReorderAlert.objects.get_or_create(
+                medicine=medicine,
+                is_processed=False,
+                defaults={
+                    'current_stock': medicine.current_stock,
+                    'reorder_point': medicine.reorder_point,
+                    'suggested_quantity': medicine.reorder_point * 2,
+                    'priority': StockAlertService.reorder_priority(medicine),
+                }
+            )
+            
+            if not created:
+                # Update existing alert
+                alert.current_stock = medicine.current_stock
+                alert.priority = StockAlertService.reorder_priority(medicine)
+                alert.save()
+        
+        except Exception as e:
+            logger.error(f"Error checking stock levels for {medicine.name}: {e}")
+    
+    @staticmethod
+    def check_medicines(medicine_ids):
+        """
+        Check several medicines at once, loading only those that are low on stock
+        """
+        low_stock = Medicine.objects.filter(
+            id__in=set(medicine_ids),
+            is_active=True,
+            current_stock__lte=F('reorder_point')
+        )
+        for medicine in low_stock:
+            StockAlertService.check_medicine(medicine)
+
+
+class StockLedgerService:
+    """
+    Posts batches of stock movements with a single stock update
+    """
+    
+    INBOUND_TYPES = ('in', 'return')
+    OUTBOUND_TYPES = ('out', 'damage', 'expired')
+    
+    @classmethod
+    def stock_delta(cls, movement):
+        """Signed change a movement applies to current stock (adjustments apply none)"""
+        if movement.movement_type in cls.INBOUND_TYPES:
+            return abs(movement.quantity)
+        if movement.movement_type in cls.OUTBOUND_TYPES:
+            return -abs(movement.quantity)
+        return 0
+    
+    @classmethod
+    def post(cls, movements):
+        """
+        Save ``movements`` and apply their net stock change per medicine
+        
+        Movements are bulk created, so the per-movement post_save handler does
+        not run; stock is clamped at zero like that handler does, and low stock
+        checks run once per medicine after the transaction commits.
+        
+        Args:
+            movements: iterable of unsaved StockMovement instances
+        
+        Returns:
+            The created movements
+        """
+        movements = list(movements)
+        if not movements:
+            return movements
+        
+        deltas = defaultdict(int)
+        for movement in movements:
+            deltas[movement.medicine_id] += cls.stock_delta(movement)
+        deltas = {medicine_id: delta for medicine_id, delta in deltas.items() if delta}
+        
+        with transaction.atomic():
+            created = StockMovement.objects.bulk_create(movements)
+            
+            if deltas:
+                Medicine.objects.filter(pk__in=deltas).update(
+                    current_stock=Greatest(
+                        Case(
+                            *[When(pk=medicine_id, then=F('current_stock') + Value(delta))
+                              for medicine_id, delta in deltas.items()],
+                            output_field=IntegerField(),
+                        ),
+                        Value(0),
+                    ),
+                    updated_at=timezone.now(),
+                )
+                medicine_ids = list(deltas)
+                transaction.on_commit(lambda: StockAlertService.check_medicines(medicine_ids))
+                
+                from common.services import ChangeVersionService
+                ChangeVersionService.bump(ChangeVersionService.STOCK_SCOPE)
+        
+        logger.info(f"Posted {len(created)} stock movements for {len(deltas)} medicines")
+        return created
+
+
+class StockReservationService:
+    """
+    Holds stock for pending orders; available stock is on-hand minus live holds
+    """
+    
+    DEFAULT_TTL_SECONDS = 24 * 60 * 60
+    
+    @classmethod
+    def ttl(cls):
+        return timedelta(seconds=getattr(settings, 'INVENTORY_RESERVATION_TTL', cls.DEFAULT_TTL_SECONDS))
+    
+    @staticmethod
+    def live(now=None):
+        """Reservations that have not expired yet"""
+        return StockReservation.objects.filter(expires_at__gt=now or timezone.now())
+    
+    @classmethod
+    def reserved_quantities(cls, medicine_ids, now=None):
+        """Map of medicine id to units held by live reservations"""
+        rows = (
+            cls.live(now)
+            .filter(medicine_id__in=medicine_ids)
+            .values('medicine_id')
+            .annotate(total=Sum('quantity'))
+        )
+        return {row['medicine_id']: row['total'] for row in rows}
+    
+    @classmethod
+    def reserve(cls, order, quantities, now=None):
+        """
+        Hold stock for a saved order
+        
+        The medicine rows are locked (in primary key order, so concurrent
+        orders cannot deadlock) only while availability is checked and the
+        reservations are written; on-hand stock is not touched.
+        
+        Args:
+            order: saved Order the units are held for
+            quantities: iterable of (medicine, quantity) pairs, one per medicine
+        
+        Raises:
+            InsufficientStockError: if a medicine cannot cover its quantity;
+                no reservation is written in that case
+        """
+        now = now or timezone.now()
+        requested = {medicine.pk: (medicine, quantity) for medicine, quantity in quantities}
+        
+        with transaction.atomic():
+            on_hand = dict(
+                Medicine.objects.select_for_update()
+                .filter(pk__in=requested)
+                .order_by('pk')
+                .values_list('pk', 'current_stock')
+            )
+            reserved = cls.reserved_quantities(list(requested), now)
+            
+            for medicine_id in sorted(requested):
+                medicine, quantity = requested[medicine_id]
+                available = max(0, on_hand.get(medicine_id, 0) - reserved.get(medicine_id, 0))
+                if available < quantity:
+                    raise InsufficientStockError(medicine, quantity, available)
+            
+            expires_at = now + cls.ttl()
+            return StockReservation.objects.bulk_create([
+                StockReservation(medicine=medicine, order=order, quantity=quantity, expires_at=expires_at)
+                for medicine, quantity in requested.values()
+            ])
+    
+    @classmethod
+    def check_confirmations(cls, items, now=None):
+        """
+        Check that orders being confirmed can still take their units
+        
+        Units an order still holds were checked when it was placed. Units
+        whose hold expired (or was swept) are checked again against stock no
+        other live hold claims, so two orders cannot be confirmed against the
+        same units. Orders are taken in the order their items are given; the
+        medicine rows stay locked until the caller's transaction ends, so the
+        stock-out movements can be posted without another check.
+        
+        Args:
+            items: order items (with ``order_id``, ``medicine`` and ``quantity``)
+                of the orders being confirmed
+        
+        Returns:
+            {order id: InsufficientStockError} for orders that cannot be covered
+        """
+        now = now or timezone.now()
+        wanted = {}
+        medicines = {}
+        for item in items:
+            lines = wanted.setdefault(item.order_id, defaultdict(int))
+            lines[item.medicine_id] += item.quantity
+            medicines[item.medicine_id] = item.medicine
+        if not wanted:
+            return {}
+        
+        with transaction.atomic():
+            on_hand = dict(
+                Medicine.objects.select_for_update()
+                .filter(pk__in=medicines)
+                .order_by('pk')
+                .values_list('pk', 'current_stock')
+            )
+            reserved = cls.reserved_quantities(list(medicines), now)
+            held = defaultdict(int)
+            for order_id, medicine_id, quantity in (
+                cls.live(now).filter(order_id__in=wanted).values_list('order_id', 'medicine_id', 'quantity')
+            ):
+                held[(order_id, medicine_id)] += quantity
+        
+        shortfalls = {}
+        for order_id, lines in wanted.items():
+            for medicine_id in sorted(lines):
+                own = held[(order_id, medicine_id)]
+                available = max(0, on_hand.get(medicine_id, 0) - reserved.get(medicine_id, 0))
+                if lines[medicine_id] - own > available:
+                    shortfalls[order_id] = InsufficientStockError(
+                        medicines[medicine_id], lines[medicine_id], available + own
+                    )
+                    break
+            else:
+                # Accepted: its units leave on-hand stock and its holds lapse
+                for medicine_id, quantity in lines.items():
+                    on_hand[medicine_id] = on_hand.get(medicine_id, 0) - quantity
+                    reserved[medicine_id] = reserved.get(medicine_id, 0) - held[(order_id, medicine_id)]
+        return shortfalls
+    
+    @staticmethod
+    def release_for_order(order):
+        """Drop every hold of an order, e.g. once it is confirmed or cancelled"""
+        deleted, _ = StockReservation.objects.filter(order=order).delete()
+        return deleted
+    
+    @classmethod
+    def release_expired(cls, now=None, batch_size=1000):
+        """
+        Delete expired reservations in batches so each transaction stays short
+        
+        Returns:
+            Number of reservations released
+        """
+        now = now or timezone.now()
+        released = 0
+        while True:
+            batch = list(
+                StockReservation.objects.filter(expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            deleted, _ = StockReservation.objects.filter(pk__in=batch).delete()
+            released += deleted
+            if len(batch) < batch_size:
+                break
+        
+        if released:
+            logger.info(f"Released {released} expired stock reservations")
+        return released
+
+
+class MedicineCatalogIndex:
+    """
+    In-memory prefix index over active medicines, behind the autocomplete API
+
+    Every word of a medicine's name, generic name and strength, and its NDC
+    number, is kept in one sorted list, so a lookup is a binary search rather
+    than a LIKE scan of the medicine table. Each process builds the index
+    once and rebuilds it when the 'catalog' change version moves on (see
+    inventory.signals) or after ``INVENTORY_CATALOG_INDEX_TTL`` seconds,
+    which bounds staleness from writes that bypass the signals.
+    
+    Stock changes too often to be indexed; it is read fresh for the matches.
+    """
+    
+    INDEXED_FIELDS = ('name', 'generic_name', 'strength', 'ndc_number', 'unit_price', 'is_active', 'is_available')
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 50
+    
+    _index = None
+    _lock = threading.Lock()
+    
+    @classmethod
+    def autocomplete(cls, term, limit=None, orderable_only=False):
+        """
+        Medicines matching ``term`` with their available stock, best first
+        
+        Args:
+            term: words that must each start a word of the medicine
+            limit: most results to return
+            orderable_only: leave out medicines that are not available to order
+        
+        Returns:
+            list of dicts with ``id``, ``name``, ``strength``, ``unit_price``,
+            ``is_available`` and ``available_stock``
+        """
+        entries = cls.search(term, limit, orderable_only)
+        if not entries:
+            return []
+        ids = [entry['id'] for entry in entries]
+        on_hand = dict(Medicine.objects.filter(pk__in=ids).values_list('pk', 'current_stock'))
+        reserved = StockReservationService.reserved_quantities(ids)
+        return [
+            {
+                'id': entry['id'],
+                'name': entry['name'],
+                'strength': entry['strength'],
+                'unit_price': entry['unit_price'],
+                'is_available': entry['is_available'],
+                'available_stock': max(0, on_hand.get(entry['id'], 0) - reserved.get(entry['id'], 0)),
+            }
+            for entry in entries
+        ]
+    
+    @classmethod
+    def search(cls, term, limit=None, orderable_only=False):
+        """Index entries matching ``term``: name prefix matches first, then by name"""
+        words = cls._words(term)
+        if not words:
+            return []
+        limit = max(1, min(int(limit or cls.DEFAULT_LIMIT), cls.MAX_LIMIT))
+        keys, key_ids, entries = cls._current()
+        
+        # Narrow with the longest word, then check the others per entry
+        anchor = max(words, key=len)
+        start = bisect_left(keys, anchor)
+        end = bisect_left(keys, anchor + '\uffff', start)
+        matches = []
+        for medicine_id in dict.fromkeys(key_ids[start:end]):
+            entry = entries[medicine_id]
+            if orderable_only and not entry['is_available']:
+                continue
+            if all(any(token.startswith(word) for token in entry['tokens']) for word in words):
+                matches.append(entry)
+        
+        phrase = ' '.join(words)
+        matches.sort(key=lambda entry: (not entry['sort_name'].startswith(phrase), entry['sort_name'], entry['id']))
+        return matches[:limit]
+    
+    @classmethod
+    def invalidate(cls):
+        """Drop this process's index; the next search rebuilds it"""
+        with cls._lock:
+            cls._index = None
+    
+    @staticmethod
+    def _words(text):
+        return re.findall(r'\w+', (text or '').casefold())
+    
+    @classmethod
+    def _current(cls):
+        from common.services import ChangeVersionService
+        
+        scope = ChangeVersionService.CATALOG_SCOPE
+        version = ChangeVersionService.get_versions([scope])[scope]
+        ttl = getattr(settings, 'INVENTORY_CATALOG_INDEX_TTL', 600)
+        index = cls._index
+        if index is not None and index['version'] == version and time.monotonic() - index['built_at'] < ttl:
+            return index['keys'], index['key_ids'], index['entries']
+        
+        with cls._lock:
+            index = cls._index
+            if index is None or index['version'] != version or time.monotonic() - index['built_at'] >= ttl:
+                index = cls._build(version)
+                cls._index = index
+        return index['keys'], index['key_ids'], index['entries']
+    
+    @classmethod
+    def _build(cls, version):
+        entries = {}
+        postings = []
+        rows = Medicine.objects.filter(is_active=True).values_list(
+            'id', 'name', 'generic_name', 'strength', 'ndc_number', 'unit_price', 'is_available'
+        )
+        for medicine_id, name, generic_name, strength, ndc_number, unit_price, is_available in rows.iterator():
+            tokens = tuple(dict.fromkeys(cls._words(f'{name} {generic_name} {strength} {ndc_number}')))
+            entries[medicine_id] = {
+                'id': medicine_id,
+                'name': name,
+                'strength': strength,
+                'unit_price': unit_price,
+                'is_available': is_available,
+                'tokens': tokens,
+                'sort_name': ' '.join(cls._words(name)),
+            }
+            postings.extend((token, medicine_id) for token in tokens)
+        
+        postings.sort()
+        logger.info(f"Built medicine catalog index v{version}: {len(entries)} medicines, {len(postings)} words")
+        return {
+            'version': version,
+            'built_at': time.monotonic(),
+            'keys': [token for token, _ in postings],
+            'key_ids': [medicine_id for _, medicine_id in postings],
+            'entries': entries,
+        }
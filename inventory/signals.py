@@ -1,15 +1,22 @@
 """
 Signals for inventory management
 """
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.db.models import F
+from common.services import ChangeVersionService
 from .models import Medicine, StockMovement
-from common.services import NotificationService
+from .services import MedicineCatalogIndex, StockAlertService, StockLedgerService
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Fields whose changes can move a medicine into or out of low stock
+STOCK_ALERT_FIELDS = ('current_stock', 'reorder_point', 'is_active')
+
+# Fields held by the autocomplete catalog index
+CATALOG_FIELDS = MedicineCatalogIndex.INDEXED_FIELDS
+
 
 @receiver(pre_save, sender=Medicine)
 def ensure_non_negative_stock(sender, instance, **kwargs):
@@ -25,34 +32,31 @@ def ensure_non_negative_stock(sender, instance, **kwargs):
 @receiver(post_save, sender=Medicine)
 def check_stock_levels(sender, instance, created, **kwargs):
     """
-    Check stock levels after medicine is saved and create notifications if low
+    Check stock levels after medicine is saved and create notifications if low.
+    Saves that leave stock, reorder point and active flag untouched are skipped.
     """
-    try:
-        # Only check if medicine is active and stock is low
-        if instance.is_active and instance.current_stock <= instance.reorder_point:
-            NotificationService.notify_low_stock(instance, instance.current_stock)
-            
-            # Create or update reorder alert if not exists
-            from .models import ReorderAlert
-            alert, created = ReorderAlert.objects.get_or_create(
-                medicine=instance,
-                is_processed=False,
-                defaults={
-                    'current_stock': instance.current_stock,
-                    'reorder_point': instance.reorder_point,
-                    'suggested_quantity': instance.reorder_point * 2,
-                    'priority': 'urgent' if instance.current_stock == 0 else 'high' if instance.current_stock <= instance.reorder_point / 2 else 'medium'
-                }
-            )
-            
-            if not created:
-                # Update existing alert
-                alert.current_stock = instance.current_stock
-                alert.priority = 'urgent' if instance.current_stock == 0 else 'high' if instance.current_stock <= instance.reorder_point / 2 else 'medium'
-                alert.save()
-    
-    except Exception as e:
-        logger.error(f"Error checking stock levels for {instance.name}: {e}")
+    if created or set(STOCK_ALERT_FIELDS) & set(instance.changed_fields):
+        StockAlertService.check_medicine(instance)
+        ChangeVersionService.bump(ChangeVersionService.STOCK_SCOPE)
+
+
+@receiver(post_save, sender=Medicine)
+def bump_catalog_version(sender, instance, created, **kwargs):
+    """
+    Have every process rebuild its catalog index after a name, price or
+    availability change; stock-only saves leave the index alone
+    """
+    if created or set(CATALOG_FIELDS) & set(instance.changed_fields):
+        ChangeVersionService.bump(ChangeVersionService.CATALOG_SCOPE)
+
+
+@receiver(post_delete, sender=Medicine)
+def bump_stock_version_on_delete(sender, instance, **kwargs):
+    """
+    Invalidate ETags of payloads that count medicines by stock level, and
+    catalog indexes that still list the medicine
+    """
+    ChangeVersionService.bump(ChangeVersionService.STOCK_SCOPE, ChangeVersionService.CATALOG_SCOPE)
 
 
 @receiver(post_save, sender=StockMovement)
@@ -65,13 +69,9 @@ def update_medicine_stock(sender, instance, created, **kwargs):
             medicine = instance.medicine
             
             # Update stock based on movement type
-            # Ensure we always use the absolute value for calculations
-            if instance.movement_type in ['in', 'return']:
-                medicine.current_stock += abs(instance.quantity)
-            elif instance.movement_type in ['out', 'damage', 'expired']:
-                # Prevent negative stock - use max(0, ...) to ensure stock never goes below 0
-                new_stock = medicine.current_stock - abs(instance.quantity)
-                medicine.current_stock = max(0, new_stock)
+            # Prevent negative stock - use max(0, ...) to ensure stock never goes below 0
+            delta = StockLedgerService.stock_delta(instance)
+            medicine.current_stock = max(0, medicine.current_stock + delta)
             
             medicine.save()
             # Note: medicine.save() triggers the check_stock_levels signal
@@ -5,14 +5,17 @@ Comprehensive unit tests for the inventory module
 from django.test import TestCase, Client
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from decimal import Decimal
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 import json
 
 from .models import (
     Category, Manufacturer, Medicine, StockMovement, 
-    ReorderAlert, MedicineImage
+    ReorderAlert, MedicineImage, StockReservation
 )
+from .services import MedicineCatalogIndex, StockLedgerService, StockReservationService
+from orders.models import Order
 from accounts.models import User
 
 User = get_user_model()
@@ -219,6 +222,176 @@ class StockMovementModelTests(TestCase):
         self.assertEqual(str(movement), expected_str)
 
 
+class StockLedgerServiceTests(TestCase):
+    """Test cases for StockLedgerService"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            role='pharmacist_admin'
+        )
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicines = [
+            Medicine.objects.create(
+                name=f'Medicine {i}',
+                category=self.category,
+                manufacturer=self.manufacturer,
+                unit_price=Decimal('25.50'),
+                cost_price=Decimal('15.00'),
+                current_stock=100,
+                reorder_point=20,
+                ndc_number=f'0001-000{i}'
+            )
+            for i in range(5)
+        ]
+    
+    def test_post_applies_net_deltas_in_one_update(self):
+        """Test movements are saved and stock is updated with a fixed number of queries"""
+        movements = [
+            StockMovement(medicine=medicine, movement_type='out', quantity=-10, created_by=self.user)
+            for medicine in self.medicines
+        ]
+        movements.append(StockMovement(
+            medicine=self.medicines[0], movement_type='return', quantity=4, created_by=self.user
+        ))
+        movements.append(StockMovement(
+            medicine=self.medicines[1], movement_type='adjustment', quantity=50, created_by=self.user
+        ))
+        
+        # Savepoint, bulk insert, stock update, release
+        with self.assertNumQueries(4):
+            StockLedgerService.post(movements)
+        
+        self.assertEqual(StockMovement.objects.count(), 7)
+        stock = dict(Medicine.objects.values_list('pk', 'current_stock'))
+        self.assertEqual(stock[self.medicines[0].pk], 94)
+        self.assertEqual(stock[self.medicines[1].pk], 90)
+        self.assertEqual(stock[self.medicines[4].pk], 90)
+    
+    def test_post_clamps_stock_at_zero_and_checks_low_stock_on_commit(self):
+        """Test stock never goes negative and reorder alerts follow the commit"""
+        with self.captureOnCommitCallbacks(execute=True):
+            StockLedgerService.post([
+                StockMovement(medicine=self.medicines[0], movement_type='damage', quantity=150, created_by=self.user)
+            ])
+        
+        self.medicines[0].refresh_from_db()
+        self.assertEqual(self.medicines[0].current_stock, 0)
+        self.assertTrue(ReorderAlert.objects.filter(medicine=self.medicines[0], priority='urgent').exists())
+
+
+class StockReservationServiceTests(TestCase):
+    """Test cases for StockReservationService"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            role='sales_rep'
+        )
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=self.category,
+            manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=10
+        )
+        self.order = Order.objects.create(
+            sales_rep=self.user,
+            customer_name='John Doe',
+            subtotal=Decimal('51.00'),
+            total_amount=Decimal('51.00')
+        )
+    
+    def test_expired_reservations_stop_counting_and_are_swept(self):
+        """Test only live holds reduce available stock and the sweeper drops expired ones"""
+        now = timezone.now()
+        StockReservationService.reserve(self.order, [(self.medicine, 4)], now=now - timedelta(days=2))
+        StockReservationService.reserve(self.order, [(self.medicine, 3)], now=now)
+        self.assertEqual(self.medicine.available_stock, 7)
+        
+        released = StockReservationService.release_expired(now=now, batch_size=1)
+        
+        self.assertEqual(released, 1)
+        self.assertEqual(StockReservation.objects.get().quantity, 3)
+        self.assertEqual(self.medicine.available_stock, 7)
+
+
+class MedicineCatalogIndexTests(TestCase):
+    """Test cases for the medicine autocomplete index"""
+    
+    def setUp(self):
+        """Set up test data"""
+        MedicineCatalogIndex.invalidate()
+        self.user = User.objects.create_user(username='testuser', password='testpass123', role='sales_rep')
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.amoxicillin = self._medicine('Amoxicillin', 'Amoxicillin trihydrate', '500mg', '0001')
+            self.co_amoxiclav = self._medicine('Co-Amoxiclav', 'Amoxicillin clavulanate', '625mg', '0002')
+            self.ampicillin = self._medicine('Ampicillin', '', '250mg', '0003', is_available=False)
+            self._medicine('Amlodipine', '', '5mg', '0004', is_active=False)
+    
+    def tearDown(self):
+        MedicineCatalogIndex.invalidate()
+    
+    def _medicine(self, name, generic_name, strength, ndc_number, **fields):
+        return Medicine.objects.create(
+            name=name, generic_name=generic_name, strength=strength, ndc_number=ndc_number,
+            category=self.category, manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'), cost_price=Decimal('15.00'), current_stock=10, **fields
+        )
+    
+    def test_prefix_search_matches_any_word_and_ranks_name_prefixes_first(self):
+        """Test every term word must start a word of the name, generic name or strength"""
+        names = [entry['name'] for entry in MedicineCatalogIndex.search('amox')]
+        self.assertEqual(names, ['Amoxicillin', 'Co-Amoxiclav'])
+        self.assertEqual([entry['name'] for entry in MedicineCatalogIndex.search('amox 625')], ['Co-Amoxiclav'])
+        self.assertEqual([entry['name'] for entry in MedicineCatalogIndex.search('am')], ['Amoxicillin', 'Ampicillin', 'Co-Amoxiclav'])
+        self.assertEqual([entry['name'] for entry in MedicineCatalogIndex.search('am', orderable_only=True)], ['Amoxicillin', 'Co-Amoxiclav'])
+        self.assertEqual(MedicineCatalogIndex.search('  '), [])
+    
+    def test_index_is_reused_until_the_catalog_version_moves(self):
+        """Test stock-only saves keep the index and catalog changes rebuild it"""
+        MedicineCatalogIndex.search('amox')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.amoxicillin.current_stock = 3
+            self.amoxicillin.save()
+        with self.assertNumQueries(1):
+            MedicineCatalogIndex.search('amox')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.amoxicillin.name = 'Amoxil'
+            self.amoxicillin.save()
+        self.assertEqual([entry['name'] for entry in MedicineCatalogIndex.search('amox')], ['Amoxil', 'Co-Amoxiclav'])
+    
+    def test_autocomplete_api_returns_live_available_stock(self):
+        """Test the API reports price and stock net of live reservations"""
+        order = Order.objects.create(sales_rep=self.user, customer_name='John Doe',
+                                     subtotal=Decimal('51.00'), total_amount=Decimal('51.00'))
+        StockReservationService.reserve(order, [(self.amoxicillin, 4)])
+        client = Client()
+        client.force_login(self.user)
+        
+        response = client.get('/inventory/api/medicines/autocomplete/', {'q': 'amoxicillin 500', 'orderable': '1'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [{
+            'id': self.amoxicillin.id, 'name': 'Amoxicillin', 'strength': '500mg',
+            'unit_price': 25.5, 'is_available': True, 'available_stock': 6,
+        }])
+
+
 class ReorderAlertModelTests(TestCase):
     """Test cases for ReorderAlert model"""
     
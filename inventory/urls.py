@@ -33,6 +33,7 @@ urlpatterns = [
     
     # API endpoints
     path('api/medicines/', views.MedicineListAPIView.as_view(), name='api_medicine_list'),
+    path('api/medicines/autocomplete/', views.MedicineAutocompleteAPIView.as_view(), name='api_medicine_autocomplete'),
     path('api/medicines/<int:pk>/', views.MedicineDetailAPIView.as_view(), name='api_medicine_detail'),
     path('api/stock-movements/', views.StockMovementAPIView.as_view(), name='api_stock_movements'),
     path('api/reorder-alerts/', views.ReorderAlertAPIView.as_view(), name='api_reorder_alerts'),
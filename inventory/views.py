@@ -15,7 +15,10 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 
+from common.exports import CSVExportMixin
+from common.pagination import InvalidCursor, KeysetPaginator, KeysetPaginationMixin, keyset_page_data
 from .models import Medicine, Category, Manufacturer, StockMovement, ReorderAlert, MedicineImage
+from .services import MedicineCatalogIndex
 
 
 # Dashboard View
@@ -242,12 +245,22 @@ class CategoryEditView(LoginRequiredMixin, UpdateView):
 
 
 # Stock Management Views
-class StockMovementListView(LoginRequiredMixin, ListView):
+class StockMovementListView(LoginRequiredMixin, KeysetPaginationMixin, CSVExportMixin, ListView):
     """List all stock movements"""
     model = StockMovement
     template_name = 'inventory/stock_movement_list.html'
     context_object_name = 'movements'
     paginate_by = 20
+    export_columns = [
+        ('Created', 'created_at'),
+        ('Medicine', 'medicine__name'),
+        ('Movement type', 'movement_type'),
+        ('Quantity', 'quantity'),
+        ('Reference number', 'reference_number'),
+        ('Notes', 'notes'),
+        ('Created by', 'created_by__username'),
+    ]
+    export_filename = 'stock-movements'
     
     def get_queryset(self):
         queryset = StockMovement.objects.select_related('medicine', 'created_by').order_by('-created_at')
@@ -268,8 +281,6 @@ class StockMovementListView(LoginRequiredMixin, ListView):
         context = super().get_context_data(**kwargs)
         from urllib.parse import urlencode
         
-        # Get all medicines for filter dropdown
-        context['medicines'] = Medicine.objects.filter(is_active=True).order_by('name')
         context['movement_types'] = StockMovement.MOVEMENT_TYPES
         
         # Get current filter values
@@ -277,6 +288,10 @@ class StockMovementListView(LoginRequiredMixin, ListView):
         current_movement_type = self.request.GET.get('movement_type', '')
         
         context['current_medicine'] = current_medicine
+        # The medicine filter is an autocomplete picker; only the chosen medicine is loaded
+        context['current_medicine_obj'] = (
+            Medicine.objects.filter(pk=current_medicine).first() if current_medicine.isdigit() else None
+        )
         context['current_movement_type'] = current_movement_type
         
         # Build query string for pagination (excluding 'page' parameter)
@@ -498,6 +513,31 @@ class MedicineListAPIView(APIView):
         })
 
 
+class MedicineAutocompleteAPIView(APIView):
+    """
+    API view for medicine pickers: medicines whose words start with ``q``,
+    served from the in-memory catalog index. ``orderable=1`` leaves out
+    medicines that cannot be ordered.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        try:
+            limit = int(request.GET.get('limit', MedicineCatalogIndex.DEFAULT_LIMIT))
+        except ValueError:
+            return Response({'error': 'limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = MedicineCatalogIndex.autocomplete(
+            request.GET.get('q', ''), limit=limit, orderable_only=request.GET.get('orderable') == '1'
+        )
+        return Response({
+            'results': [
+                {**result, 'unit_price': float(result['unit_price'])}
+                for result in results
+            ],
+        })
+
+
 class MedicineDetailAPIView(APIView):
     """API view for medicine detail"""
     permission_classes = [IsAuthenticated]
@@ -516,6 +556,7 @@ class MedicineDetailAPIView(APIView):
                 'unit_price': float(medicine.unit_price),
                 'cost_price': float(medicine.cost_price),
                 'current_stock': medicine.current_stock,
+                'available_stock': medicine.available_stock,
                 'minimum_stock_level': medicine.minimum_stock_level,
                 'maximum_stock_level': medicine.maximum_stock_level,
                 'reorder_point': medicine.reorder_point,
@@ -547,12 +588,14 @@ class StockMovementAPIView(APIView):
         if medicine_id:
             movements = movements.filter(medicine_id=medicine_id)
         
-        # Pagination
-        page = int(request.GET.get('page', 1))
-        per_page = int(request.GET.get('per_page', 20))
+        # Cursor pagination: deep pages cost the same as the first
+        per_page = min(int(request.GET.get('per_page', 20)), 100)
         
-        paginator = Paginator(movements, per_page)
-        page_obj = paginator.get_page(page)
+        paginator = KeysetPaginator(movements, per_page)
+        try:
+            page_obj = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         movements_data = []
         for movement in page_obj:
@@ -572,14 +615,7 @@ class StockMovementAPIView(APIView):
         
         return Response({
             'movements': movements_data,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total_pages': paginator.num_pages,
-                'total_count': paginator.count,
-                'has_next': page_obj.has_next(),
-                'has_previous': page_obj.has_previous(),
-            }
+            'pagination': keyset_page_data(page_obj, include_count=request.GET.get('count') == 'true'),
         })
 
 
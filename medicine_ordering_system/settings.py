@@ -251,6 +251,73 @@ CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
 ]
 
+# Analytics
+# Seconds a medicine's daily sales series stays in the per-process cache
+ANALYTICS_SERIES_CACHE_TTL = 300
+# Longest a process serves cached model evaluation metrics; new and deleted
+# forecasts invalidate them in every process at once
+ANALYTICS_METRICS_CACHE_TTL = 15 * 60
+# Running demand statistics: EWMA smoothing factor, and how many standard
+# deviations above the baseline a day must be (after enough closed periods)
+# before it is flagged as a demand anomaly
+ANALYTICS_EWMA_ALPHA = 0.3
+ANALYTICS_ANOMALY_SIGMAS = 3
+ANALYTICS_ANOMALY_MIN_PERIODS = 7
+# Retention for superseded forecasts and optimizations (see
+# analytics.services.ForecastRetentionService and the purge_forecasts command)
+ANALYTICS_FORECAST_RETENTION = {
+    'archive_after_days': 30,
+    'unevaluated_grace_days': 180,
+    'optimization_retention_days': 30,
+    'history_retention_days': 730,
+    'batch_size': 500,
+}
+
+# Inventory
+# Seconds a pending order holds its stock before the reservation lapses
+# (see inventory.services.StockReservationService and the
+# release_expired_reservations command)
+INVENTORY_RESERVATION_TTL = 24 * 60 * 60
+# Longest a process serves medicine autocomplete from its catalog index
+# without a rebuild; catalog changes made through the ORM rebuild it at once
+# (see inventory.services.MedicineCatalogIndex)
+INVENTORY_CATALOG_INDEX_TTL = 10 * 60
+
+# Orders
+# Seconds a sales rep's cart badge count is served from cache. Cart changes
+# refresh it in the worker that made them; with a per-process cache other
+# workers may show the old count for up to this long.
+CART_BADGE_CACHE_TTL = 60
+# Seconds a pharmacist's claim on a prescription from the verification queue
+# lasts without a heartbeat before other pharmacists can take it
+PRESCRIPTION_CLAIM_LEASE_SECONDS = 5 * 60
+
+# Change feed (common.views.ChangeFeedStreamView)
+# Seconds one event stream stays open before the browser reconnects. Each open
+# stream occupies a worker, so the default of 0 answers with whatever is new and
+# lets the browser reconnect after CHANGE_FEED_RETRY_MS, which is safe on sync
+# workers. Raise it only with a threaded worker class (e.g.
+# GUNICORN_WORKER_CLASS=gthread) to hold streams open.
+CHANGE_FEED_STREAM_SECONDS = int(os.environ.get('CHANGE_FEED_STREAM_SECONDS', 0))
+# Seconds between event table checks while a stream is open
+CHANGE_FEED_POLL_SECONDS = 1
+# Milliseconds the browser waits before reconnecting a closed stream
+CHANGE_FEED_RETRY_MS = 3000
+# Seconds events are kept (see the purge_change_events command)
+CHANGE_FEED_RETENTION = 24 * 60 * 60
+# Longest a polling API keeps answering 304 from unchanged change versions
+# (see common.services.ChangeVersionService)
+CHANGE_VERSION_ETAG_TTL = 5 * 60
+
+# Idempotency keys (common.idempotency)
+# Seconds a request's key and stored response are kept for replaying retries
+# (see the purge_idempotency_keys command)
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# Seconds after which a key whose first request never finished (e.g. its
+# worker was killed) is treated as abandoned and may run again; keep it above
+# the gunicorn timeout
+IDEMPOTENCY_IN_PROGRESS_TIMEOUT = 2 * 60
+
 # Celery Configuration
 CELERY_BROKER_URL = 'redis://localhost:6379'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379'
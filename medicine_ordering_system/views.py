@@ -13,6 +13,7 @@ from orders.models import Order
 from inventory.models import Medicine, StockMovement, Category, Manufacturer
 from transactions.models import Transaction
 from analytics.models import SystemMetrics
+from common.dates import date_range_lookups
 
 
 class LandingPageView(TemplateView):
@@ -133,7 +134,7 @@ class HomeView(LoginRequiredMixin, TemplateView):
     
     def get_admin_context(self):
         """Admin-specific dashboard data"""
-        today = timezone.now().date()
+        today = timezone.localdate()
         week_ago = today - timedelta(days=7)
         month_ago = today - timedelta(days=30)
         
@@ -141,9 +142,9 @@ class HomeView(LoginRequiredMixin, TemplateView):
             'total_users': User.objects.count(),
             'total_orders': Order.objects.count(),
             'total_medicines': Medicine.objects.count(),
-            'recent_orders': Order.objects.filter(created_at__date=today).count(),
-            'weekly_orders': Order.objects.filter(created_at__date__gte=week_ago).count(),
-            'monthly_orders': Order.objects.filter(created_at__date__gte=month_ago).count(),
+            'recent_orders': Order.objects.filter(**date_range_lookups('created_at', today, today)).count(),
+            'weekly_orders': Order.objects.filter(**date_range_lookups('created_at', start=week_ago)).count(),
+            'monthly_orders': Order.objects.filter(**date_range_lookups('created_at', start=month_ago)).count(),
             'total_revenue': Transaction.objects.aggregate(total=Sum('amount'))['total'] or 0,
             'low_stock_medicines': Medicine.objects.filter(stock_quantity__lt=10).count(),
             'pending_orders': Order.objects.filter(status='pending').count(),
@@ -151,29 +152,29 @@ class HomeView(LoginRequiredMixin, TemplateView):
     
     def get_pharmacist_admin_context(self):
         """Pharmacist/Admin-specific dashboard data - shows all orders from sales reps"""
-        today = timezone.now().date()
+        today = timezone.localdate()
         week_ago = today - timedelta(days=7)
         
         return {
             'total_medicines': Medicine.objects.count(),
             'low_stock_medicines': Medicine.objects.filter(current_stock__lt=10).count(),
-            'recent_orders': Order.objects.filter(created_at__date=today).count(),
-            'weekly_orders': Order.objects.filter(created_at__date__gte=week_ago).count(),
+            'recent_orders': Order.objects.filter(**date_range_lookups('created_at', today, today)).count(),
+            'weekly_orders': Order.objects.filter(**date_range_lookups('created_at', start=week_ago)).count(),
             'pending_orders': Order.objects.filter(status='pending').count(),
-            'recent_stock_movements': StockMovement.objects.filter(created_at__date=today).count(),
+            'recent_stock_movements': StockMovement.objects.filter(**date_range_lookups('created_at', today, today)).count(),
             'all_orders': Order.objects.count(),  # All orders from sales reps
-            'today_orders': Order.objects.filter(created_at__date=today).count(),
+            'today_orders': Order.objects.filter(**date_range_lookups('created_at', today, today)).count(),
             'pending_orders_count': Order.objects.filter(status='pending').count(),
         }
     
     def get_sales_rep_context(self):
         """Sales Representative-specific dashboard data"""
         user = self.request.user
-        today = timezone.now().date()
+        today = timezone.localdate()
         
         return {
             'user_orders': Order.objects.filter(sales_rep=user).count(),
-            'recent_orders': Order.objects.filter(sales_rep=user, created_at__date=today).count(),
+            'recent_orders': Order.objects.filter(sales_rep=user, **date_range_lookups('created_at', today, today)).count(),
             'pending_orders': Order.objects.filter(sales_rep=user, status='pending').count(),
             'completed_orders': Order.objects.filter(sales_rep=user, status='delivered').count(),
         }
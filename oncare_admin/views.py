@@ -39,6 +39,7 @@ class AdminDashboardView(LoginRequiredMixin, AdminRequiredMixin, TemplateView):
         # Get system statistics
         from accounts.models import User
         from orders.models import Order
+        from orders.services import OrderStatusCounterService
         from inventory.models import Medicine
         from transactions.models import Transaction
         
@@ -48,9 +49,10 @@ class AdminDashboardView(LoginRequiredMixin, AdminRequiredMixin, TemplateView):
         new_users_today = User.objects.filter(date_joined__date=timezone.now().date()).count()
         
         # Order statistics
-        total_orders = Order.objects.count()
-        pending_orders = Order.objects.filter(status='pending').count()
-        completed_orders = Order.objects.filter(status='delivered').count()
+        order_counts = OrderStatusCounterService.get_counts()
+        total_orders = order_counts['total']
+        pending_orders = order_counts['pending']
+        completed_orders = order_counts['delivered']
         
         # Inventory statistics
         total_medicines = Medicine.objects.filter(is_active=True).count()
@@ -447,25 +449,40 @@ class DashboardDataAPIView(APIView):
         if not request.user.is_admin:
             return Response({'error': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
         
+        from common.services import ChangeVersionService
+        
+        # Nothing to recount if no order, payment, stock or user has changed.
+        # Today's date is part of the ETag because of the daily and monthly figures.
+        etag = ChangeVersionService.etag(
+            [ChangeVersionService.ORDERS_SCOPE, ChangeVersionService.STOCK_SCOPE, ChangeVersionService.USERS_SCOPE],
+            timezone.localdate(),
+        )
+        not_modified = ChangeVersionService.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        
         # Get dashboard metrics
         from accounts.models import User
-        from orders.models import Order
+        from orders.services import OrderStatusCounterService
         from inventory.models import Medicine
         from transactions.models import Transaction
         
-        today = timezone.now().date()
+        from common.dates import date_range_lookups
+        
+        today = timezone.localdate()
         this_month = today.replace(day=1)
+        order_counts = OrderStatusCounterService.get_counts()
         
         data = {
             'users': {
                 'total': User.objects.count(),
                 'active': User.objects.filter(is_active=True).count(),
-                'new_today': User.objects.filter(date_joined__date=today).count(),
+                'new_today': User.objects.filter(**date_range_lookups('date_joined', today, today)).count(),
             },
             'orders': {
-                'total': Order.objects.count(),
-                'pending': Order.objects.filter(status='pending').count(),
-                'completed': Order.objects.filter(status='delivered').count(),
+                'total': order_counts['total'],
+                'pending': order_counts['pending'],
+                'completed': order_counts['delivered'],
             },
             'inventory': {
                 'total_medicines': Medicine.objects.filter(is_active=True).count(),
@@ -484,12 +501,14 @@ class DashboardDataAPIView(APIView):
                 )['total'] or 0),
                 'monthly': float(Transaction.objects.filter(
                     status='completed',
-                    created_at__date__gte=this_month
+                    **date_range_lookups('created_at', start=this_month)
                 ).aggregate(total=Sum('amount'))['total'] or 0),
             }
         }
         
-        return Response(data)
+        response = Response(data)
+        response['ETag'] = etag
+        return response
 
 
 class SystemMetricsAPIView(APIView):
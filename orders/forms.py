@@ -26,93 +26,7 @@ class OrderForm(forms.ModelForm):
 
 
 class OrderWithItemsForm(forms.ModelForm):
-    """Form for creating orders with medicine selection"""
-    
-    # Medicine selection fields
-    medicine_1 = forms.ModelChoiceField(
-        queryset=Medicine.objects.none(),
-        required=False,
-        empty_label="Select Medicine",
-        widget=forms.Select(attrs={'class': 'form-select'})
-    )
-    quantity_1 = forms.IntegerField(
-        required=False,
-        min_value=1,
-        widget=forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'placeholder': 'Quantity'})
-    )
-    unit_1 = forms.CharField(
-        required=False,
-        initial='boxes',
-        widget=forms.HiddenInput()  # Hidden since it's always 'boxes'
-    )
-    
-    unit_2 = forms.CharField(
-        required=False,
-        initial='boxes',
-        widget=forms.HiddenInput()  # Hidden since it's always 'boxes'
-    )
-    medicine_2 = forms.ModelChoiceField(
-        queryset=Medicine.objects.none(),
-        required=False,
-        empty_label="Select Medicine",
-        widget=forms.Select(attrs={'class': 'form-select'})
-    )
-    quantity_2 = forms.IntegerField(
-        required=False,
-        min_value=1,
-        widget=forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'placeholder': 'Quantity'})
-    )
-    
-    unit_3 = forms.CharField(
-        required=False,
-        initial='boxes',
-        widget=forms.HiddenInput()  # Hidden since it's always 'boxes'
-    )
-    medicine_3 = forms.ModelChoiceField(
-        queryset=Medicine.objects.none(),
-        required=False,
-        empty_label="Select Medicine",
-        widget=forms.Select(attrs={'class': 'form-select'})
-    )
-    quantity_3 = forms.IntegerField(
-        required=False,
-        min_value=1,
-        widget=forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'placeholder': 'Quantity'})
-    )
-    
-    unit_4 = forms.CharField(
-        required=False,
-        initial='boxes',
-        widget=forms.HiddenInput()  # Hidden since it's always 'boxes'
-    )
-    medicine_4 = forms.ModelChoiceField(
-        queryset=Medicine.objects.none(),
-        required=False,
-        empty_label="Select Medicine",
-        widget=forms.Select(attrs={'class': 'form-select'})
-    )
-    quantity_4 = forms.IntegerField(
-        required=False,
-        min_value=1,
-        widget=forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'placeholder': 'Quantity'})
-    )
-    
-    unit_5 = forms.CharField(
-        required=False,
-        initial='boxes',
-        widget=forms.HiddenInput()  # Hidden since it's always 'boxes'
-    )
-    medicine_5 = forms.ModelChoiceField(
-        queryset=Medicine.objects.none(),
-        required=False,
-        empty_label="Select Medicine",
-        widget=forms.Select(attrs={'class': 'form-select'})
-    )
-    quantity_5 = forms.IntegerField(
-        required=False,
-        min_value=1,
-        widget=forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'placeholder': 'Quantity'})
-    )
+    """Form for the details of a new order; its medicines come from OrderLineFormSet"""
     
     class Meta:
         model = Order
@@ -124,37 +38,56 @@ class OrderWithItemsForm(forms.ModelForm):
             'payment_status': forms.Select(attrs={'class': 'form-select'}),
             'customer_notes': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
         }
+
+
+class OrderLineForm(forms.Form):
+    """
+    One medicine line of a new order. The medicine is picked with the
+    catalog autocomplete, which fills in its id, so the page never renders
+    the full medicine list.
+    """
     
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # Set the queryset for medicine fields
-        medicine_queryset = Medicine.objects.filter(is_active=True, is_available=True).order_by('name')
-        self.fields['medicine_1'].queryset = medicine_queryset
-        self.fields['medicine_2'].queryset = medicine_queryset
-        self.fields['medicine_3'].queryset = medicine_queryset
-        self.fields['medicine_4'].queryset = medicine_queryset
-        self.fields['medicine_5'].queryset = medicine_queryset
+    medicine = forms.ModelChoiceField(
+        queryset=Medicine.objects.filter(is_active=True, is_available=True),
+        widget=forms.HiddenInput(attrs={'class': 'medicine-id'}),
+        error_messages={'invalid_choice': 'That medicine is no longer available.'},
+    )
+    # Text shown in the picker; only used to redisplay the line
+    medicine_label = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={
+            'class': 'form-control medicine-search',
+            'placeholder': 'Search medicines',
+            'autocomplete': 'off',
+        })
+    )
+    quantity = forms.IntegerField(
+        min_value=1,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'min': 1, 'placeholder': 'Quantity'})
+    )
+
+
+class BaseOrderLineFormSet(forms.BaseFormSet):
     
     def clean(self):
-        cleaned_data = super().clean()
-        
-        # Check if at least one medicine is selected
-        medicines = []
-        for i in range(1, 6):
-            medicine = cleaned_data.get(f'medicine_{i}')
-            quantity = cleaned_data.get(f'quantity_{i}')
-            
-            if medicine and quantity:
-                medicines.append((medicine, quantity))
-            elif medicine and not quantity:
-                raise forms.ValidationError(f"Please enter quantity for {medicine.name}")
-            elif not medicine and quantity:
-                raise forms.ValidationError("Please select a medicine for the quantity entered")
-        
-        if not medicines:
+        super().clean()
+        if any(self.errors):
+            return
+        if not self.lines():
             raise forms.ValidationError("Please select at least one medicine for the order")
-        
-        return cleaned_data
+    
+    def lines(self):
+        """The filled-in lines as OrderPlacementService.place_order expects them"""
+        return [
+            {'medicine': form.cleaned_data['medicine'], 'quantity': form.cleaned_data['quantity'], 'unit': 'boxes'}
+            for form in self.forms
+            if form.cleaned_data.get('medicine') and form.cleaned_data.get('quantity')
+        ]
+
+
+OrderLineFormSet = forms.formset_factory(
+    OrderLineForm, formset=BaseOrderLineFormSet, extra=0, min_num=1, validate_min=True, max_num=100, validate_max=True
+)
 
 class OrderItemForm(forms.ModelForm):
     """Form for adding items to orders"""
@@ -181,6 +114,9 @@ class CartAddForm(forms.ModelForm):
 class OrderStatusUpdateForm(forms.ModelForm):
     """Form for updating order status"""
     
+    # The order version the user saw; saving against a newer version is a conflict
+    version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+    
     class Meta:
         model = Order
         fields = ['status', 'payment_status', 'internal_notes']
@@ -195,13 +131,22 @@ class OrderStatusUpdateForm(forms.ModelForm):
         self.fields['status'].choices = Order.STATUS_CHOICES
         self.fields['payment_status'].choices = Order.PAYMENT_STATUS_CHOICES
         
+        if self.instance and self.instance.pk:
+            self.fields['version'].initial = self.instance.version
+            
+            # Only offer the current status and the ones it may move to
+            allowed = {self.instance.status, *self.instance.next_statuses}
+            self.fields['status'].choices = [
+                choice for choice in Order.STATUS_CHOICES if choice[0] in allowed
+            ]
+        
         # Disable payment_status field if payment is not verified (not paid)
         if self.instance and self.instance.payment_status != 'paid':
             self.fields['payment_status'].widget.attrs['disabled'] = True
             self.fields['payment_status'].required = False
             
             # Remove 'delivered' from status choices if payment is not paid
-            status_choices = list(Order.STATUS_CHOICES)
+            status_choices = list(self.fields['status'].choices)
             status_choices = [choice for choice in status_choices if choice[0] != 'delivered']
             self.fields['status'].choices = status_choices
     
@@ -223,6 +168,67 @@ class OrderStatusUpdateForm(forms.ModelForm):
         
         return cleaned_data
 
+
+class OrderBulkStatusForm(forms.Form):
+    """Form for moving several selected orders to one status"""
+    order_ids = forms.Field(widget=forms.MultipleHiddenInput)
+    # No order can move back to pending
+    status = forms.ChoiceField(
+        choices=[choice for choice in Order.STATUS_CHOICES if choice[0] != 'pending'],
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    notes = forms.CharField(
+        required=False,
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Notes for the status history (optional)'})
+    )
+    
+    def clean_order_ids(self):
+        from .services import OrderBulkTransitionService
+        
+        value = self.cleaned_data['order_ids']
+        values = value if isinstance(value, (list, tuple)) else [value]
+        try:
+            order_ids = [int(order_id) for order_id in values]
+        except (TypeError, ValueError):
+            raise forms.ValidationError('Select orders from the list.')
+        if not order_ids:
+            raise forms.ValidationError('Select at least one order.')
+        if len(order_ids) > OrderBulkTransitionService.MAX_ORDERS:
+            raise forms.ValidationError(f'Select at most {OrderBulkTransitionService.MAX_ORDERS} orders at a time.')
+        return order_ids
+
+
+class PickListForm(forms.Form):
+    """Form choosing the orders a pick list or packing slips cover"""
+    status = forms.MultipleChoiceField(
+        required=False,
+        widget=forms.CheckboxSelectMultiple(attrs={'class': 'form-check-input'})
+    )
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+
+    def __init__(self, *args, **kwargs):
+        from .services import PickListService
+
+        super().__init__(*args, **kwargs)
+        status_names = dict(Order.STATUS_CHOICES)
+        self.fields['status'].choices = [(value, status_names[value]) for value in PickListService.STATUSES]
+        self.fields['status'].initial = list(PickListService.DEFAULT_STATUSES)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date_from = cleaned_data.get('date_from')
+        date_to = cleaned_data.get('date_to')
+        if date_from and date_to and date_from > date_to:
+            raise forms.ValidationError('The start date must not be after the end date.')
+        return cleaned_data
+
 class PrescriptionUploadForm(forms.ModelForm):
     """Form for uploading prescriptions"""
     
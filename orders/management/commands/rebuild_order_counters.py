@@ -0,0 +1,18 @@
+"""
+Recompute the order status counters from the orders table
+
+The counters are maintained as orders change; run this to repair them after
+bulk edits made outside the ORM or if they are suspected to have drifted.
+"""
+
+from django.core.management.base import BaseCommand
+
+from orders.services import OrderStatusCounterService
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-status order counters used by the dashboards'
+
+    def handle(self, *args, **options):
+        written = OrderStatusCounterService.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} order status counters"))
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:20
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderStatusCounter = apps.get_model('orders', 'OrderStatusCounter')
+    totals = defaultdict(int)
+    for row in Order.objects.values('sales_rep_id', 'status').annotate(total=Count('id')).order_by():
+        totals[('global', row['status'])] += row['total']
+        if row['sales_rep_id']:
+            totals[(f"sales_rep:{row['sales_rep_id']}", row['status'])] += row['total']
+    OrderStatusCounter.objects.bulk_create([
+        OrderStatusCounter(scope=scope, status=status, count=total)
+        for (scope, status), total in totals.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderStatusCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=40)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('confirmed', 'Confirmed'), ('processing', 'Processing'), ('ready_for_pickup', 'Ready for Pickup'), ('shipped', 'Shipped'), ('delivered', 'Delivered'), ('cancelled', 'Cancelled'), ('returned', 'Returned')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('scope', 'status')},
+            },
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='orders_orde_sales_r_098dd6_idx',
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['sales_rep', 'status', 'created_at'], name='orders_rep_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['sales_rep', 'created_at'], name='orders_rep_created_idx'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+
+# Trigram indexes over the same UPPER(column) expression Django's icontains
+# lookup compiles to on PostgreSQL, so '%term%' searches use the index
+SEARCH_INDEXES = [
+    ('orders_customer_name_trgm_idx', 'customer_name'),
+    ('orders_order_number_trgm_idx', 'order_number'),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, column in SEARCH_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON orders_order USING gin (UPPER({column}) gin_trgm_ops)'
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_date_range_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
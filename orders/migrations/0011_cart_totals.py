@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:43
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+
+
+def backfill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('orders', 'Cart')
+    for cart in Cart.objects.all():
+        totals = cart.items.aggregate(
+            item_count=Sum('quantity'),
+            subtotal=Sum(F('quantity') * F('medicine__unit_price'), output_field=DecimalField()),
+        )
+        cart.item_count = totals['item_count'] or 0
+        cart.subtotal = totals['subtotal'] or 0
+        cart.save(update_fields=['item_count', 'subtotal'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
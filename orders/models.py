@@ -1,10 +1,16 @@
-from django.db import models
+from django.db import models, transaction
 from django.core.validators import MinValueValidator
 from django.utils import timezone
+from contextlib import nullcontext
 from decimal import Decimal
+import logging
 
+from common.models import ChangeTrackingMixin
 
-class Order(models.Model):
+logger = logging.getLogger(__name__)
+
+
+class Order(ChangeTrackingMixin, models.Model):
     """
     Customer orders
     """
@@ -19,6 +25,18 @@ class Order(models.Model):
         ('returned', 'Returned'),
     ]
     
+    # Statuses an order may move to from each status
+    ALLOWED_TRANSITIONS = {
+        'pending': ['confirmed', 'cancelled'],
+        'confirmed': ['processing', 'ready_for_pickup', 'shipped', 'cancelled'],
+        'processing': ['ready_for_pickup', 'shipped', 'cancelled'],
+        'ready_for_pickup': ['shipped', 'delivered', 'cancelled'],
+        'shipped': ['delivered', 'returned'],
+        'delivered': ['returned'],
+        'cancelled': [],
+        'returned': [],
+    }
+    
     PAYMENT_STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('paid', 'Paid'),
@@ -29,6 +47,9 @@ class Order(models.Model):
     
     order_number = models.CharField(max_length=20, unique=True)
     sales_rep = models.ForeignKey('accounts.User', on_delete=models.CASCADE, related_name='sales_orders', null=True, blank=True)
+    # Key the sales rep's device gave an order taken offline; a resent batch
+    # finds the order it already created instead of placing it twice
+    client_reference = models.CharField(max_length=64, null=True, blank=True, editable=False)
     customer_name = models.CharField(max_length=100, default='')
     customer_phone = models.CharField(max_length=15, default='')
     customer_address = models.TextField(default='')
@@ -58,6 +79,13 @@ class Order(models.Model):
     prescription_verified = models.BooleanField(default=False)
     verified_by = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, blank=True, related_name='verified_prescriptions')
     verified_at = models.DateTimeField(null=True, blank=True)
+    # Pharmacist currently verifying the prescription, taken from the queue in
+    # PrescriptionQueueService; the claim lapses at the lease expiry unless renewed
+    verification_claimed_by = models.ForeignKey(
+        'accounts.User', on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='claimed_verifications', editable=False
+    )
+    verification_lease_expires_at = models.DateTimeField(null=True, blank=True, editable=False)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -70,21 +98,38 @@ class Order(models.Model):
     customer_notes = models.TextField(blank=True)
     internal_notes = models.TextField(blank=True)
     
+    # Bumped on every update; saves only apply to the version they loaded
+    version = models.PositiveIntegerField(default=0, editable=False)
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['order_number']),
-            models.Index(fields=['sales_rep', 'status']),
             models.Index(fields=['status', 'created_at']),
+            # Sales rep order lists, with and without a status filter
+            models.Index(fields=['sales_rep', 'status', 'created_at'], name='orders_rep_status_created_idx'),
+            models.Index(fields=['sales_rep', 'created_at'], name='orders_rep_created_idx'),
+            # Keyset pagination (common.pagination.KeysetPaginator)
+            models.Index(fields=['created_at', 'id']),
+            # Prescription verification queue: only unverified orders are indexed
+            models.Index(
+                fields=['created_at'], name='orders_rx_queue_idx',
+                condition=models.Q(prescription_required=True, prescription_verified=False)
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['sales_rep', 'client_reference'], name='orders_rep_client_reference_uniq'),
         ]
     
     def __str__(self):
         return f"Order {self.order_number} - {self.customer_name}"
     
-    def save(self, *args, **kwargs):
-        if not self.order_number:
-            self.order_number = self.generate_order_number()
-        super().save(*args, **kwargs)
+    def can_transition_to(self, status):
+        return status in self.ALLOWED_TRANSITIONS.get(self.status, [])
+    
+    @property
+    def next_statuses(self):
+        return self.ALLOWED_TRANSITIONS.get(self.status, [])
     
     def generate_order_number(self):
         import uuid
@@ -95,68 +140,201 @@ class Order(models.Model):
         return self.prescription_required and self.prescription_image
     
     def decrease_stock(self):
-        """Decrease stock for all items in this order"""
+        """
+        Decrease stock for all items in this order
+        
+        Raises:
+            InsufficientStockError: if units whose hold expired are no longer
+                available; no stock is moved in that case
+        """
+        from django.db import transaction
         from inventory.models import StockMovement
-        from django.utils import timezone
+        from inventory.services import StockLedgerService, StockReservationService
         
-        for item in self.items.all():
-            # Create stock movement record - the signal will handle stock decrease
-            # This prevents double-decrease and ensures stock doesn't go negative
-            StockMovement.objects.create(
-                medicine=item.medicine,
-                movement_type='out',
-                quantity=-item.quantity,  # Negative for stock out
-                reference_number=self.order_number,
-                notes=f'Order {self.order_number} - {item.quantity} units sold',
-                created_by=self.sales_rep
+        # The held units become stock movements in the same transaction;
+        # units whose hold expired must still be free, or nothing is written
+        with transaction.atomic():
+            items = list(self.items.select_related('medicine'))
+            shortfall = StockReservationService.check_confirmations(items).get(self.pk)
+            if shortfall:
+                raise shortfall
+            StockReservationService.release_for_order(self)
+            StockLedgerService.post(
+                StockMovement(
+                    medicine_id=item.medicine_id,
+                    movement_type='out',
+                    quantity=-item.quantity,  # Negative for stock out
+                    reference_number=self.order_number,
+                    notes=f'Order {self.order_number} - {item.quantity} units sold',
+                    created_by=self.sales_rep
+                )
+                for item in items
             )
     
     def restore_stock(self):
         """Restore stock for all items in this order (for cancellations)"""
         from inventory.models import StockMovement
-        from django.utils import timezone
+        from inventory.services import StockLedgerService
         
-        for item in self.items.all():
-            # Create stock movement record - the signal will handle stock restoration
-            # This prevents double-increase
-            StockMovement.objects.create(
-                medicine=item.medicine,
+        StockLedgerService.post(
+            StockMovement(
+                medicine_id=item.medicine_id,
                 movement_type='return',
                 quantity=item.quantity,  # Positive for stock return
                 reference_number=f"{self.order_number}-CANCEL",
                 notes=f'Order {self.order_number} cancelled - {item.quantity} units restored',
                 created_by=self.sales_rep
             )
+            for item in self.items.all()
+        )
+    
+    def record_demand(self):
+        """Update the running demand statistics with this order's quantities"""
+        from analytics.services import DemandStatisticsService
+        try:
+            DemandStatisticsService().record_order(self)
+        except Exception as e:
+            logger.error(f"Error recording demand for order {self.order_number}: {e}")
+    
+    def retract_demand(self):
+        """Take this cancelled order's quantities back out of the demand statistics"""
+        from analytics.services import DemandStatisticsService
+        try:
+            DemandStatisticsService().retract_order(self)
+        except Exception as e:
+            logger.error(f"Error retracting demand for order {self.order_number}: {e}")
+    
+    def release_reservations(self):
+        """Release the stock held for this order while it was pending"""
+        from inventory.services import StockReservationService
+        StockReservationService.release_for_order(self)
     
     def check_stock_availability(self):
         """Check if all items in the order have sufficient stock"""
-        for item in self.items.all():
-            available_stock = max(0, item.medicine.current_stock)  # Ensure non-negative
+        from inventory.services import StockReservationService
+        
+        items = list(self.items.select_related('medicine'))
+        medicine_ids = [item.medicine_id for item in items]
+        reserved = StockReservationService.reserved_quantities(medicine_ids)
+        own = dict(
+            StockReservationService.live().filter(order=self)
+            .values_list('medicine_id', 'quantity')
+        )
+        for item in items:
+            # Units this order already holds are available to it
+            held_by_others = reserved.get(item.medicine_id, 0) - own.get(item.medicine_id, 0)
+            available_stock = max(0, item.medicine.current_stock - held_by_others)  # Ensure non-negative
             if available_stock < item.quantity:
                 return False, f"Insufficient stock for {item.medicine.name}. Available: {available_stock}, Required: {item.quantity}"
         return True, "Stock available"
     
     def save(self, *args, **kwargs):
-        # Handle stock management based on status changes
-        if self.pk:  # Only for existing orders
-            old_order = Order.objects.get(pk=self.pk)
-            
-            # If status changed from pending to confirmed, decrease stock
-            if (old_order.status == 'pending' and 
-                self.status == 'confirmed' and 
-                old_order.status != self.status):
-                self.decrease_stock()
-                self.confirmed_at = timezone.now()
-            
-            # If status changed to cancelled and was previously confirmed, restore stock
-            elif (self.status == 'cancelled' and 
-                  old_order.status in ['confirmed', 'processing', 'ready_for_pickup'] and 
-                  old_order.status != self.status):
-                self.restore_stock()
+        from .services import InvalidTransitionError, OrderStatusCounterService
         
         if not self.order_number:
             self.order_number = self.generate_order_number()
-        super().save(*args, **kwargs)
+        
+        if self._state.adding:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                OrderStatusCounterService.record(None, None, self.sales_rep_id, self.status)
+            return
+        
+        saved_fields = kwargs.get('update_fields')
+        
+        # Status and sales rep drive the transition check, stock and counters;
+        # if either was deferred or never loaded (e.g. a bulk-created order),
+        # read the stored values instead of skipping those side effects
+        loaded = self.__dict__.get('_loaded_values', {})
+        unknown = [
+            field for field in ('status', 'sales_rep')
+            if (saved_fields is None or field in saved_fields)
+            and self._tracked_attname(field) in self.__dict__ and self._tracked_attname(field) not in loaded
+        ]
+        if unknown:
+            stored = Order.objects.filter(pk=self.pk).values('status', 'sales_rep_id').first()
+            if stored is not None:
+                self.__dict__.setdefault('_loaded_values', {}).update(
+                    {self._tracked_attname(field): stored[self._tracked_attname(field)] for field in unknown}
+                )
+        
+        def is_saved_change(field):
+            return self.has_changed(field) and (saved_fields is None or field in saved_fields)
+        
+        status_changed = is_saved_change('status')
+        sales_rep_changed = is_saved_change('sales_rep')
+        old_status = self.previous_value('status')
+        old_sales_rep_id = self.previous_value('sales_rep')
+        # Counters can only be moved for orders whose loaded values are known
+        counted_change = self.is_tracked and (status_changed or sales_rep_changed)
+        if status_changed and old_status is not None and self.status not in self.ALLOWED_TRANSITIONS.get(old_status, []):
+            raise InvalidTransitionError(self, old_status, self.status)
+        
+        # Compare-and-swap: the UPDATE only matches the version this instance holds
+        loaded_values = dict(self._loaded_values) if self.is_tracked else None
+        self._expected_version = self.version
+        self.version += 1
+        if saved_fields is not None:
+            kwargs['update_fields'] = {*saved_fields, 'version'}
+        
+        try:
+            # Stock side effects must commit or roll back with the status change
+            with transaction.atomic() if status_changed or counted_change else nullcontext():
+                if status_changed:
+                    now = timezone.now()
+                    if self.status == 'confirmed':
+                        self.confirmed_at = now
+                    elif self.status == 'shipped' and not self.shipped_at:
+                        self.shipped_at = now
+                    elif self.status == 'delivered' and not self.delivered_at:
+                        self.delivered_at = now
+                
+                super().save(*args, **kwargs)
+                
+                if counted_change:
+                    OrderStatusCounterService.record(
+                        old_sales_rep_id, old_status,
+                        self.sales_rep_id if sales_rep_changed else old_sales_rep_id,
+                        self.status if status_changed else old_status,
+                    )
+                
+                # Handle stock management once the status change is ours
+                if status_changed and old_status is not None:
+                    # If status changed from pending to confirmed, decrease stock
+                    if old_status == 'pending' and self.status == 'confirmed':
+                        self.decrease_stock()
+                        self.record_demand()
+                    
+                    # If status changed to cancelled and was previously confirmed, restore stock
+                    elif (self.status == 'cancelled' and 
+                          old_status in ['confirmed', 'processing', 'ready_for_pickup']):
+                        self.restore_stock()
+                        self.retract_demand()
+                    
+                    # A pending order that is cancelled only gives back its reservations
+                    elif self.status == 'cancelled' and old_status == 'pending':
+                        self.release_reservations()
+        except Exception:
+            # Nothing was written, so keep the instance comparable with the row
+            self.version = self._expected_version
+            if loaded_values is not None:
+                self._loaded_values = loaded_values
+            raise
+        finally:
+            self._expected_version = None
+    
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected_version = getattr(self, '_expected_version', None)
+        if expected_version is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        
+        updated = super()._do_update(
+            base_qs.filter(version=expected_version), using, pk_val, values, update_fields, forced_update
+        )
+        if not updated and base_qs.filter(pk=pk_val).exists():
+            from .services import OrderConflictError
+            raise OrderConflictError(self)
+        return updated
 
 
 class OrderItem(models.Model):
@@ -210,6 +388,22 @@ class OrderStatusHistory(models.Model):
         return f"Order {self.order.order_number}: {self.old_status} -> {self.new_status}"
 
 
+class OrderStatusCounter(models.Model):
+    """
+    Number of orders per status, kept up to date as orders change.
+    The scope is 'global' or 'sales_rep:<id>' for one sales rep's orders.
+    """
+    scope = models.CharField(max_length=40)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ['scope', 'status']
+    
+    def __str__(self):
+        return f"{self.scope} {self.status}: {self.count}"
+
+
 class Cart(models.Model):
     """
     Shopping cart for sales representatives
@@ -218,16 +412,20 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Kept in step with the items by CartService, so reads never sum them
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    
     def __str__(self):
         return f"Cart for {self.sales_rep.username}"
     
     @property
     def total_items(self):
-        return sum(item.quantity for item in self.items.all())
+        return self.item_count
     
     @property
     def total_amount(self):
-        return sum(item.total_price for item in self.items.all())
+        return self.subtotal
 
 
 class CartItem(models.Model):
@@ -0,0 +1,112 @@
+import datetime
+
+from django.db.models import Count
+from django.urls import reverse
+from rest_framework import serializers
+
+from common.serializers import QueryPlanMixin
+from .models import Order, OrderItem
+
+# Order timestamps have always been sent in UTC
+UTC = datetime.timezone.utc
+
+
+class OrderItemSerializer(QueryPlanMixin, serializers.ModelSerializer):
+    """Line of an order, with the medicine it is for"""
+    medicine = serializers.SerializerMethodField()
+    unit_price = serializers.FloatField()
+    total_price = serializers.FloatField()
+
+    select_related = ('medicine',)
+    only_fields = (
+        'order', 'quantity', 'unit_price', 'total_price',
+        'medicine', 'medicine__name', 'medicine__strength',
+    )
+
+    class Meta:
+        model = OrderItem
+        fields = ['medicine', 'quantity', 'unit_price', 'total_price']
+
+    def get_medicine(self, item):
+        return {
+            'id': item.medicine.id,
+            'name': item.medicine.name,
+            'strength': item.medicine.strength,
+        }
+
+
+class OrderListSerializer(QueryPlanMixin, serializers.ModelSerializer):
+    """Row of the order list API"""
+    total_amount = serializers.FloatField()
+    created_at = serializers.DateTimeField(default_timezone=UTC)
+
+    only_fields = (
+        'order_number', 'status', 'payment_status', 'total_amount', 'created_at', 'delivery_method',
+    )
+
+    class Meta:
+        model = Order
+        fields = ['id', 'order_number', 'status', 'payment_status', 'total_amount', 'created_at', 'delivery_method']
+
+
+class OrderDetailSerializer(QueryPlanMixin, serializers.ModelSerializer):
+    """Order with its totals and lines"""
+    subtotal = serializers.FloatField()
+    tax_amount = serializers.FloatField()
+    shipping_cost = serializers.FloatField()
+    discount_amount = serializers.FloatField()
+    total_amount = serializers.FloatField()
+    created_at = serializers.DateTimeField(default_timezone=UTC)
+    items = OrderItemSerializer(many=True)
+
+    prefetch_related = (OrderItemSerializer.prefetch('items', OrderItem.objects.order_by('id')),)
+
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'order_number', 'status', 'payment_status',
+            'subtotal', 'tax_amount', 'shipping_cost', 'discount_amount', 'total_amount',
+            'delivery_method', 'delivery_address', 'prescription_required', 'prescription_verified',
+            'created_at', 'items',
+        ]
+
+
+class SalesRepOrderSerializer(QueryPlanMixin, serializers.ModelSerializer):
+    """Row of the sales rep dashboard's order table"""
+    status_display = serializers.CharField(source='get_status_display')
+    payment_status_display = serializers.CharField(source='get_payment_status_display')
+    items_count = serializers.IntegerField()
+    total_amount = serializers.FloatField()
+    created_at = serializers.DateTimeField(default_timezone=UTC)
+    created_at_display = serializers.DateTimeField(source='created_at', format='%b %d, %Y %H:%M', default_timezone=UTC)
+
+    only_fields = ('order_number', 'status', 'payment_status', 'total_amount', 'created_at')
+    annotations = {'items_count': Count('items')}
+
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'order_number', 'status', 'status_display', 'payment_status', 'payment_status_display',
+            'items_count', 'total_amount', 'created_at', 'created_at_display',
+        ]
+
+
+class PrescriptionClaimSerializer(serializers.ModelSerializer):
+    """Prescription a pharmacist has claimed from the verification queue"""
+    prescription_image = serializers.SerializerMethodField()
+    created_at = serializers.DateTimeField(default_timezone=UTC)
+    verification_lease_expires_at = serializers.DateTimeField(default_timezone=UTC)
+    verify_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Order
+        fields = [
+            'id', 'order_number', 'customer_name', 'delivery_method', 'created_at',
+            'prescription_image', 'verification_lease_expires_at', 'verify_url',
+        ]
+
+    def get_prescription_image(self, order):
+        return order.prescription_image.url if order.prescription_image else None
+
+    def get_verify_url(self, order):
+        return reverse('orders:prescription_verify', args=[order.pk])
@@ -0,0 +1,1006 @@
+"""
+Order services for placing orders against live stock, for syncing batches of
+offline orders, for guarding concurrent order updates, for bulk status changes,
+for fulfillment pick lists, for the prescription verification queue and for
+keeping cart totals
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+from operator import or_
+import logging
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, DecimalField, F, IntegerField, Prefetch, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import User
+from common.dates import date_range_lookups
+from .models import Cart, CartItem, Order, OrderItem, OrderStatusCounter, OrderStatusHistory
+from inventory.services import InsufficientStockError, StockReservationService
+
+logger = logging.getLogger(__name__)
+
+
+class OrderConflictError(Exception):
+    """Raised when an order was changed by someone else after it was loaded"""
+    
+    def __init__(self, order):
+        self.order = order
+        super().__init__(
+            f'Order {order.order_number} was updated by someone else. Reload it and try again.'
+        )
+
+
+class InvalidTransitionError(Exception):
+    """Raised when an order status change is not allowed from its current status"""
+    
+    def __init__(self, order, old_status, new_status):
+        self.order = order
+        self.old_status = old_status
+        self.new_status = new_status
+        labels = dict(Order.STATUS_CHOICES)
+        super().__init__(
+            f'Order {order.order_number} cannot move from '
+            f'"{labels.get(old_status, old_status)}" to "{labels.get(new_status, new_status)}"'
+        )
+
+
+class OrderPlacementService:
+    """
+    Places an order, its items and the matching stock reservations in one transaction
+    """
+    
+    TAX_RATE = Decimal('0.08')
+    DELIVERY_FEE = Decimal('10.00')
+    
+    @classmethod
+    def place_order(cls, order, lines):
+        """
+        Save ``order`` with its items, reserving their stock atomically
+        
+        On-hand stock is only decremented when the order is confirmed; until
+        then the units are held by reservations that expire on their own.
+        
+        Args:
+            order: unsaved Order with customer and delivery details set
+            lines: iterable of dicts with ``medicine``, ``quantity`` and optional ``unit``
+        
+        Raises:
+            InsufficientStockError: if any medicine cannot cover its quantity;
+                nothing is saved in that case
+        """
+        items = cls._merge_lines(lines)
+        if not items:
+            raise ValueError('An order needs at least one item')
+        
+        cls.apply_totals(order, items)
+        
+        try:
+            with transaction.atomic():
+                order.save()
+                StockReservationService.reserve(order, [(item['medicine'], item['quantity']) for item in items])
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        medicine=item['medicine'],
+                        quantity=item['quantity'],
+                        unit=item['unit'],
+                        unit_price=item['medicine'].unit_price,
+                        total_price=item['medicine'].unit_price * item['quantity'],
+                    )
+                    for item in items
+                ])
+                
+                transaction.on_commit(lambda: cls._after_commit(order))
+        except InsufficientStockError:
+            # The order row was rolled back along with the reservations
+            order.pk = None
+            order._state.adding = True
+            raise
+        
+        logger.info(f"Order {order.order_number} placed with {len(items)} items")
+        return order
+    
+    @classmethod
+    def apply_totals(cls, order, items):
+        """Set the order's price fields from its items at current medicine prices"""
+        subtotal = sum((item['medicine'].unit_price * item['quantity'] for item in items), Decimal('0.00'))
+        order.subtotal = subtotal
+        order.tax_amount = subtotal * cls.TAX_RATE
+        order.shipping_cost = cls.DELIVERY_FEE if order.delivery_method == 'delivery' else Decimal('0.00')
+        order.discount_amount = Decimal('0.00')
+        order.total_amount = subtotal + order.tax_amount + order.shipping_cost - order.discount_amount
+    
+    @staticmethod
+    def _merge_lines(lines):
+        merged = {}
+        for line in lines:
+            medicine = line.get('medicine')
+            quantity = line.get('quantity')
+            if not medicine or not quantity:
+                continue
+            if medicine.pk in merged:
+                merged[medicine.pk]['quantity'] += quantity
+            else:
+                merged[medicine.pk] = {
+                    'medicine': medicine,
+                    'quantity': quantity,
+                    'unit': line.get('unit') or 'boxes',
+                }
+        return list(merged.values())
+    
+    @staticmethod
+    def _after_commit(order):
+        from common.services import NotificationService
+        
+        NotificationService.notify_order_placed(order)
+
+
+class OrderBatchIngestService:
+    """
+    Creates the orders a sales rep took offline from one synced batch.
+    
+    Every medicine the batch mentions is loaded (and locked) with one query
+    and each order is checked against that map: prices must match what the
+    device showed and stock must cover the orders accepted before it. The
+    accepted orders, their items and stock reservations are then written
+    with one insert per table in a single transaction.
+    
+    Orders are judged one by one; a rejected order is reported without
+    failing the rest of the batch. Each order carries a ``client_reference``
+    from the device, so resending a batch reports the orders it already
+    created instead of placing them twice.
+    """
+    
+    # Most orders one batch may carry
+    MAX_ORDERS = 100
+    
+    DELIVERY_METHODS = ('pickup', 'delivery')
+    
+    @classmethod
+    def ingest(cls, sales_rep, payloads):
+        """
+        Create the orders in ``payloads`` for ``sales_rep``
+        
+        Args:
+            sales_rep: User the orders are taken by
+            payloads: list of dicts with ``client_reference``, ``lines`` (dicts
+                with ``medicine_id``, ``quantity`` and optional ``unit_price``,
+                the price the device showed) and optional ``delivery_method``,
+                ``delivery_address``, ``delivery_instructions`` and ``customer_notes``
+        
+        Returns:
+            One result per payload, in order: a dict with ``client_reference``,
+            ``status`` ('created', 'duplicate' or 'rejected'), ``order`` (the
+            new or previously synced order) and ``errors``
+        """
+        if len(payloads) > cls.MAX_ORDERS:
+            raise ValueError(f'At most {cls.MAX_ORDERS} orders can be synced at once')
+        try:
+            # Own savepoint, so a failed first pass leaves a caller's
+            # transaction usable for the second
+            with transaction.atomic():
+                return cls._ingest(sales_rep, payloads)
+        except IntegrityError:
+            # A concurrent sync created some of these orders first (or an
+            # order number collided); a second pass reports them as duplicates
+            return cls._ingest(sales_rep, payloads)
+    
+    @classmethod
+    def _ingest(cls, sales_rep, payloads):
+        from inventory.models import Medicine, StockReservation
+        from common.services import ChangeFeedService, ChangeVersionService
+        
+        results = [None] * len(payloads)
+        parsed = []
+        references = set()
+        for index, payload in enumerate(payloads):
+            reference, fields, lines, errors = cls._parse(payload)
+            if not errors and reference in references:
+                errors = ['client_reference appears more than once in this batch']
+            if errors:
+                results[index] = cls._result('rejected', reference, errors=errors)
+                continue
+            references.add(reference)
+            parsed.append((index, reference, fields, lines))
+        
+        created = []
+        now = timezone.now()
+        with transaction.atomic():
+            existing = {
+                order.client_reference: order
+                for order in Order.objects.filter(sales_rep=sales_rep, client_reference__in=references)
+            }
+            
+            # Count every new order as pending up front so the counter rows are
+            # locked before the medicine rows, the order Order.save and
+            # place_order take them in; rejected orders are taken back out below
+            candidates = [reference for _, reference, _, _ in parsed if reference not in existing]
+            OrderStatusCounterService.record_many(
+                (None, None, sales_rep.pk, 'pending') for _ in candidates
+            )
+            
+            # One locked read of every medicine in the batch; availability is
+            # then drawn down in memory as orders are accepted
+            medicine_ids = {line['medicine_id'] for _, _, _, lines in parsed for line in lines}
+            medicines = {
+                medicine.pk: medicine
+                for medicine in Medicine.objects.select_for_update().filter(pk__in=medicine_ids).order_by('pk')
+            }
+            reserved = StockReservationService.reserved_quantities(list(medicines), now)
+            available = {
+                pk: max(0, medicine.current_stock - reserved.get(pk, 0)) for pk, medicine in medicines.items()
+            }
+            
+            for index, reference, fields, lines in parsed:
+                if reference in existing:
+                    results[index] = cls._result('duplicate', reference, existing[reference])
+                    continue
+                items, errors = cls._check_lines(lines, medicines, available)
+                if errors:
+                    results[index] = cls._result('rejected', reference, errors=errors)
+                    continue
+                for item in items:
+                    available[item['medicine'].pk] -= item['quantity']
+                
+                order = Order(
+                    sales_rep=sales_rep,
+                    client_reference=reference,
+                    customer_name=sales_rep.get_full_name() or sales_rep.username,
+                    customer_phone=getattr(sales_rep, 'phone', '') or '',
+                    customer_address=getattr(sales_rep, 'address', '') or '',
+                    **fields,
+                )
+                if not order.delivery_address:
+                    order.delivery_address = order.customer_address
+                order.order_number = order.generate_order_number()
+                OrderPlacementService.apply_totals(order, items)
+                created.append((index, order, items))
+            
+            OrderStatusCounterService.record_many(
+                (sales_rep.pk, 'pending', None, None) for _ in range(len(candidates) - len(created))
+            )
+            if created:
+                orders = Order.objects.bulk_create([order for _, order, _ in created])
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        medicine=item['medicine'],
+                        quantity=item['quantity'],
+                        unit=item['unit'],
+                        unit_price=item['medicine'].unit_price,
+                        total_price=item['medicine'].unit_price * item['quantity'],
+                    )
+                    for _, order, items in created for item in items
+                ])
+                expires_at = now + StockReservationService.ttl()
+                StockReservation.objects.bulk_create([
+                    StockReservation(medicine=item['medicine'], order=order, quantity=item['quantity'], expires_at=expires_at)
+                    for _, order, items in created for item in items
+                ])
+                
+                # bulk_create skips Order.save() and its signals, so do their work
+                ChangeFeedService.publish_order_changes(orders, 'order_status')
+                ChangeVersionService.bump(
+                    ChangeVersionService.ORDERS_SCOPE, ChangeVersionService.orders_scope(sales_rep.pk)
+                )
+                transaction.on_commit(lambda: cls._after_commit(orders))
+        
+        for index, order, items in created:
+            results[index] = cls._result('created', order.client_reference, order)
+        
+        logger.info(f"Synced {len(created)} of {len(payloads)} offline orders for sales rep {sales_rep.pk}")
+        return results
+    
+    @classmethod
+    def _parse(cls, payload):
+        """(client_reference, order fields, lines, errors) for one order payload"""
+        if not isinstance(payload, dict):
+            return '', {}, [], ['Each order must be an object']
+        
+        errors = []
+        reference = str(payload.get('client_reference') or '').strip()
+        if not reference:
+            errors.append('client_reference is required')
+        elif len(reference) > Order._meta.get_field('client_reference').max_length:
+            errors.append('client_reference is too long')
+        
+        fields = {
+            'delivery_method': payload.get('delivery_method') or 'pickup',
+            'delivery_address': str(payload.get('delivery_address') or ''),
+            'delivery_instructions': str(payload.get('delivery_instructions') or ''),
+            'customer_notes': str(payload.get('customer_notes') or ''),
+        }
+        if fields['delivery_method'] not in cls.DELIVERY_METHODS:
+            errors.append(f"Unknown delivery method: {fields['delivery_method']}")
+        
+        lines = []
+        raw_lines = payload.get('lines')
+        if not isinstance(raw_lines, list) or not raw_lines:
+            errors.append('An order needs at least one line')
+            raw_lines = []
+        for number, raw in enumerate(raw_lines, 1):
+            try:
+                medicine_id = int(raw['medicine_id'])
+                quantity = int(raw['quantity'])
+                unit_price = raw.get('unit_price')
+                unit_price = None if unit_price in (None, '') else Decimal(str(unit_price))
+            except (KeyError, TypeError, ValueError, AttributeError, InvalidOperation):
+                errors.append(f'Line {number}: medicine_id and a whole-number quantity are required')
+                continue
+            if quantity < 1:
+                errors.append(f'Line {number}: quantity must be at least 1')
+                continue
+            lines.append({'medicine_id': medicine_id, 'quantity': quantity, 'unit_price': unit_price})
+        
+        return reference, fields, lines, errors
+    
+    @staticmethod
+    def _check_lines(lines, medicines, available):
+        """Order items (merged per medicine) and the reasons they cannot be placed"""
+        merged = {}
+        errors = []
+        for line in lines:
+            medicine = medicines.get(line['medicine_id'])
+            if medicine is None or not (medicine.is_active and medicine.is_available):
+                errors.append(f"Medicine {line['medicine_id']} is not available")
+                continue
+            if line['unit_price'] is not None and line['unit_price'] != medicine.unit_price:
+                errors.append(
+                    f"Price of {medicine.name} changed from ₱{line['unit_price']:,.2f} to ₱{medicine.unit_price:,.2f}"
+                )
+                continue
+            if medicine.pk not in merged:
+                merged[medicine.pk] = {'medicine': medicine, 'quantity': 0, 'unit': 'boxes'}
+            merged[medicine.pk]['quantity'] += line['quantity']
+        
+        for item in merged.values():
+            left = available[item['medicine'].pk]
+            if item['quantity'] > left:
+                errors.append(
+                    f"Insufficient stock for {item['medicine'].name}. Available: {left}, Requested: {item['quantity']}"
+                )
+        return list(merged.values()), errors
+    
+    @staticmethod
+    def _result(status, reference, order=None, errors=None):
+        return {'client_reference': reference, 'status': status, 'order': order, 'errors': errors or []}
+    
+    @staticmethod
+    def _after_commit(orders):
+        from common.services import NotificationService
+        
+        NotificationService.notify_orders_placed(orders)
+
+
+class OrderBulkTransitionService:
+    """
+    Moves many orders to one status in a single transaction, e.g. a
+    pharmacist confirming the morning's pending orders.
+    
+    Does what saving each order would (stock movements, reservations,
+    demand statistics, status counters, history, change feed and change
+    versions, notifications and audit entries) but in one statement per
+    table rather than one round of statements per order.
+    """
+    
+    # Most orders one request may move
+    MAX_ORDERS = 200
+    
+    @classmethod
+    def transition(cls, order_ids, new_status, changed_by, notes='', request=None):
+        """
+        Move the given orders to ``new_status``. Orders that cannot make the
+        move are left alone and reported rather than failing the batch.
+        
+        Returns:
+            (updated orders, {order_number: reason} for skipped orders)
+        """
+        from inventory.models import StockMovement, StockReservation
+        from inventory.services import StockLedgerService
+        from common.services import ChangeFeedService, ChangeVersionService
+        
+        if new_status not in dict(Order.STATUS_CHOICES):
+            raise ValueError(f'Unknown order status: {new_status}')
+        order_ids = list(dict.fromkeys(order_ids))
+        if len(order_ids) > cls.MAX_ORDERS:
+            raise ValueError(f'At most {cls.MAX_ORDERS} orders can be updated at once')
+        
+        skipped = {}
+        with transaction.atomic():
+            orders = list(
+                Order.objects.select_for_update().filter(pk__in=order_ids).order_by('created_at', 'id')
+            )
+            eligible = []
+            for order in orders:
+                if not order.can_transition_to(new_status):
+                    skipped[order.order_number] = (
+                        f'cannot move from {order.get_status_display()} to {dict(Order.STATUS_CHOICES)[new_status]}'
+                    )
+                elif new_status == 'delivered' and order.payment_status != 'paid':
+                    skipped[order.order_number] = 'payment has not been verified'
+                else:
+                    eligible.append(order)
+            if not eligible:
+                return [], skipped
+            
+            old_statuses = {order.id: order.status for order in eligible}
+            now = timezone.now()
+            
+            # Counter rows are locked before medicine rows, in the same order
+            # Order.save and place_order take them, so the two cannot deadlock
+            OrderStatusCounterService.record_many(
+                (order.sales_rep_id, old_statuses[order.id], order.sales_rep_id, new_status)
+                for order in eligible
+            )
+            
+            # Units whose hold expired are checked again; orders that can no
+            # longer be covered are skipped and their counters moved back
+            if new_status == 'confirmed':
+                shortfalls = StockReservationService.check_confirmations(
+                    OrderItem.objects.filter(order__in=[o for o in eligible if old_statuses[o.id] == 'pending'])
+                    .select_related('medicine').order_by('order__created_at', 'order_id', 'id'),
+                    now,
+                )
+                short = [order for order in eligible if order.id in shortfalls]
+                for order in short:
+                    skipped[order.order_number] = str(shortfalls[order.id])
+                OrderStatusCounterService.record_many(
+                    (order.sales_rep_id, new_status, order.sales_rep_id, old_statuses[order.id])
+                    for order in short
+                )
+                eligible = [order for order in eligible if order.id not in shortfalls]
+                if not eligible:
+                    return [], skipped
+            timestamps = {'confirmed': 'confirmed_at', 'shipped': 'shipped_at', 'delivered': 'delivered_at'}
+            stamp_field = timestamps.get(new_status)
+            
+            # Rows are locked, so one UPDATE can move every order; the version
+            # bump makes stale single-order forms fail their own check
+            update = {'status': new_status, 'version': F('version') + 1, 'updated_at': now}
+            if stamp_field == 'confirmed_at':
+                update[stamp_field] = now
+            elif stamp_field:
+                update[stamp_field] = Coalesce(F(stamp_field), Value(now))
+            Order.objects.filter(pk__in=[order.pk for order in eligible]).update(**update)
+            
+            for order in eligible:
+                order.status = new_status
+                order.version += 1
+                order.updated_at = now
+                if stamp_field and (stamp_field == 'confirmed_at' or getattr(order, stamp_field) is None):
+                    setattr(order, stamp_field, now)
+            
+            # Stock: confirmations take stock out, cancellations of confirmed
+            # orders put it back, and leaving pending drops the holds
+            confirming = [o for o in eligible if old_statuses[o.id] == 'pending' and new_status == 'confirmed']
+            restocking = [
+                o for o in eligible
+                if new_status == 'cancelled' and old_statuses[o.id] in ['confirmed', 'processing', 'ready_for_pickup']
+            ]
+            releasing = [o for o in eligible if old_statuses[o.id] == 'pending']
+            if releasing:
+                StockReservation.objects.filter(order__in=releasing).delete()
+            
+            movements = []
+            items = OrderItem.objects.filter(order__in=confirming + restocking).select_related('order', 'order__sales_rep')
+            for item in items:
+                order = item.order
+                if order.status == 'confirmed':
+                    movements.append(StockMovement(
+                        medicine_id=item.medicine_id,
+                        movement_type='out',
+                        quantity=-item.quantity,
+                        reference_number=order.order_number,
+                        notes=f'Order {order.order_number} - {item.quantity} units sold',
+                        created_by=order.sales_rep,
+                    ))
+                else:
+                    movements.append(StockMovement(
+                        medicine_id=item.medicine_id,
+                        movement_type='return',
+                        quantity=item.quantity,
+                        reference_number=f"{order.order_number}-CANCEL",
+                        notes=f'Order {order.order_number} cancelled - {item.quantity} units restored',
+                        created_by=order.sales_rep,
+                    ))
+            # Nets the changes per medicine into one stock update
+            StockLedgerService.post(movements)
+            
+            if confirming:
+                from analytics.services import DemandStatisticsService
+                try:
+                    DemandStatisticsService().record_orders(confirming)
+                except Exception as e:
+                    logger.error(f"Error recording demand for {len(confirming)} orders: {e}")
+            if restocking:
+                from analytics.services import DemandStatisticsService
+                try:
+                    DemandStatisticsService().retract_orders(restocking)
+                except Exception as e:
+                    logger.error(f"Error retracting demand for {len(restocking)} orders: {e}")
+            
+            OrderStatusHistory.objects.bulk_create([
+                OrderStatusHistory(
+                    order=order,
+                    old_status=old_statuses[order.id],
+                    new_status=new_status,
+                    old_payment_status=order.payment_status,
+                    new_payment_status=order.payment_status,
+                    notes=notes,
+                    changed_by=changed_by,
+                )
+                for order in eligible
+            ])
+            
+            # QuerySet.update() sends no signals, so publish what they would
+            ChangeFeedService.publish_order_changes(eligible, 'order_status')
+            ChangeVersionService.bump(
+                ChangeVersionService.ORDERS_SCOPE,
+                *{ChangeVersionService.orders_scope(order.sales_rep_id) for order in eligible if order.sales_rep_id}
+            )
+        
+        from common.services import NotificationService
+        from audits.services import AuditService
+        
+        sales_reps = {
+            user.pk: user for user in
+            User.objects.filter(pk__in={order.sales_rep_id for order in eligible if order.sales_rep_id})
+        }
+        for order in eligible:
+            order.sales_rep = sales_reps.get(order.sales_rep_id)
+        NotificationService.notify_order_status_changes(eligible, old_statuses, new_status, changed_by_user=changed_by)
+        AuditService.log_changes_many(
+            [
+                (order, {'status': (old_statuses[order.id], new_status)},
+                 f"Order {order.order_number} status updated (bulk)")
+                for order in eligible
+            ],
+            user=changed_by, request=request,
+        )
+        
+        logger.info(f"Moved {len(eligible)} orders to {new_status}; skipped {len(skipped)}")
+        return eligible, skipped
+
+
+class OrderSearchService:
+    """
+    Order search for the order lists.
+    
+    Terms shaped like an order number ("ORD-1A2B") are matched by prefix,
+    which the order_number index answers directly. Anything else is a
+    substring match on customer name or order number; on PostgreSQL the
+    trigram indexes from migration 0010 answer those, other databases scan.
+    """
+    
+    ORDER_NUMBER_PATTERN = re.compile(r'^ORD-[0-9A-F]*$')
+    
+    @classmethod
+    def search(cls, queryset, term):
+        term = (term or '').strip()
+        if not term:
+            return queryset
+        
+        # Order numbers are stored upper case, so a case-sensitive prefix
+        # match can use the plain btree index
+        if cls.ORDER_NUMBER_PATTERN.match(term.upper()):
+            return queryset.filter(order_number__startswith=term.upper())
+        
+        return queryset.filter(
+            Q(customer_name__icontains=term) |
+            Q(order_number__icontains=term)
+        )
+
+
+class PickListService:
+    """
+    Pick lists and packing slips for fulfillment.
+    
+    The pick list totals every line of the orders in a window by medicine
+    from one grouped query, so a day's picking is read from one page rather
+    than by opening each order. Packing slips load the same orders with
+    their lines in two queries.
+    """
+    
+    # Orders whose stock still has to be picked
+    STATUSES = ('pending', 'confirmed', 'processing')
+    DEFAULT_STATUSES = ('confirmed',)
+    
+    @classmethod
+    def orders(cls, statuses=None, date_from=None, date_to=None):
+        """Orders in the given statuses, placed between the dates (inclusive)"""
+        orders = Order.objects.filter(status__in=statuses or cls.DEFAULT_STATUSES)
+        return orders.filter(**date_range_lookups('created_at', start=date_from, end=date_to))
+    
+    @staticmethod
+    def pick_list(orders):
+        """
+        One entry per medicine, by name: its total quantity and the orders
+        needing it, e.g. {'medicine_id': 3, 'name': 'Amoxicillin', ...,
+        'total_quantity': 7, 'orders': [{'order_number': 'ORD-1A2B3C4D', 'quantity': 2}, ...]}
+        """
+        rows = (
+            OrderItem.objects.filter(order__in=orders)
+            .values(
+                'medicine_id', 'medicine__name', 'medicine__strength', 'medicine__dosage_form',
+                'medicine__storage_conditions', 'order__order_number',
+            )
+            .annotate(quantity=Sum('quantity'))
+            .order_by('medicine__name', 'medicine_id', 'order__order_number')
+        )
+        
+        lines = []
+        for row in rows:
+            if not lines or lines[-1]['medicine_id'] != row['medicine_id']:
+                lines.append({
+                    'medicine_id': row['medicine_id'],
+                    'name': row['medicine__name'],
+                    'strength': row['medicine__strength'],
+                    'dosage_form': row['medicine__dosage_form'],
+                    'storage_conditions': row['medicine__storage_conditions'],
+                    'total_quantity': 0,
+                    'orders': [],
+                })
+            line = lines[-1]
+            line['total_quantity'] += row['quantity']
+            line['orders'].append({'order_number': row['order__order_number'], 'quantity': row['quantity']})
+        return lines
+    
+    @staticmethod
+    def packing_slips(orders):
+        """The orders, oldest first, with their lines and medicines loaded"""
+        items = OrderItem.objects.select_related('medicine').order_by('medicine__name', 'id')
+        return orders.select_related('sales_rep').prefetch_related(Prefetch('items', queryset=items)).order_by('created_at', 'id')
+
+
+class PrescriptionQueueService:
+    """
+    Work queue for prescription verification.
+    
+    Pharmacists claim the next unverified prescriptions instead of picking
+    orders by hand. Claiming locks candidate rows with SKIP LOCKED, so
+    pharmacists claiming at the same moment get different orders without
+    waiting on each other. A claim is a lease: it lapses unless renewed with
+    heartbeat(), and a lapsed claim goes back to the queue.
+    
+    Home deliveries come first because they still have to be dispatched,
+    then the oldest orders.
+    """
+    
+    # Most unverified prescriptions one pharmacist can hold at a time
+    MAX_CLAIMS = 20
+    
+    @staticmethod
+    def lease_expiry(now=None):
+        return (now or timezone.now()) + timedelta(seconds=settings.PRESCRIPTION_CLAIM_LEASE_SECONDS)
+    
+    @staticmethod
+    def pending():
+        """Orders with an uploaded prescription still waiting for verification"""
+        return (
+            Order.objects.filter(prescription_required=True, prescription_verified=False)
+            .exclude(prescription_image='').exclude(prescription_image__isnull=True)
+            .exclude(status__in=['cancelled', 'returned'])
+        )
+    
+    @classmethod
+    def queue(cls, now=None):
+        """Pending orders nobody holds a live claim on, in priority order"""
+        now = now or timezone.now()
+        return cls.pending().filter(
+            Q(verification_claimed_by__isnull=True) | Q(verification_lease_expires_at__lte=now)
+        ).annotate(
+            delivery_priority=Case(When(delivery_method='delivery', then=0), default=1, output_field=IntegerField())
+        ).order_by('delivery_priority', 'created_at', 'id')
+    
+    @classmethod
+    def claimed_by(cls, pharmacist, now=None):
+        """Orders the pharmacist holds a live claim on, in the order claimed"""
+        return cls.pending().filter(
+            verification_claimed_by=pharmacist, verification_lease_expires_at__gt=now or timezone.now()
+        ).order_by('created_at', 'id')
+    
+    @classmethod
+    def claim(cls, pharmacist, count=1):
+        """
+        Claim up to ``count`` more orders for the pharmacist, never holding
+        more than MAX_CLAIMS. Returns the newly claimed orders.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            # Serialize one pharmacist's claims on their user row, so two
+            # claims at once cannot both count the same held orders
+            list(User.objects.select_for_update().filter(pk=pharmacist.pk).values_list('pk', flat=True))
+            held = cls.claimed_by(pharmacist, now).count()
+            count = max(0, min(count, cls.MAX_CLAIMS - held))
+            if not count:
+                return []
+            # Rows another pharmacist is claiming right now are skipped, not waited on
+            order_ids = list(
+                cls.queue(now).select_for_update(skip_locked=True).values_list('id', flat=True)[:count]
+            )
+            Order.objects.filter(id__in=order_ids).update(
+                verification_claimed_by=pharmacist, verification_lease_expires_at=cls.lease_expiry(now)
+            )
+        
+        orders = Order.objects.in_bulk(order_ids)
+        return [orders[order_id] for order_id in order_ids]
+    
+    @classmethod
+    def heartbeat(cls, pharmacist, order_ids):
+        """
+        Extend the pharmacist's claims on the orders. A claim that lapsed is
+        renewed too unless another pharmacist has claimed the order since.
+        Returns the ids still held.
+        """
+        claims = cls.pending().filter(id__in=order_ids, verification_claimed_by=pharmacist)
+        with transaction.atomic():
+            held_ids = list(claims.select_for_update().values_list('id', flat=True))
+            Order.objects.filter(id__in=held_ids).update(verification_lease_expires_at=cls.lease_expiry())
+        return held_ids
+    
+    @staticmethod
+    def release(pharmacist, order_ids):
+        """Hand the pharmacist's claims on the orders back to the queue"""
+        return Order.objects.filter(id__in=order_ids, verification_claimed_by=pharmacist).update(
+            verification_claimed_by=None, verification_lease_expires_at=None
+        )
+    
+    @staticmethod
+    def claimed_by_other(order, pharmacist, now=None):
+        """The pharmacist holding a live claim on the order, if it is someone else"""
+        if (
+            order.verification_claimed_by_id is None
+            or order.verification_claimed_by_id == pharmacist.id
+            or order.verification_lease_expires_at is None
+            or order.verification_lease_expires_at <= (now or timezone.now())
+        ):
+            return None
+        return order.verification_claimed_by
+
+
+class OrderStatusCounterService:
+    """
+    Maintains per-status order counts so dashboards read them in one query
+    """
+    
+    GLOBAL_SCOPE = 'global'
+    
+    @staticmethod
+    def scope_for(sales_rep_id):
+        return f'sales_rep:{sales_rep_id}'
+    
+    @classmethod
+    def record(cls, old_sales_rep_id, old_status, new_sales_rep_id, new_status):
+        """
+        Move one order between counters; a None status means it did not
+        exist before (creation) or no longer exists (deletion). Runs in the
+        caller's transaction.
+        """
+        cls.record_many([(old_sales_rep_id, old_status, new_sales_rep_id, new_status)])
+    
+    @classmethod
+    def record_many(cls, moves):
+        """
+        Apply several ``record`` moves, given as
+        ``(old_sales_rep_id, old_status, new_sales_rep_id, new_status)``
+        tuples, with one update
+        """
+        deltas = defaultdict(int)
+        for old_sales_rep_id, old_status, new_sales_rep_id, new_status in moves:
+            if old_status is not None:
+                deltas[(cls.GLOBAL_SCOPE, old_status)] -= 1
+                if old_sales_rep_id:
+                    deltas[(cls.scope_for(old_sales_rep_id), old_status)] -= 1
+            if new_status is not None:
+                deltas[(cls.GLOBAL_SCOPE, new_status)] += 1
+                if new_sales_rep_id:
+                    deltas[(cls.scope_for(new_sales_rep_id), new_status)] += 1
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        
+        OrderStatusCounter.objects.bulk_create(
+            [OrderStatusCounter(scope=scope, status=status) for scope, status in deltas],
+            ignore_conflicts=True
+        )
+        OrderStatusCounter.objects.filter(
+            reduce(or_, (Q(scope=scope, status=status) for scope, status in deltas))
+        ).update(count=Case(
+            *[When(scope=scope, status=status, then=F('count') + Value(delta))
+              for (scope, status), delta in deltas.items()],
+            output_field=IntegerField(),
+        ))
+    
+    @classmethod
+    def get_counts(cls, sales_rep=None):
+        """
+        Map of every status to its order count plus a 'total', for all orders
+        or for one sales rep's orders
+        """
+        scope = cls.scope_for(sales_rep.pk) if sales_rep else cls.GLOBAL_SCOPE
+        counts = {code: 0 for code, _ in Order.STATUS_CHOICES}
+        counts.update(OrderStatusCounter.objects.filter(scope=scope).values_list('status', 'count'))
+        counts['total'] = sum(counts.values())
+        return counts
+    
+    @staticmethod
+    def by_status(counts):
+        """The ``orders_by_status`` breakdown the dashboards render"""
+        return {
+            code: {'name': name, 'count': counts.get(code, 0)}
+            for code, name in Order.STATUS_CHOICES
+        }
+    
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute every counter from the orders table
+        
+        Returns:
+            Number of counter rows written
+        """
+        totals = defaultdict(int)
+        with transaction.atomic():
+            rows = Order.objects.values('sales_rep_id', 'status').annotate(total=Count('id')).order_by()
+            for row in rows:
+                totals[(cls.GLOBAL_SCOPE, row['status'])] += row['total']
+                if row['sales_rep_id']:
+                    totals[(cls.scope_for(row['sales_rep_id']), row['status'])] += row['total']
+            
+            OrderStatusCounter.objects.all().delete()
+            OrderStatusCounter.objects.bulk_create([
+                OrderStatusCounter(scope=scope, status=status, count=total)
+                for (scope, status), total in totals.items()
+            ])
+        
+        logger.info(f"Rebuilt {len(totals)} order status counters")
+        return len(totals)
+
+
+class CartService:
+    """
+    Sales rep carts.
+    
+    Each change updates the items and the cart's stored item_count and
+    subtotal in one transaction with the cart row locked, so reads never
+    sum the items and concurrent changes cannot leave stale totals. The
+    navbar badge count is served from cache.
+    """
+    
+    @staticmethod
+    def badge_cache_key(sales_rep_id):
+        return f'orders:cart_badge:{sales_rep_id}'
+    
+    # Reads
+    
+    @classmethod
+    def get_contents(cls, user):
+        """
+        Items (with medicine and cart loaded), item count and subtotal of the
+        user's cart, in one query. An empty or missing cart is not created.
+        """
+        items = list(
+            CartItem.objects.filter(cart__sales_rep=user)
+            .select_related('cart', 'medicine')
+            .order_by('added_at', 'id')
+        )
+        if not items:
+            return items, 0, Decimal('0.00')
+        return items, items[0].cart.item_count, items[0].cart.subtotal
+    
+    @classmethod
+    def get_totals(cls, user):
+        """Item count and subtotal of the user's cart, without loading items"""
+        totals = Cart.objects.filter(sales_rep=user).values_list('item_count', 'subtotal').first()
+        return totals or (0, Decimal('0.00'))
+    
+    @classmethod
+    def get_badge_count(cls, user):
+        key = cls.badge_cache_key(user.pk)
+        count = cache.get(key)
+        if count is None:
+            count = cls.get_totals(user)[0]
+            cache.set(key, count, settings.CART_BADGE_CACHE_TTL)
+        return count
+    
+    # Changes
+    
+    @classmethod
+    def add_item(cls, user, medicine, quantity):
+        """Add quantity of a medicine, merging with an existing line"""
+        quantity = cls._validate_quantity(quantity)
+        with transaction.atomic():
+            cart = cls._lock_cart(user)
+            item, created = CartItem.objects.get_or_create(
+                cart=cart, medicine=medicine, defaults={'quantity': quantity}
+            )
+            if not created:
+                item.quantity += quantity
+                item.save(update_fields=['quantity'])
+            cls.recalculate(cart)
+        return item
+    
+    @classmethod
+    def update_item(cls, user, item_id, quantity):
+        """Set an item's quantity; raises CartItem.DoesNotExist for other carts' items"""
+        quantity = cls._validate_quantity(quantity)
+        with transaction.atomic():
+            cart = cls._lock_cart(user)
+            item = CartItem.objects.get(id=item_id, cart=cart)
+            item.quantity = quantity
+            item.save(update_fields=['quantity'])
+            cls.recalculate(cart)
+        return item
+    
+    @classmethod
+    def remove_item(cls, user, item_id):
+        """Remove an item; raises CartItem.DoesNotExist for other carts' items"""
+        with transaction.atomic():
+            cart = cls._lock_cart(user)
+            deleted, _ = CartItem.objects.filter(id=item_id, cart=cart).delete()
+            if not deleted:
+                raise CartItem.DoesNotExist('Cart item not found')
+            cls.recalculate(cart)
+    
+    @classmethod
+    def clear(cls, user):
+        """Empty the user's cart; returns the number of items removed"""
+        with transaction.atomic():
+            cart = Cart.objects.select_for_update().filter(sales_rep=user).first()
+            if cart is None:
+                return 0
+            deleted, _ = cart.items.all().delete()
+            cls.recalculate(cart)
+        return deleted
+    
+    @classmethod
+    def reprice(cls, medicine):
+        """Refresh the subtotals of carts holding a medicine whose price changed"""
+        with transaction.atomic():
+            for cart in Cart.objects.select_for_update().filter(items__medicine=medicine).distinct():
+                cls.recalculate(cart)
+    
+    @classmethod
+    def recalculate(cls, cart):
+        """
+        Store the cart's totals from its items. Call with the cart row locked
+        inside the transaction that changed the items.
+        """
+        totals = cart.items.aggregate(
+            item_count=Sum('quantity'),
+            subtotal=Sum(
+                F('quantity') * F('medicine__unit_price'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+        )
+        cart.item_count = totals['item_count'] or 0
+        cart.subtotal = totals['subtotal'] or Decimal('0.00')
+        cart.save(update_fields=['item_count', 'subtotal', 'updated_at'])
+        
+        sales_rep_id, item_count = cart.sales_rep_id, cart.item_count
+        transaction.on_commit(lambda: cache.set(
+            cls.badge_cache_key(sales_rep_id), item_count, settings.CART_BADGE_CACHE_TTL
+        ))
+    
+    @staticmethod
+    def _lock_cart(user):
+        cart, created = Cart.objects.select_for_update().get_or_create(sales_rep=user)
+        return cart
+    
+    @staticmethod
+    def _validate_quantity(quantity):
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise ValueError('Quantity must be a whole number')
+        if quantity < 1:
+            raise ValueError('Quantity must be at least 1')
+        return quantity
@@ -0,0 +1,72 @@
+"""
+Signals for orders
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from common.services import ChangeFeedService, ChangeVersionService
+from inventory.models import Medicine
+from .models import Order, OrderItem
+from .services import CartService, OrderStatusCounterService
+
+
+def order_version_scopes(*sales_rep_ids):
+    """Change version scopes covering orders of the given sales reps"""
+    return [ChangeVersionService.ORDERS_SCOPE] + [
+        ChangeVersionService.orders_scope(sales_rep_id)
+        for sales_rep_id in sales_rep_ids if sales_rep_id
+    ]
+
+
+@receiver(post_save, sender=Order)
+def publish_order_change(sender, instance, created, **kwargs):
+    """
+    Push status and payment changes to the change feed. Runs before the
+    instance re-snapshots its loaded values, so has_changed still reflects
+    this save.
+    """
+    if created or instance.has_changed('status'):
+        ChangeFeedService.publish_order_change(instance, 'order_status')
+    elif instance.has_changed('payment_status'):
+        ChangeFeedService.publish_order_change(instance, 'payment')
+
+
+@receiver(post_save, sender=Order)
+def bump_order_version(sender, instance, created, **kwargs):
+    """
+    Invalidate dashboard ETags for the order's current and previous sales rep
+    """
+    ChangeVersionService.bump(*order_version_scopes(
+        instance.sales_rep_id, None if created else instance.previous_value('sales_rep')
+    ))
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def bump_order_item_version(sender, instance, **kwargs):
+    """
+    Invalidate dashboard ETags that include item counts
+    """
+    try:
+        sales_rep_id = instance.order.sales_rep_id
+    except Order.DoesNotExist:
+        sales_rep_id = None
+    ChangeVersionService.bump(*order_version_scopes(sales_rep_id))
+
+
+@receiver(post_delete, sender=Order)
+def discount_deleted_order(sender, instance, **kwargs):
+    """
+    Take a deleted order out of the status counters
+    """
+    OrderStatusCounterService.record(instance.sales_rep_id, instance.status, None, None)
+    ChangeVersionService.bump(*order_version_scopes(instance.sales_rep_id))
+
+
+@receiver(post_save, sender=Medicine)
+def reprice_carts(sender, instance, created, **kwargs):
+    """
+    Keep stored cart subtotals in step with medicine price changes
+    """
+    if not created and instance.has_changed('unit_price'):
+        CartService.reprice(instance)
@@ -2,16 +2,28 @@
 Comprehensive unit tests for the orders module
 """
 
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings, skipUnlessDBFeature
+from django.db import IntegrityError, connection, transaction
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from decimal import Decimal
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 import json
+import tempfile
+import threading
+from unittest.mock import patch
 
-from .models import Order, OrderItem, OrderStatusHistory, Cart, CartItem
-from inventory.models import Category, Manufacturer, Medicine
+from .models import Order, OrderItem, OrderStatusHistory, OrderStatusCounter, Cart, CartItem
+from .services import (
+    OrderPlacementService, OrderBatchIngestService, InsufficientStockError, OrderConflictError, InvalidTransitionError,
+    CartService, OrderBulkTransitionService, OrderSearchService, OrderStatusCounterService, PickListService,
+    PrescriptionQueueService
+)
+from inventory.models import Category, Manufacturer, Medicine, StockReservation
+from inventory.services import StockReservationService
 from accounts.models import User
+from common.testing import QueryCountAssertionsMixin
 
 User = get_user_model()
 
@@ -80,6 +92,89 @@ class OrderModelTests(TestCase):
         self.assertEqual(len(order.order_number), 12)  # ORD- + 8 hex chars
 
 
+class OrderChangeTrackingTests(TestCase):
+    """Test cases for change tracking on Order"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='salesrep',
+            email='sales@example.com',
+            password='testpass123',
+            role='sales_rep'
+        )
+        self.order = Order.objects.create(
+            sales_rep=self.user,
+            customer_name='John Doe',
+            subtotal=Decimal('51.00'),
+            total_amount=Decimal('51.00')
+        )
+    
+    def test_loaded_order_tracks_changes(self):
+        """Test has_changed, previous_value and changes against the loaded values"""
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertFalse(order.has_changed('status'))
+        self.assertEqual(order.changed_fields, [])
+        
+        order.status = 'confirmed'
+        order.sales_rep = None
+        self.assertTrue(order.has_changed('status'))
+        self.assertEqual(order.previous_value('status'), 'pending')
+        self.assertEqual(sorted(order.changed_fields), ['sales_rep', 'status'])
+        self.assertEqual(order.changes()['status'], ('pending', 'confirmed'))
+        
+        order.save()
+        self.assertFalse(order.has_changed('status'))
+        self.assertEqual(order.previous_value('status'), 'confirmed')
+    
+    def test_deferred_fields_are_not_reported_as_changed(self):
+        """Test fields left out by only() count as unchanged until assigned"""
+        order = Order.objects.only('id', 'status').get(pk=self.order.pk)
+        self.assertEqual(order.changed_fields, [])
+        self.assertEqual(order.customer_name, 'John Doe')
+        self.assertFalse(order.has_changed('customer_name'))
+    
+    def test_status_set_on_a_deferred_order_is_still_checked(self):
+        """Test a status assigned to an order loaded without it reads the stored status"""
+        order = Order.objects.only('id', 'version', 'order_number').get(pk=self.order.pk)
+        order.status = 'delivered'
+        with self.assertRaises(InvalidTransitionError):
+            order.save()
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'pending')
+    
+    def test_bulk_created_order_moves_stock_when_confirmed(self):
+        """Test an order that was never loaded still gets its stock side effects"""
+        medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=Category.objects.create(name='Antibiotics', is_active=True),
+            manufacturer=Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True),
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=100
+        )
+        result = OrderBatchIngestService.ingest(
+            self.user, [{'client_reference': 'dev-1', 'lines': [{'medicine_id': medicine.id, 'quantity': 4}]}]
+        )[0]
+        order = result['order']
+        self.assertFalse(order.is_tracked)
+        
+        order.status = 'confirmed'
+        order.save()
+        
+        medicine.refresh_from_db()
+        self.assertEqual(medicine.current_stock, 96)
+        self.assertFalse(StockReservation.objects.filter(order=order).exists())
+        counts = OrderStatusCounterService.get_counts(self.user)
+        self.assertEqual((counts['pending'], counts['confirmed']), (1, 1))
+    
+    def test_save_does_not_reread_the_order(self):
+        """Test saving an existing order issues only the UPDATE"""
+        order = Order.objects.get(pk=self.order.pk)
+        order.customer_notes = 'Leave at the door'
+        with self.assertNumQueries(1):
+            order.save()
+
+
 class OrderItemModelTests(TestCase):
     """Test cases for OrderItem model"""
     
@@ -173,3 +268,1191 @@ class CartModelTests(TestCase):
         cart = Cart.objects.create(sales_rep=self.user)
         expected_str = f"Cart for {self.user.username}"
         self.assertEqual(str(cart), expected_str)
+
+
+class CartServiceTests(TestCase):
+    """Test cases for stored cart totals and the cart read path"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.amoxicillin = self._create_medicine('Amoxicillin', Decimal('25.50'), '0001-0001')
+        self.paracetamol = self._create_medicine('Paracetamol', Decimal('5.00'), '0002-0002')
+        self.client = Client()
+        self.client.force_login(self.rep)
+    
+    def _create_medicine(self, name, unit_price, ndc_number):
+        return Medicine.objects.create(
+            name=name,
+            ndc_number=ndc_number,
+            category=self.category,
+            manufacturer=self.manufacturer,
+            unit_price=unit_price,
+            cost_price=Decimal('1.00'),
+            current_stock=100
+        )
+    
+    def _totals(self):
+        cart = Cart.objects.get(sales_rep=self.rep)
+        return cart.item_count, cart.subtotal
+    
+    def test_changes_keep_stored_totals_in_step(self):
+        """Test add, update, remove and clear each leave correct totals"""
+        item = CartService.add_item(self.rep, self.amoxicillin, 2)
+        CartService.add_item(self.rep, self.amoxicillin, 1)
+        CartService.add_item(self.rep, self.paracetamol, 4)
+        self.assertEqual(self._totals(), (7, Decimal('96.50')))
+        
+        CartService.update_item(self.rep, item.id, 1)
+        self.assertEqual(self._totals(), (5, Decimal('45.50')))
+        
+        CartService.remove_item(self.rep, item.id)
+        self.assertEqual(self._totals(), (4, Decimal('20.00')))
+        
+        self.assertEqual(CartService.clear(self.rep), 1)
+        self.assertEqual(self._totals(), (0, Decimal('0.00')))
+        
+        with self.assertRaises(ValueError):
+            CartService.add_item(self.rep, self.paracetamol, 0)
+    
+    def test_price_changes_reprice_carts(self):
+        """Test a medicine price change updates the subtotals of carts holding it"""
+        CartService.add_item(self.rep, self.amoxicillin, 2)
+        self.amoxicillin.unit_price = Decimal('30.00')
+        self.amoxicillin.save()
+        
+        self.assertEqual(self._totals(), (2, Decimal('60.00')))
+    
+    def test_cart_read_is_one_query_and_does_not_create_a_cart(self):
+        """Test reading a full cart joins its items in one query"""
+        items, item_count, subtotal = CartService.get_contents(self.rep)
+        self.assertEqual((items, item_count, subtotal), ([], 0, Decimal('0.00')))
+        self.assertFalse(Cart.objects.filter(sales_rep=self.rep).exists())
+        
+        CartService.add_item(self.rep, self.amoxicillin, 2)
+        CartService.add_item(self.rep, self.paracetamol, 1)
+        with self.assertNumQueries(1):
+            items, item_count, subtotal = CartService.get_contents(self.rep)
+            self.assertEqual([item.medicine.name for item in items], ['Amoxicillin', 'Paracetamol'])
+            self.assertEqual(sum(item.total_price for item in items), subtotal)
+    
+    def test_api_changes_return_totals_and_refresh_the_badge(self):
+        """Test cart API changes report new totals and the badge reads from cache"""
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/orders/api/cart/add/', {'medicine_id': self.amoxicillin.id, 'quantity': 3},
+                                        content_type='application/json')
+        self.assertEqual(response.json()['total_items'], 3)
+        
+        # Session and user only; the count comes from cache
+        with self.assertNumQueries(2):
+            response = self.client.get('/orders/api/cart/badge/')
+        self.assertEqual(response.json(), {'total_items': 3})
+        
+        item = CartItem.objects.get(cart__sales_rep=self.rep)
+        response = self.client.put(f'/orders/api/cart/update/{item.id}/', {'quantity': 0},
+                                   content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f'/orders/api/cart/remove/{item.id}/')
+        self.assertEqual(response.json()['total_items'], 0)
+        self.assertEqual(self.client.get('/orders/api/cart/badge/').json(), {'total_items': 0})
+
+
+class OrderPlacementServiceTests(TestCase):
+    """Test cases for OrderPlacementService"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='salesrep',
+            email='sales@example.com',
+            password='testpass123',
+            role='sales_rep'
+        )
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=self.category,
+            manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=100
+        )
+        self.other_medicine = Medicine.objects.create(
+            name='Paracetamol',
+            category=self.category,
+            manufacturer=self.manufacturer,
+            unit_price=Decimal('5.00'),
+            cost_price=Decimal('2.00'),
+            current_stock=3,
+            ndc_number='0002-0002'
+        )
+    
+    def _new_order(self):
+        return Order(sales_rep=self.user, customer_name='John Doe', delivery_method='delivery')
+    
+    def test_place_order_saves_items_and_reserves_stock(self):
+        """Test the order, its items and the stock reservations are saved together"""
+        order = OrderPlacementService.place_order(self._new_order(), [
+            {'medicine': self.medicine, 'quantity': 2},
+            {'medicine': self.other_medicine, 'quantity': 1},
+            {'medicine': self.medicine, 'quantity': 1},
+        ])
+        
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(order.items.get(medicine=self.medicine).quantity, 3)
+        self.assertEqual(order.subtotal, Decimal('81.50'))
+        self.assertEqual(order.shipping_cost, Decimal('10.00'))
+        self.medicine.refresh_from_db()
+        self.other_medicine.refresh_from_db()
+        self.assertEqual(self.medicine.current_stock, 100)
+        self.assertEqual(self.medicine.available_stock, 97)
+        self.assertEqual(self.other_medicine.available_stock, 2)
+    
+    def test_insufficient_stock_rolls_back_everything(self):
+        """Test nothing is saved when one line cannot be covered"""
+        OrderPlacementService.place_order(self._new_order(), [{'medicine': self.other_medicine, 'quantity': 1}])
+        
+        order = self._new_order()
+        with self.assertRaises(InsufficientStockError) as raised:
+            OrderPlacementService.place_order(order, [
+                {'medicine': self.medicine, 'quantity': 5},
+                {'medicine': self.other_medicine, 'quantity': 3},
+            ])
+        
+        self.assertEqual(raised.exception.available, 2)
+        self.assertIsNone(order.pk)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.medicine.available_stock, 100)
+    
+    def test_confirming_turns_reservation_into_stock_movement(self):
+        """Test confirmation decrements on-hand stock once and drops the hold"""
+        order = OrderPlacementService.place_order(self._new_order(), [{'medicine': self.medicine, 'quantity': 4}])
+        
+        order.status = 'confirmed'
+        order.save()
+        
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.current_stock, 96)
+        self.assertEqual(self.medicine.available_stock, 96)
+        self.assertFalse(order.stock_reservations.exists())
+    
+    def test_cancelling_pending_order_releases_reservation(self):
+        """Test a cancelled pending order gives its units back without a movement"""
+        order = OrderPlacementService.place_order(self._new_order(), [{'medicine': self.other_medicine, 'quantity': 3}])
+        self.assertEqual(self.other_medicine.available_stock, 0)
+        
+        order.status = 'cancelled'
+        order.save()
+        
+        self.other_medicine.refresh_from_db()
+        self.assertEqual(self.other_medicine.current_stock, 3)
+        self.assertEqual(self.other_medicine.available_stock, 3)
+
+
+class OrderCreateViewTests(TestCase):
+    """Test cases for the sales order form and its medicine lines"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicines = [
+            Medicine.objects.create(
+                name=f'Medicine {number}', ndc_number=f'000{number}', category=self.category,
+                manufacturer=self.manufacturer, unit_price=Decimal('10.00'), cost_price=Decimal('5.00'),
+                current_stock=100
+            )
+            for number in range(7)
+        ]
+        self.client = Client()
+        self.client.force_login(self.user)
+    
+    def _lines(self, *lines):
+        data = {'lines-TOTAL_FORMS': len(lines), 'lines-INITIAL_FORMS': 0, 'lines-MIN_NUM_FORMS': 1, 'lines-MAX_NUM_FORMS': 100}
+        for index, (medicine, quantity) in enumerate(lines):
+            data[f'lines-{index}-medicine'] = medicine.id
+            data[f'lines-{index}-quantity'] = quantity
+        return data
+    
+    def test_form_page_does_not_list_the_catalog(self):
+        """Test medicines are picked by autocomplete, with cart items pre-filled as lines"""
+        CartService.add_item(self.user, self.medicines[3], 2)
+        
+        response = self.client.get('/orders/orders/create/')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Medicine 1 (')
+        self.assertContains(response, 'value="Medicine 3 (')
+        self.assertEqual(response.context['line_formset'].total_form_count(), 1)
+    
+    def test_order_takes_any_number_of_lines(self):
+        """Test more than five medicines can be ordered at once"""
+        data = {'delivery_method': 'pickup', 'payment_status': 'pending', 'delivery_address': 'Manila'}
+        data.update(self._lines(*[(medicine, 1) for medicine in self.medicines]))
+        
+        response = self.client.post('/orders/orders/create/', data)
+        
+        self.assertRedirects(response, '/orders/orders/', fetch_redirect_response=False)
+        self.assertEqual(Order.objects.get().items.count(), 7)
+    
+    def test_order_needs_an_available_medicine(self):
+        """Test an empty order or an unavailable medicine redisplays the form"""
+        data = {'delivery_method': 'pickup', 'payment_status': 'pending'}
+        self.medicines[0].is_available = False
+        self.medicines[0].save()
+        
+        response = self.client.post('/orders/orders/create/', {**data, **self._lines((self.medicines[0], 1))})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'That medicine is no longer available.')
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderOptimisticLockingTests(TestCase):
+    """Test cases for versioned order updates and status transitions"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(
+            username='pharmacist',
+            email='pharmacist@example.com',
+            password='testpass123',
+            role='pharmacist_admin'
+        )
+        category = Category.objects.create(name='Antibiotics', is_active=True)
+        manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=category,
+            manufacturer=manufacturer,
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=100
+        )
+        self.order = OrderPlacementService.place_order(
+            Order(sales_rep=self.user, customer_name='John Doe'),
+            [{'medicine': self.medicine, 'quantity': 5}]
+        )
+    
+    def test_stale_confirmation_conflicts_without_moving_stock_twice(self):
+        """Test the second of two concurrent confirmations is rejected and rolled back"""
+        first = Order.objects.get(pk=self.order.pk)
+        second = Order.objects.get(pk=self.order.pk)
+        
+        first.status = 'confirmed'
+        first.save()
+        second.status = 'confirmed'
+        with self.assertRaises(OrderConflictError):
+            second.save()
+        
+        self.assertEqual(first.version, 1)
+        self.assertEqual(second.version, 0)
+        self.assertTrue(second.has_changed('status'))
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.current_stock, 95)
+    
+    def test_illegal_transition_is_rejected(self):
+        """Test a pending order cannot skip straight to delivered"""
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = 'delivered'
+        with self.assertRaises(InvalidTransitionError):
+            order.save()
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'pending')
+    
+    def test_status_form_with_stale_version_asks_for_retry(self):
+        """Test a status update posted against an old version changes nothing"""
+        Order.objects.filter(pk=self.order.pk).update(version=3)
+        self.client.force_login(self.user)
+        
+        response = self.client.post(
+            f'/orders/orders/{self.order.pk}/status/',
+            {'status': 'confirmed', 'version': 0, 'internal_notes': ''}
+        )
+        
+        self.assertRedirects(response, f'/orders/orders/{self.order.pk}/status/', fetch_redirect_response=False)
+        self.assertEqual(Order.objects.get(pk=self.order.pk).status, 'pending')
+        self.assertFalse(OrderStatusHistory.objects.exists())
+    
+    def test_order_change_is_reapplied_after_a_conflict(self):
+        """Test a small change to a stale order is retried on the latest version"""
+        from .views import save_order_change
+        stale = Order.objects.get(pk=self.order.pk)
+        Order.objects.filter(pk=self.order.pk).update(version=1, internal_notes='Call first')
+        
+        save_order_change(stale, lambda order: setattr(order, 'internal_notes', order.internal_notes + '\nProof sent'))
+        
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.internal_notes, 'Call first\nProof sent')
+        self.assertEqual(order.version, 2)
+    
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_manual_payment_submission_keeps_no_upload_when_the_order_conflicts(self):
+        """Test a proof upload is rolled back when the order cannot be saved"""
+        from django.contrib.messages import get_messages
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from common.models import FileUpload
+        self.client.force_login(self.user)
+        
+        with patch.object(Order, 'save', side_effect=OrderConflictError(self.order)):
+            response = self.client.post(f'/orders/orders/{self.order.pk}/manual-payment/', {
+                'payment_reference': 'BANK-123',
+                'payment_date': '2026-10-01',
+                'payment_proof': SimpleUploadedFile('proof.pdf', b'%PDF-1.4', content_type='application/pdf'),
+            })
+        
+        self.assertRedirects(response, f'/orders/orders/{self.order.pk}/', fetch_redirect_response=False)
+        self.assertIn('updated by someone else', [str(m) for m in get_messages(response.wsgi_request)][0])
+        self.assertFalse(FileUpload.objects.exists())
+    
+    def test_gateway_verification_audits_the_transaction_change(self):
+        """Test verifying a gateway payment records the transaction's diff"""
+        from unittest.mock import MagicMock
+        from audits.models import AuditLog
+        from transactions.models import PaymentGateway, PaymentMethod, Transaction
+        payment = Transaction.objects.create(
+            order=self.order,
+            payment_method=PaymentMethod.objects.create(name='Credit Card'),
+            payment_gateway=PaymentGateway.objects.create(name='Stripe', gateway_type='stripe', is_active=True),
+            amount=self.order.total_amount,
+            net_amount=self.order.total_amount,
+            gateway_transaction_id='pi_123',
+        )
+        service = MagicMock()
+        service.get_payment_status.return_value = {'status': 'succeeded'}
+        self.client.force_login(self.user)
+        
+        with patch('transactions.services.PaymentGatewayFactory.create_service', return_value=service):
+            self.client.post(f'/orders/orders/{self.order.pk}/verify-gateway-payment/')
+        
+        self.assertEqual(Order.objects.get(pk=self.order.pk).payment_status, 'paid')
+        entry = AuditLog.objects.get(object_id=payment.pk, module='transactions')
+        self.assertEqual(entry.changed_fields, ['completed_at', 'status'])
+        self.assertEqual((entry.old_values['status'], entry.new_values['status']), ('pending', 'completed'))
+    
+    def test_manual_payment_rolls_back_when_transaction_fails(self):
+        """Test the order stays unpaid when its payment transaction cannot be recorded"""
+        self.client.force_login(self.user)
+        
+        with patch('transactions.models.Transaction.objects.create', side_effect=RuntimeError('boom')):
+            response = self.client.post(f'/orders/orders/{self.order.pk}/verify-manual-payment/')
+        
+        self.assertRedirects(response, f'/orders/pharmacist/orders/{self.order.pk}/', fetch_redirect_response=False)
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(order.payment_status, 'pending')
+        self.assertEqual(order.version, 0)
+        self.assertFalse(OrderStatusHistory.objects.exists())
+
+
+class OrderStatusCounterTests(TestCase):
+    """Test cases for the maintained order status counters"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.other_rep = User.objects.create_user(username='salesrep2', password='testpass123', role='sales_rep')
+    
+    def _create_order(self, sales_rep):
+        return Order.objects.create(
+            sales_rep=sales_rep,
+            customer_name='John Doe',
+            subtotal=Decimal('51.00'),
+            total_amount=Decimal('51.00')
+        )
+    
+    def test_counters_follow_creation_transitions_and_deletion(self):
+        """Test global and per sales rep counts track every order change"""
+        first = self._create_order(self.rep)
+        second = self._create_order(self.rep)
+        self._create_order(self.other_rep)
+        
+        first.status = 'confirmed'
+        first.save()
+        second.delete()
+        
+        counts = OrderStatusCounterService.get_counts()
+        self.assertEqual(counts['pending'], 1)
+        self.assertEqual(counts['confirmed'], 1)
+        self.assertEqual(counts['total'], 2)
+        rep_counts = OrderStatusCounterService.get_counts(sales_rep=self.rep)
+        self.assertEqual(rep_counts['pending'], 0)
+        self.assertEqual(rep_counts['confirmed'], 1)
+        self.assertEqual(rep_counts['total'], 1)
+    
+    def test_dashboard_counts_are_a_single_query(self):
+        """Test reading every status count costs one query"""
+        self._create_order(self.rep)
+        with self.assertNumQueries(1):
+            OrderStatusCounterService.by_status(OrderStatusCounterService.get_counts())
+    
+    def test_rebuild_repairs_drifted_counters(self):
+        """Test the repair recomputes counts from the orders table"""
+        self._create_order(self.rep)
+        self._create_order(self.other_rep)
+        OrderStatusCounter.objects.update(count=42)
+        
+        OrderStatusCounterService.rebuild()
+        
+        self.assertEqual(OrderStatusCounterService.get_counts()['pending'], 2)
+        self.assertEqual(OrderStatusCounterService.get_counts(sales_rep=self.other_rep)['total'], 1)
+
+
+class DashboardConditionalGetTests(TestCase):
+    """Test cases for ETag revalidation of the dashboard polling APIs"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.pharmacist = User.objects.create_user(username='pharmacist', password='testpass123', role='pharmacist_admin')
+        self.client = Client()
+        self.client.force_login(self.pharmacist)
+    
+    def test_unchanged_dashboard_is_answered_with_304_before_aggregating(self):
+        """Test a matching If-None-Match skips the statistics queries"""
+        response = self.client.get('/orders/api/pharmacist/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        
+        # Session, user and change versions; no order queries
+        with self.assertNumQueries(3):
+            response = self.client.get('/orders/api/pharmacist/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+    
+    def test_order_write_changes_the_etag(self):
+        """Test a committed order change makes the next poll rebuild the payload"""
+        etag = self.client.get('/orders/api/pharmacist/dashboard/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.create(
+                sales_rep=self.rep,
+                customer_name='John Doe',
+                subtotal=Decimal('51.00'),
+                total_amount=Decimal('51.00')
+            )
+        
+        response = self.client.get('/orders/api/pharmacist/dashboard/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['statistics']['total_orders'], 1)
+
+
+class OrderAPIQueryCountTests(QueryCountAssertionsMixin, TestCase):
+    """Test cases for the order APIs loading a page in a fixed number of queries"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.pharmacist = User.objects.create_user(username='pharmacist', password='testpass123', role='pharmacist_admin')
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.client = Client()
+
+    def _medicine(self):
+        number = Medicine.objects.count() + 1
+        return Medicine.objects.create(
+            name=f'Medicine {number}', ndc_number=f'{number:04d}', strength='500mg',
+            category=self.category, manufacturer=self.manufacturer,
+            unit_price=Decimal('10.00'), cost_price=Decimal('6.00'), current_stock=100
+        )
+
+    def _add_orders(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                sales_rep=self.rep, customer_name='John Doe',
+                subtotal=Decimal('20.00'), total_amount=Decimal('20.00')
+            )
+            OrderItem.objects.create(order=order, medicine=self._medicine(), quantity=2, unit_price=Decimal('10.00'))
+
+    def test_order_list_queries_do_not_grow_with_page_size(self):
+        """Test the order list API reads a full page in the same queries as a single row"""
+        self.client.force_login(self.pharmacist)
+        self.assertConstantQueries(lambda: self.client.get('/orders/api/orders/?per_page=50'), self._add_orders)
+
+        row = self.client.get('/orders/api/orders/').json()['orders'][0]
+        self.assertEqual(
+            set(row), {'id', 'order_number', 'status', 'payment_status', 'total_amount', 'created_at', 'delivery_method'}
+        )
+        self.assertEqual(row['total_amount'], 20.0)
+
+    def test_order_detail_queries_do_not_grow_with_its_items(self):
+        """Test the order detail API loads every line with its medicine in one query"""
+        self._add_orders(1)
+        order = Order.objects.get()
+
+        def add_items(count):
+            for _ in range(count):
+                OrderItem.objects.create(order=order, medicine=self._medicine(), quantity=1, unit_price=Decimal('10.00'))
+
+        self.client.force_login(self.rep)
+        self.assertConstantQueries(lambda: self.client.get(f'/orders/api/orders/{order.pk}/'), add_items)
+
+        data = self.client.get(f'/orders/api/orders/{order.pk}/').json()
+        self.assertEqual(len(data['items']), 11)
+        self.assertEqual(data['items'][0]['medicine'], {'id': order.items.first().medicine_id, 'name': 'Medicine 1', 'strength': '500mg'})
+        self.assertEqual(data['items'][0]['total_price'], 20.0)
+        self.assertEqual(data['subtotal'], 20.0)
+
+    def test_sales_rep_dashboard_counts_items_without_a_query_per_order(self):
+        """Test the sales rep dashboard's order table is built in constant queries"""
+        self.client.force_login(self.rep)
+        self.assertConstantQueries(lambda: self.client.get('/orders/api/sales-rep/dashboard/'), self._add_orders)
+
+        row = self.client.get('/orders/api/sales-rep/dashboard/').json()['orders'][0]
+        self.assertEqual(row['items_count'], 1)
+        self.assertEqual(row['status_display'], 'Pending')
+        self.assertEqual(row['total_amount'], 20.0)
+
+
+class PickListTests(QueryCountAssertionsMixin, TestCase):
+    """Test cases for pick lists and packing slips"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.pharmacist = User.objects.create_user(username='pharmacist', password='testpass123', role='pharmacist_admin')
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.amoxicillin = Medicine.objects.create(
+            name='Amoxicillin', ndc_number='0001', strength='500mg', category=self.category, manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'), cost_price=Decimal('15.00'), current_stock=100
+        )
+        self.ibuprofen = Medicine.objects.create(
+            name='Ibuprofen', ndc_number='0002', strength='200mg', category=self.category, manufacturer=self.manufacturer,
+            unit_price=Decimal('8.00'), cost_price=Decimal('5.00'), current_stock=100
+        )
+        self.client = Client()
+        self.client.force_login(self.pharmacist)
+
+    def _order(self, status, *lines):
+        order = Order.objects.create(
+            sales_rep=self.rep, customer_name='John Doe', status=status,
+            subtotal=Decimal('10.00'), total_amount=Decimal('10.00')
+        )
+        for medicine, quantity in lines:
+            OrderItem.objects.create(order=order, medicine=medicine, quantity=quantity, unit_price=medicine.unit_price)
+        return order
+
+    def test_pick_list_totals_lines_by_medicine_in_one_query(self):
+        """Test quantities are summed per medicine and per order across the window"""
+        first = self._order('confirmed', (self.amoxicillin, 3), (self.ibuprofen, 1))
+        second = self._order('confirmed', (self.amoxicillin, 4))
+        self._order('pending', (self.ibuprofen, 9))
+
+        orders = PickListService.orders()
+        with self.assertNumQueries(1):
+            lines = PickListService.pick_list(orders)
+
+        self.assertEqual([line['name'] for line in lines], ['Amoxicillin', 'Ibuprofen'])
+        self.assertEqual(lines[0]['total_quantity'], 7)
+        self.assertEqual(
+            sorted(lines[0]['orders'], key=lambda entry: entry['quantity']),
+            [{'order_number': first.order_number, 'quantity': 3}, {'order_number': second.order_number, 'quantity': 4}]
+        )
+        self.assertEqual(lines[1]['total_quantity'], 1)
+
+        lines = PickListService.pick_list(PickListService.orders(statuses=['pending', 'confirmed']))
+        self.assertEqual(lines[1]['total_quantity'], 10)
+
+    def test_pick_list_page_filters_by_status(self):
+        """Test the page lists the chosen statuses and links packing slips for the same orders"""
+        self._order('confirmed', (self.amoxicillin, 2))
+        self._order('processing', (self.ibuprofen, 5))
+
+        response = self.client.get('/orders/pharmacist/pick-list/', {'status': 'processing'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([line['name'] for line in response.context['lines']], ['Ibuprofen'])
+        self.assertContains(response, '/orders/pharmacist/packing-slips/?status=processing')
+
+    def test_packing_slips_load_in_constant_queries(self):
+        """Test the slips for many orders cost the same queries as for one"""
+        def add_orders(count):
+            for _ in range(count):
+                self._order('confirmed', (self.amoxicillin, 2), (self.ibuprofen, 1))
+
+        self.assertConstantQueries(lambda: self.client.get('/orders/pharmacist/packing-slips/'), add_orders, sizes=(1, 6))
+
+        response = self.client.get('/orders/pharmacist/packing-slips/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, Order.objects.latest('id').order_number)
+        self.assertContains(response, 'class="card mb-4 packing-slip"', count=6)
+
+    def test_sales_reps_cannot_open_the_pick_list(self):
+        """Test the pick list is limited to pharmacists and admins"""
+        self.client.force_login(self.rep)
+        response = self.client.get('/orders/pharmacist/pick-list/')
+        self.assertEqual(response.status_code, 403)
+
+
+class PrescriptionQueueTests(TestCase):
+    """Test cases for claiming prescriptions from the verification queue"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.pharmacist = User.objects.create_user(username='pharmacist', password='testpass123', role='pharmacist_admin')
+        self.other = User.objects.create_user(username='pharmacist2', password='testpass123', role='pharmacist_admin')
+        self.client = Client()
+        self.client.force_login(self.pharmacist)
+
+    def _order(self, delivery_method='pickup', **fields):
+        fields.setdefault('prescription_image', 'prescriptions/rx.jpg')
+        return Order.objects.create(
+            sales_rep=self.rep, customer_name='John Doe', delivery_method=delivery_method,
+            prescription_required=True, subtotal=Decimal('10.00'), total_amount=Decimal('10.00'),
+            **fields
+        )
+
+    def test_claims_take_deliveries_then_oldest_and_never_overlap(self):
+        """Test claim order and that two pharmacists get different prescriptions"""
+        oldest_pickup = self._order()
+        delivery = self._order('delivery')
+        newest_pickup = self._order()
+        self._order(prescription_verified=True)
+        self._order(prescription_image='')
+        self._order(status='cancelled')
+
+        first = PrescriptionQueueService.claim(self.pharmacist, 2)
+        second = PrescriptionQueueService.claim(self.other, 5)
+
+        self.assertEqual(first, [delivery, oldest_pickup])
+        self.assertEqual(second, [newest_pickup])
+        self.assertEqual(list(PrescriptionQueueService.claimed_by(self.pharmacist)), [oldest_pickup, delivery])
+        self.assertEqual(PrescriptionQueueService.queue().count(), 0)
+
+    def test_lapsed_claims_return_to_the_queue(self):
+        """Test an expired lease can be claimed by someone else, and its old holder then loses it"""
+        order = self._order()
+        PrescriptionQueueService.claim(self.pharmacist)
+        self.assertEqual(PrescriptionQueueService.claim(self.other), [])
+
+        Order.objects.filter(pk=order.pk).update(verification_lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(PrescriptionQueueService.claim(self.other), [order])
+        self.assertEqual(PrescriptionQueueService.heartbeat(self.pharmacist, [order.pk]), [])
+        self.assertEqual(PrescriptionQueueService.heartbeat(self.other, [order.pk]), [order.pk])
+
+    def test_heartbeat_extends_the_lease(self):
+        """Test a heartbeat moves the expiry forward, even for a lapsed unclaimed lease"""
+        order = self._order()
+        PrescriptionQueueService.claim(self.pharmacist)
+        Order.objects.filter(pk=order.pk).update(verification_lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(PrescriptionQueueService.heartbeat(self.pharmacist, [order.pk]), [order.pk])
+        order.refresh_from_db()
+        self.assertGreater(order.verification_lease_expires_at, timezone.now())
+
+    def test_claims_are_capped_per_pharmacist(self):
+        """Test a pharmacist cannot hold more than MAX_CLAIMS prescriptions"""
+        for _ in range(PrescriptionQueueService.MAX_CLAIMS + 1):
+            self._order()
+
+        claimed = PrescriptionQueueService.claim(self.pharmacist, PrescriptionQueueService.MAX_CLAIMS)
+        self.assertEqual(len(claimed), PrescriptionQueueService.MAX_CLAIMS)
+        self.assertEqual(PrescriptionQueueService.claim(self.pharmacist), [])
+        self.assertEqual(len(PrescriptionQueueService.claim(self.other)), 1)
+
+    def test_queue_api_claims_renews_and_releases(self):
+        """Test the queue endpoints for a pharmacist"""
+        order = self._order()
+
+        response = self.client.post('/orders/api/prescriptions/queue/', {'count': 3}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([claim['id'] for claim in data['claimed']], [order.pk])
+        self.assertEqual(data['claimed'][0]['verify_url'], f'/orders/orders/{order.pk}/prescription/verify/')
+        self.assertEqual(data['waiting'], 0)
+
+        response = self.client.post(
+            '/orders/api/prescriptions/queue/heartbeat/', {'order_ids': [order.pk, 999]}, content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'held': [order.pk], 'lost': [999]})
+
+        response = self.client.post(
+            '/orders/api/prescriptions/queue/release/', {'order_ids': [order.pk]}, content_type='application/json'
+        )
+        self.assertEqual(response.json(), {'released': 1})
+        self.assertEqual(self.client.get('/orders/api/prescriptions/queue/').json()['waiting'], 1)
+
+        response = self.client.post('/orders/api/prescriptions/queue/', {'count': 0}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_sales_reps_cannot_use_the_queue(self):
+        """Test the queue is limited to pharmacists and admins"""
+        self.client.force_login(self.rep)
+        self.assertEqual(self.client.get('/orders/api/prescriptions/queue/').status_code, 403)
+
+    def test_verify_view_leaves_claimed_prescriptions_to_their_holder(self):
+        """Test another pharmacist is turned away from a claimed prescription, and verifying clears the claim"""
+        order = self._order()
+        PrescriptionQueueService.claim(self.other)
+
+        response = self.client.get(f'/orders/orders/{order.pk}/prescription/verify/')
+        self.assertRedirects(response, f'/orders/pharmacist/orders/{order.pk}/', fetch_redirect_response=False)
+
+        self.client.force_login(self.other)
+        response = self.client.post(
+            f'/orders/orders/{order.pk}/prescription/verify/', {'prescription_verified': 'on', 'internal_notes': ''}
+        )
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertTrue(order.prescription_verified)
+        self.assertEqual(order.verified_by, self.other)
+        self.assertIsNone(order.verification_claimed_by)
+
+    def test_verify_form_does_not_overwrite_a_newer_claim(self):
+        """Test saving notes keeps a claim taken after the form's claim check"""
+        order = self._order()
+        from .views import PrescriptionVerifyView
+        get_object = PrescriptionVerifyView.get_object
+        
+        def load_then_lose_the_race(view, *args, **kwargs):
+            # The other pharmacist claims it after the form loaded the order
+            loaded = get_object(view, *args, **kwargs)
+            PrescriptionQueueService.claim(self.other)
+            return loaded
+        
+        with patch.object(PrescriptionVerifyView, 'get_object', load_then_lose_the_race):
+            response = self.client.post(
+                f'/orders/orders/{order.pk}/prescription/verify/', {'internal_notes': 'Called the clinic'}
+            )
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual(order.internal_notes, 'Called the clinic')
+        self.assertEqual(order.verification_claimed_by, self.other)
+        self.assertIsNotNone(order.verification_lease_expires_at)
+
+
+@skipUnlessDBFeature('has_select_for_update_skip_locked')
+class PrescriptionQueueConcurrencyTests(TransactionTestCase):
+    """Parallel claims never hand one prescription to two pharmacists"""
+
+    def setUp(self):
+        """Set up test data"""
+        self.pharmacists = [
+            User.objects.create_user(username=f'pharmacist{i}', password='testpass123', role='pharmacist_admin')
+            for i in range(4)
+        ]
+        for _ in range(10):
+            Order.objects.create(
+                customer_name='John Doe', prescription_required=True, prescription_image='prescriptions/rx.jpg',
+                subtotal=Decimal('10.00'), total_amount=Decimal('10.00')
+            )
+
+    def test_parallel_claims_do_not_overlap(self):
+        """Test pharmacists claiming at the same moment split the queue between them"""
+        barrier = threading.Barrier(len(self.pharmacists))
+        claimed = {}
+
+        def claim(pharmacist):
+            try:
+                barrier.wait()
+                claimed[pharmacist.pk] = [order.pk for order in PrescriptionQueueService.claim(pharmacist, 3)]
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim, args=(pharmacist,)) for pharmacist in self.pharmacists]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        order_ids = [order_id for ids in claimed.values() for order_id in ids]
+        self.assertEqual(len(order_ids), len(set(order_ids)))
+        self.assertEqual(len(order_ids), 10)
+
+    @patch.object(PrescriptionQueueService, 'MAX_CLAIMS', 4)
+    def test_parallel_claims_by_one_pharmacist_respect_the_cap(self):
+        """Test one pharmacist claiming from two tabs at once still holds at most MAX_CLAIMS"""
+        pharmacist = self.pharmacists[0]
+        barrier = threading.Barrier(2)
+        claimed = []
+
+        def claim():
+            try:
+                barrier.wait()
+                claimed.extend(order.pk for order in PrescriptionQueueService.claim(pharmacist, 4))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=claim) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(claimed), 4)
+        self.assertEqual(PrescriptionQueueService.claimed_by(pharmacist).count(), 4)
+
+
+class OrderSearchServiceTests(TestCase):
+    """Test cases for order list search"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.other_rep = User.objects.create_user(username='salesrep2', password='testpass123', role='sales_rep')
+        self.first = self._create_order(self.rep, 'ORD-AB12CD34', 'Maria Santos')
+        self.second = self._create_order(self.rep, 'ORD-AB99EF00', 'Jose Ordonez')
+        self.third = self._create_order(self.other_rep, 'ORD-1234ABCD', 'Maria Cruz')
+    
+    def _create_order(self, sales_rep, order_number, customer_name):
+        return Order.objects.create(
+            sales_rep=sales_rep,
+            order_number=order_number,
+            customer_name=customer_name,
+            subtotal=Decimal('51.00'),
+            total_amount=Decimal('51.00')
+        )
+    
+    def _search(self, term):
+        return set(OrderSearchService.search(Order.objects.all(), term))
+    
+    def test_order_numbers_match_by_prefix(self):
+        """Test order number terms match from the start, ignoring case"""
+        self.assertEqual(self._search('ord-ab'), {self.first, self.second})
+        self.assertEqual(self._search('ORD-AB12'), {self.first})
+        # A prefix search does not look inside the number
+        self.assertEqual(self._search('ORD-ABCD'), set())
+    
+    def test_other_terms_match_anywhere_in_name_or_number(self):
+        """Test free text matches customer names and order number fragments"""
+        self.assertEqual(self._search('maria'), {self.first, self.third})
+        self.assertEqual(self._search('ordon'), {self.second})
+        self.assertEqual(self._search('99EF'), {self.second})
+        self.assertEqual(self._search('  '), {self.first, self.second, self.third})
+    
+    def test_sales_rep_list_searches_only_their_orders(self):
+        """Test the sales rep order list applies search within their own orders"""
+        client = Client()
+        client.force_login(self.rep)
+        
+        response = client.get('/orders/orders/', {'search': 'Maria'})
+        self.assertEqual(list(response.context['orders']), [self.first])
+        self.assertIn('search=Maria', response.context['query_string'])
+
+
+class OrderBulkTransitionTests(TestCase):
+    """Test cases for moving many orders to one status at once"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.pharmacist = User.objects.create_user(username='pharmacist', password='testpass123', role='pharmacist_admin')
+        self.other_pharmacist = User.objects.create_user(username='pharmacist2', password='testpass123', role='pharmacist_admin')
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=self.category,
+            manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=100
+        )
+    
+    def _place_order(self, quantity):
+        order = Order(sales_rep=self.rep, customer_name='John Doe', delivery_method='delivery')
+        return OrderPlacementService.place_order(order, [{'medicine': self.medicine, 'quantity': quantity}])
+    
+    def test_confirming_many_orders_matches_confirming_each(self):
+        """Test a bulk confirmation moves stock, counters, history and holds like single saves"""
+        from common.models import ChangeEvent, Notification
+        from inventory.models import StockMovement
+        orders = [self._place_order(quantity) for quantity in (2, 3, 5)]
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            updated, skipped = OrderBulkTransitionService.transition(
+                [order.id for order in orders], 'confirmed', self.pharmacist, notes='Morning batch'
+            )
+        
+        self.assertEqual((len(updated), skipped), (3, {}))
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.current_stock, 90)
+        self.assertEqual(StockMovement.objects.filter(movement_type='out').count(), 3)
+        self.assertFalse(StockReservation.objects.exists())
+        for order in orders:
+            order.refresh_from_db()
+            self.assertEqual(order.status, 'confirmed')
+            self.assertIsNotNone(order.confirmed_at)
+            self.assertEqual(order.version, 1)
+        self.assertEqual(OrderStatusHistory.objects.filter(new_status='confirmed', notes='Morning batch').count(), 3)
+        counts = OrderStatusCounterService.get_counts()
+        self.assertEqual((counts['pending'], counts['confirmed']), (0, 3))
+        self.assertEqual(ChangeEvent.objects.filter(event_type='order_status', audience='staff').count(), 3)
+        # One per order for the sales rep, one summary for the other pharmacist
+        self.assertEqual(Notification.objects.filter(user=self.rep, title__endswith='Status Updated').count(), 3)
+        self.assertEqual(Notification.objects.filter(user=self.other_pharmacist, title='3 Orders Now Confirmed').count(), 1)
+        self.assertFalse(Notification.objects.filter(user=self.pharmacist, title__contains='Now Confirmed').exists())
+    
+    def _expire_holds(self, order):
+        StockReservation.objects.filter(order=order).update(expires_at=timezone.now() - timedelta(seconds=1))
+        StockReservationService.release_expired()
+    
+    def test_confirming_after_the_hold_expired_rechecks_stock(self):
+        """Test an order whose hold lapsed cannot take units another order now holds"""
+        lapsed = self._place_order(60)
+        self._expire_holds(lapsed)
+        holding = self._place_order(60)
+        
+        lapsed.status = 'confirmed'
+        with self.assertRaises(InsufficientStockError):
+            lapsed.save()
+        
+        self.assertEqual(Order.objects.get(pk=lapsed.pk).status, 'pending')
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.current_stock, 100)
+        
+        holding.status = 'confirmed'
+        holding.save()
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.current_stock, 40)
+    
+    def test_bulk_confirmation_skips_orders_whose_units_are_gone(self):
+        """Test a bulk confirmation rechecks lapsed holds and leaves short orders pending"""
+        lapsed = self._place_order(60)
+        self._expire_holds(lapsed)
+        holding = self._place_order(60)
+        
+        updated, skipped = OrderBulkTransitionService.transition([lapsed.id, holding.id], 'confirmed', self.pharmacist)
+        
+        self.assertEqual([order.pk for order in updated], [holding.pk])
+        self.assertEqual(skipped, {lapsed.order_number: 'Insufficient stock for Amoxicillin. Available: 40, Requested: 60'})
+        self.assertEqual(Order.objects.get(pk=lapsed.pk).status, 'pending')
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.current_stock, 40)
+        counts = OrderStatusCounterService.get_counts()
+        self.assertEqual((counts['pending'], counts['confirmed']), (1, 1))
+    
+    def test_ineligible_orders_are_skipped_and_reported(self):
+        """Test orders that cannot make the move are left alone"""
+        pending = self._place_order(1)
+        confirmed = self._place_order(1)
+        confirmed.status = 'confirmed'
+        confirmed.save()
+        
+        updated, skipped = OrderBulkTransitionService.transition([pending.id, confirmed.id], 'delivered', self.pharmacist)
+        
+        self.assertEqual(updated, [])
+        self.assertIn('cannot move from Pending', skipped[pending.order_number])
+        self.assertEqual(skipped[confirmed.order_number], 'cannot move from Confirmed to Delivered')
+        
+        updated, skipped = OrderBulkTransitionService.transition([pending.id, confirmed.id], 'cancelled', self.pharmacist)
+        self.assertEqual(len(updated), 2)
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.current_stock, 100)
+    
+    def test_bulk_update_makes_stale_single_order_forms_conflict(self):
+        """Test an order loaded before the bulk change cannot overwrite it"""
+        order = self._place_order(1)
+        stale = Order.objects.get(pk=order.pk)
+        
+        OrderBulkTransitionService.transition([order.id], 'confirmed', self.pharmacist)
+        
+        stale.internal_notes = 'Edited from an old page'
+        with self.assertRaises(OrderConflictError):
+            stale.save()
+    
+    def test_pharmacist_list_form_applies_the_transition(self):
+        """Test the order list bulk form moves the selected orders and reports back"""
+        orders = [self._place_order(1) for _ in range(2)]
+        client = Client()
+        client.force_login(self.pharmacist)
+        
+        response = client.post('/orders/pharmacist/orders/bulk-status/', {
+            'order_ids': [order.id for order in orders],
+            'status': 'confirmed',
+            'next': '/orders/pharmacist/orders/?status=pending',
+        })
+        
+        self.assertRedirects(response, '/orders/pharmacist/orders/?status=pending', fetch_redirect_response=False)
+        self.assertEqual(Order.objects.filter(status='confirmed').count(), 2)
+        
+        client.force_login(self.rep)
+        response = client.post('/orders/api/orders/bulk-status/', {'order_ids': [orders[0].id], 'status': 'processing'},
+                               content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+
+class OrderBatchIngestTests(TestCase):
+    """Test cases for syncing batches of offline orders"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.rep = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.pharmacist = User.objects.create_user(username='pharmacist', password='testpass123', role='pharmacist_admin')
+        self.category = Category.objects.create(name='Antibiotics', is_active=True)
+        self.manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.amoxicillin = Medicine.objects.create(
+            name='Amoxicillin', ndc_number='0001', category=self.category, manufacturer=self.manufacturer,
+            unit_price=Decimal('25.50'), cost_price=Decimal('15.00'), current_stock=10
+        )
+        self.ibuprofen = Medicine.objects.create(
+            name='Ibuprofen', ndc_number='0002', category=self.category, manufacturer=self.manufacturer,
+            unit_price=Decimal('8.00'), cost_price=Decimal('5.00'), current_stock=50
+        )
+    
+    def _payload(self, reference, *lines, **fields):
+        return {
+            'client_reference': reference,
+            'lines': [{'medicine_id': medicine.id, 'quantity': quantity} for medicine, quantity in lines],
+            **fields,
+        }
+    
+    def test_batch_creates_orders_items_and_reservations(self):
+        """Test accepted orders are written with their items, holds, counters and one summary notification"""
+        from common.models import ChangeEvent, Notification
+        payloads = [
+            self._payload('dev-1', (self.amoxicillin, 2), (self.ibuprofen, 3), delivery_method='delivery'),
+            self._payload('dev-2', (self.ibuprofen, 1), (self.ibuprofen, 4)),
+        ]
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            results = OrderBatchIngestService.ingest(self.rep, payloads)
+        
+        self.assertEqual([result['status'] for result in results], ['created', 'created'])
+        first, second = (result['order'] for result in results)
+        first.refresh_from_db()
+        self.assertEqual(first.client_reference, 'dev-1')
+        self.assertEqual(first.subtotal, Decimal('75.00'))
+        self.assertEqual(first.total_amount, Decimal('91.00'))
+        self.assertEqual(second.items.get().quantity, 5)
+        self.assertEqual(
+            StockReservationService.reserved_quantities([self.amoxicillin.id, self.ibuprofen.id]),
+            {self.amoxicillin.id: 2, self.ibuprofen.id: 8}
+        )
+        self.assertEqual(OrderStatusCounterService.get_counts(self.rep)['pending'], 2)
+        self.assertEqual(ChangeEvent.objects.filter(event_type='order_status', audience='staff').count(), 2)
+        self.assertEqual(Notification.objects.filter(user=self.rep).count(), 1)
+        self.assertEqual(Notification.objects.filter(user=self.pharmacist, title='2 New Orders').count(), 1)
+    
+    def test_orders_are_judged_one_by_one(self):
+        """Test stale prices and stock used up by earlier orders reject only their own order"""
+        payloads = [
+            self._payload('dev-1', (self.amoxicillin, 8)),
+            self._payload('dev-2', (self.amoxicillin, 3)),
+            {'client_reference': 'dev-3', 'lines': [{'medicine_id': self.ibuprofen.id, 'quantity': 1, 'unit_price': '7.50'}]},
+            {'client_reference': 'dev-4', 'lines': [{'medicine_id': self.ibuprofen.id, 'quantity': 1, 'unit_price': '8.00'}]},
+            {'client_reference': 'dev-5', 'lines': []},
+            self._payload('dev-4', (self.ibuprofen, 1)),
+        ]
+        
+        results = OrderBatchIngestService.ingest(self.rep, payloads)
+        
+        self.assertEqual(
+            [result['status'] for result in results],
+            ['created', 'rejected', 'rejected', 'created', 'rejected', 'rejected']
+        )
+        self.assertEqual(results[1]['errors'], ['Insufficient stock for Amoxicillin. Available: 2, Requested: 3'])
+        self.assertIn('changed from ₱7.50 to ₱8.00', results[2]['errors'][0])
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(OrderStatusCounterService.get_counts(self.rep)['pending'], 2)
+    
+    def test_retry_after_integrity_error_works_inside_a_transaction(self):
+        """Test a failed first pass is rolled back to its savepoint and retried in the caller's transaction"""
+        bulk_create = Order.objects.bulk_create
+        calls = []
+        
+        def collide_once(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 1:
+                raise IntegrityError('duplicate key value violates unique constraint')
+            return bulk_create(*args, **kwargs)
+        
+        with transaction.atomic():
+            with patch.object(Order.objects, 'bulk_create', side_effect=collide_once):
+                results = OrderBatchIngestService.ingest(self.rep, [self._payload('dev-1', (self.ibuprofen, 2))])
+            self.assertEqual(Order.objects.count(), 1)
+        
+        self.assertEqual(results[0]['status'], 'created')
+        self.assertEqual(OrderStatusCounterService.get_counts(self.rep)['pending'], 1)
+        self.assertEqual(StockReservation.objects.count(), 1)
+    
+    def test_resent_batch_reports_existing_orders(self):
+        """Test syncing the same batch twice does not place its orders twice"""
+        payloads = [self._payload('dev-1', (self.ibuprofen, 2))]
+        first = OrderBatchIngestService.ingest(self.rep, payloads)[0]
+        
+        again = OrderBatchIngestService.ingest(self.rep, payloads)[0]
+        
+        self.assertEqual(again['status'], 'duplicate')
+        self.assertEqual(again['order'].pk, first['order'].pk)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(StockReservation.objects.count(), 1)
+    
+    def test_batch_api_is_for_sales_reps(self):
+        """Test the sync endpoint reports per order and refuses other roles"""
+        client = Client()
+        client.force_login(self.rep)
+        body = {'orders': [
+            self._payload('dev-1', (self.ibuprofen, 2)),
+            self._payload('dev-2', (self.amoxicillin, 99)),
+        ]}
+        
+        response = client.post('/orders/api/orders/batch/', body, content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['created'], 1)
+        self.assertEqual(data['results'][0]['order_status'], 'pending')
+        self.assertEqual(data['results'][1]['status'], 'rejected')
+        
+        client.force_login(self.pharmacist)
+        response = client.post('/orders/api/orders/batch/', body, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class OrderPlacementConcurrencyTests(TransactionTestCase):
+    """Parallel order placement never over-reserves stock"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.users = [
+            User.objects.create_user(username=f'salesrep{i}', password='testpass123', role='sales_rep')
+            for i in range(8)
+        ]
+        category = Category.objects.create(name='Antibiotics', is_active=True)
+        manufacturer = Manufacturer.objects.create(name='Pfizer Inc.', country='USA', is_active=True)
+        self.medicine = Medicine.objects.create(
+            name='Amoxicillin',
+            category=category,
+            manufacturer=manufacturer,
+            unit_price=Decimal('25.50'),
+            cost_price=Decimal('15.00'),
+            current_stock=9
+        )
+    
+    def test_parallel_orders_do_not_oversell(self):
+        """Test exactly the stock on hand is reserved when sales reps order at the same time"""
+        barrier = threading.Barrier(len(self.users))
+        rejected = []
+        errors = []
+        
+        def place(user):
+            try:
+                barrier.wait()
+                OrderPlacementService.place_order(
+                    Order(sales_rep=user, customer_name=user.username),
+                    [{'medicine': Medicine.objects.get(pk=self.medicine.pk), 'quantity': 3}]
+                )
+            except InsufficientStockError:
+                rejected.append(user)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=place, args=(user,)) for user in self.users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        self.assertEqual(len(rejected), len(self.users) - 3)
+        self.assertEqual(OrderItem.objects.filter(medicine=self.medicine).count(), 3)
+        self.assertEqual(StockReservation.objects.filter(medicine=self.medicine).count(), 3)
+        self.assertEqual(self.medicine.available_stock, 0)
@@ -29,15 +29,24 @@ urlpatterns = [
     # Pharmacist/Admin Order Management URLs
     path('pharmacist/dashboard/', views.OrderFulfillmentDashboardView.as_view(), name='pharmacist_dashboard'),
     path('pharmacist/orders/', views.PharmacistOrderListView.as_view(), name='pharmacist_order_list'),
+    path('pharmacist/orders/bulk-status/', views.PharmacistOrderBulkStatusView.as_view(), name='pharmacist_order_bulk_status'),
     path('pharmacist/orders/<int:pk>/', views.PharmacistOrderDetailView.as_view(), name='pharmacist_order_detail'),
+    path('pharmacist/pick-list/', views.PickListView.as_view(), name='pick_list'),
+    path('pharmacist/packing-slips/', views.PackingSlipsView.as_view(), name='packing_slips'),
     
     # API endpoints
     path('api/orders/', views.OrderListAPIView.as_view(), name='api_order_list'),
     path('api/orders/<int:pk>/', views.OrderDetailAPIView.as_view(), name='api_order_detail'),
+    path('api/orders/batch/', views.OrderBatchCreateAPIView.as_view(), name='api_order_batch'),
     path('api/cart/', views.CartAPIView.as_view(), name='api_cart'),
     path('api/cart/add/', views.CartAddAPIView.as_view(), name='api_cart_add'),
-    path('api/cart/remove/', views.CartRemoveAPIView.as_view(), name='api_cart_remove'),
-    path('api/cart/update/', views.CartUpdateAPIView.as_view(), name='api_cart_update'),
+    path('api/cart/badge/', views.CartBadgeAPIView.as_view(), name='api_cart_badge'),
+    path('api/cart/remove/<int:item_id>/', views.CartRemoveAPIView.as_view(), name='api_cart_remove'),
+    path('api/cart/update/<int:item_id>/', views.CartUpdateAPIView.as_view(), name='api_cart_update'),
+    path('api/prescriptions/queue/', views.PrescriptionQueueAPIView.as_view(), name='api_prescription_queue'),
+    path('api/prescriptions/queue/heartbeat/', views.PrescriptionQueueHeartbeatAPIView.as_view(), name='api_prescription_queue_heartbeat'),
+    path('api/prescriptions/queue/release/', views.PrescriptionQueueReleaseAPIView.as_view(), name='api_prescription_queue_release'),
+    path('api/orders/bulk-status/', views.OrderBulkStatusAPIView.as_view(), name='api_order_bulk_status'),
     path('api/pharmacist/dashboard/', views.PharmacistDashboardAPIView.as_view(), name='api_pharmacist_dashboard'),
     path('api/sales-rep/dashboard/', views.SalesRepDashboardAPIView.as_view(), name='api_sales_rep_dashboard'),
     
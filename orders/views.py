@@ -4,10 +4,12 @@ from django.contrib.auth.decorators import login_required
 from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.views import View
 from django.urls import reverse_lazy, reverse
+from django.utils.http import url_has_allowed_host_and_scheme
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Q, Sum, F, Case, When, IntegerField
+from django.db import transaction as db_transaction
+from django.db.models import Q, Sum, Count, F, Case, When, IntegerField
 from django.http import JsonResponse
-from django.core.paginator import Paginator
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
@@ -17,8 +19,52 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 
-from .models import Order, OrderItem, OrderStatusHistory, Cart, CartItem
-from .forms import OrderForm, OrderWithItemsForm, OrderStatusUpdateForm, PrescriptionUploadForm, PrescriptionVerifyForm, OrderCancelForm, CartAddForm, ManualPaymentForm
+from common.dates import date_range_lookups
+from common.exports import CSVExportMixin
+from common.idempotency import IdempotentMixin, new_idempotency_key
+from common.pagination import InvalidCursor, KeysetPaginator, KeysetPaginationMixin, keyset_page_data
+from .models import Order, OrderItem, OrderStatusHistory, CartItem
+from .services import (
+    OrderPlacementService, OrderBatchIngestService, InsufficientStockError, OrderConflictError, InvalidTransitionError,
+    CartService, OrderBulkTransitionService, OrderSearchService, OrderStatusCounterService, PickListService,
+    PrescriptionQueueService
+)
+from .serializers import OrderDetailSerializer, OrderListSerializer, PrescriptionClaimSerializer, SalesRepOrderSerializer
+from .forms import OrderForm, OrderWithItemsForm, OrderLineFormSet, OrderStatusUpdateForm, OrderBulkStatusForm, PickListForm, PrescriptionUploadForm, PrescriptionVerifyForm, OrderCancelForm, CartAddForm, ManualPaymentForm
+
+
+# Columns of the order list CSV exports
+ORDER_EXPORT_COLUMNS = [
+    ('Order number', 'order_number'),
+    ('Created', 'created_at'),
+    ('Customer', 'customer_name'),
+    ('Sales rep', 'sales_rep__username'),
+    ('Status', 'status'),
+    ('Payment status', 'payment_status'),
+    ('Delivery method', 'delivery_method'),
+    ('Subtotal', 'subtotal'),
+    ('Tax', 'tax_amount'),
+    ('Shipping', 'shipping_cost'),
+    ('Total', 'total_amount'),
+]
+
+
+
+def save_order_change(order, change):
+    """
+    Apply ``change(order)`` and save it. If someone else updated the order
+    first, reload it and apply the change once more; a second conflict
+    raises OrderConflictError for the caller to report.
+    """
+    change(order)
+    try:
+        with db_transaction.atomic():
+            order.save()
+    except OrderConflictError:
+        order.refresh_from_db()
+        change(order)
+        order.save()
+    return order
 
 
 # Dashboard View
@@ -39,8 +85,7 @@ class OrderDashboardView(LoginRequiredMixin, TemplateView):
         completed_orders = Order.objects.filter(sales_rep=user, status='delivered').count()
         
         # Get cart information
-        cart, created = Cart.objects.get_or_create(sales_rep=user)
-        cart_items = cart.items.all()
+        cart_item_count, cart_total = CartService.get_totals(user)
         
         # Get notifications for current user (only unread for dashboard widget)
         from common.services import NotificationService
@@ -52,8 +97,8 @@ class OrderDashboardView(LoginRequiredMixin, TemplateView):
             'total_orders': total_orders,
             'pending_orders': pending_orders,
             'completed_orders': completed_orders,
-            'cart_items': cart_items,
-            'cart_total': cart.total_amount,
+            'cart_item_count': cart_item_count,
+            'cart_total': cart_total,
             'notifications': notifications,
             'unread_notifications_count': unread_notifications_count,
         })
@@ -62,12 +107,21 @@ class OrderDashboardView(LoginRequiredMixin, TemplateView):
 
 
 # Order Management Views
-class OrderListView(LoginRequiredMixin, ListView):
+class OrderListView(LoginRequiredMixin, KeysetPaginationMixin, CSVExportMixin, ListView):
     """List all orders for the current user or all orders for pharmacist/admin"""
     model = Order
     template_name = 'orders/order_list.html'
     context_object_name = 'orders'
     paginate_by = 20
+    export_columns = ORDER_EXPORT_COLUMNS
+    export_filename = 'orders'
+    
+    def get_keyset_ordering(self):
+        user = self.request.user
+        if not (user.is_pharmacist_admin or user.is_admin) and not self.request.GET.get('status'):
+            # Sales reps see pending orders first (see the status_priority annotation)
+            return ('status_priority', '-created_at', '-id')
+        return self.keyset_ordering
     
     def get_queryset(self):
         user = self.request.user
@@ -84,7 +138,7 @@ class OrderListView(LoginRequiredMixin, ListView):
             if date_from:
                 try:
                     date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
-                    queryset = queryset.filter(created_at__date__gte=date_from_obj)
+                    queryset = queryset.filter(**date_range_lookups('created_at', start=date_from_obj))
                 except ValueError:
                     pass
             
@@ -92,10 +146,12 @@ class OrderListView(LoginRequiredMixin, ListView):
             if date_to:
                 try:
                     date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
-                    queryset = queryset.filter(created_at__date__lte=date_to_obj)
+                    queryset = queryset.filter(**date_range_lookups('created_at', end=date_to_obj))
                 except ValueError:
                     pass
             
+            queryset = OrderSearchService.search(queryset, self.request.GET.get('search'))
+            
             return queryset.order_by('-created_at')
         else:
             # Sales reps can only see their own orders - prioritize pending orders first
@@ -111,7 +167,7 @@ class OrderListView(LoginRequiredMixin, ListView):
             if date_from:
                 try:
                     date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
-                    queryset = queryset.filter(created_at__date__gte=date_from_obj)
+                    queryset = queryset.filter(**date_range_lookups('created_at', start=date_from_obj))
                 except ValueError:
                     pass
             
@@ -119,10 +175,12 @@ class OrderListView(LoginRequiredMixin, ListView):
             if date_to:
                 try:
                     date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
-                    queryset = queryset.filter(created_at__date__lte=date_to_obj)
+                    queryset = queryset.filter(**date_range_lookups('created_at', end=date_to_obj))
                 except ValueError:
                     pass
             
+            queryset = OrderSearchService.search(queryset, self.request.GET.get('search'))
+            
             # Only apply priority ordering if no status filter is applied
             if not status_filter:
                 queryset = queryset.annotate(
@@ -160,6 +218,10 @@ class OrderListView(LoginRequiredMixin, ListView):
         if date_to:
             query_params['date_to'] = date_to
         
+        search = self.request.GET.get('search')
+        if search:
+            query_params['search'] = search
+        
         context['query_string'] = urlencode(query_params)
         context['current_status'] = status_filter or ''
         context['current_date_from'] = date_from or ''
@@ -168,42 +230,32 @@ class OrderListView(LoginRequiredMixin, ListView):
         # Add dashboard statistics for sales reps only
         user = self.request.user
         if not (user.is_pharmacist_admin or user.is_admin):
-            # Get all orders for this sales rep (before filters) for statistics
-            user_orders = Order.objects.filter(sales_rep=user)
-            
-            # Order statistics
-            context['total_orders'] = user_orders.count()
-            context['pending_orders'] = user_orders.filter(status='pending').count()
-            context['processing_orders'] = user_orders.filter(status='processing').count()
-            context['confirmed_orders'] = user_orders.filter(status='confirmed').count()
-            context['ready_orders'] = user_orders.filter(status='ready_for_pickup').count()
-            context['shipped_orders'] = user_orders.filter(status='shipped').count()
-            context['delivered_orders'] = user_orders.filter(status='delivered').count()
-            context['cancelled_orders'] = user_orders.filter(status='cancelled').count()
+            # Order statistics from the maintained per-status counters
+            counts = OrderStatusCounterService.get_counts(sales_rep=user)
+            context['total_orders'] = counts['total']
+            context['pending_orders'] = counts['pending']
+            context['processing_orders'] = counts['processing']
+            context['confirmed_orders'] = counts['confirmed']
+            context['ready_orders'] = counts['ready_for_pickup']
+            context['shipped_orders'] = counts['shipped']
+            context['delivered_orders'] = counts['delivered']
+            context['cancelled_orders'] = counts['cancelled']
+            context['orders_by_status'] = OrderStatusCounterService.by_status(counts)
             
-            # Calculate total revenue
-            context['total_revenue'] = user_orders.filter(
-                status='delivered',
-                payment_status='paid'
-            ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
-            
-            # Orders by status breakdown
-            orders_by_status = {}
-            for status_code, status_name in Order.STATUS_CHOICES:
-                orders_by_status[status_code] = {
-                    'name': status_name,
-                    'count': user_orders.filter(status=status_code).count()
-                }
-            context['orders_by_status'] = orders_by_status
-            
-            # Payment status statistics
-            context['paid_orders'] = user_orders.filter(payment_status='paid').count()
-            context['pending_payment_orders'] = user_orders.filter(payment_status='pending').count()
+            # Revenue and payment status statistics in one pass
+            payment_stats = Order.objects.filter(sales_rep=user).aggregate(
+                total_revenue=Sum('total_amount', filter=Q(status='delivered', payment_status='paid')),
+                paid_orders=Count('id', filter=Q(payment_status='paid')),
+                pending_payment_orders=Count('id', filter=Q(payment_status='pending')),
+            )
+            context['total_revenue'] = payment_stats['total_revenue'] or Decimal('0.00')
+            context['paid_orders'] = payment_stats['paid_orders']
+            context['pending_payment_orders'] = payment_stats['pending_payment_orders']
         
         return context
 
 
-class OrderCreateView(LoginRequiredMixin, CreateView):
+class OrderCreateView(LoginRequiredMixin, IdempotentMixin, CreateView):
     """Create new order with medicine selection"""
     model = Order
     template_name = 'orders/order_form.html'
@@ -217,29 +269,46 @@ class OrderCreateView(LoginRequiredMixin, CreateView):
         return super().dispatch(request, *args, **kwargs)
     
     def get_initial(self):
-        """Pre-populate form with cart items and sales rep details"""
+        """Pre-populate form with sales rep details"""
         initial = super().get_initial()
         
         # Pre-populate delivery address with sales rep address
         user = self.request.user
         initial['delivery_address'] = getattr(user, 'address', '') or ''
         
-        # Check if user has cart items and pre-populate the form
-        try:
-            cart = Cart.objects.get(sales_rep=self.request.user)
-            cart_items = cart.items.select_related('medicine').all()
-            
-            # Pre-populate medicine fields with cart items
-            for i, item in enumerate(cart_items[:5], 1):  # Limit to 5 items
-                initial[f'medicine_{i}'] = item.medicine
-                initial[f'quantity_{i}'] = item.quantity
-                
-        except Cart.DoesNotExist:
-            pass
-            
         return initial
     
-    def form_valid(self, form):
+    def get_line_formset(self):
+        """Medicine lines, pre-populated with the cart on first display"""
+        if self.request.method == 'POST':
+            return OrderLineFormSet(self.request.POST, prefix='lines')
+        
+        cart_items, _, _ = CartService.get_contents(self.request.user)
+        return OrderLineFormSet(prefix='lines', initial=[
+            {
+                'medicine': item.medicine,
+                'medicine_label': f'{item.medicine.name} ({item.medicine.strength})',
+                'quantity': item.quantity,
+            }
+            for item in cart_items
+        ])
+    
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('line_formset', self.get_line_formset())
+        return super().get_context_data(**kwargs)
+    
+    def post(self, request, *args, **kwargs):
+        self.object = None
+        form = self.get_form()
+        line_formset = self.get_line_formset()
+        if form.is_valid() and line_formset.is_valid():
+            return self.form_valid(form, line_formset)
+        return self.form_invalid(form, line_formset)
+    
+    def form_invalid(self, form, line_formset):
+        return self.render_to_response(self.get_context_data(form=form, line_formset=line_formset))
+    
+    def form_valid(self, form, line_formset):
         # Set the sales rep
         form.instance.sales_rep = self.request.user
         
@@ -253,73 +322,18 @@ class OrderCreateView(LoginRequiredMixin, CreateView):
         if not form.instance.delivery_address:
             form.instance.delivery_address = getattr(user, 'address', '') or ''
         
-        # Calculate totals before saving
-        subtotal = Decimal('0.00')
-        medicines_data = []
-        
-        # Collect medicine data and calculate subtotal
-        for i in range(1, 6):
-            medicine = form.cleaned_data.get(f'medicine_{i}')
-            quantity = form.cleaned_data.get(f'quantity_{i}')
-            unit = form.cleaned_data.get(f'unit_{i}', 'boxes')  # Always use boxes
-            
-            if medicine and quantity:
-                # Check stock availability before creating order
-                if medicine.current_stock < quantity:
-                    messages.error(self.request, f'Insufficient stock for {medicine.name}. Available: {medicine.current_stock}, Requested: {quantity}')
-                    return self.form_invalid(form)
-                
-                item_total = medicine.unit_price * quantity
-                subtotal += item_total
-                medicines_data.append({
-                    'medicine': medicine,
-                    'quantity': quantity,
-                    'unit': unit,
-                    'unit_price': medicine.unit_price,
-                    'total_price': item_total
-                })
-        
-        # Set order totals
-        form.instance.subtotal = subtotal
-        form.instance.tax_amount = subtotal * Decimal('0.08')  # 8% tax
-        form.instance.shipping_cost = Decimal('10.00') if form.cleaned_data.get('delivery_method') == 'delivery' else Decimal('0.00')
-        form.instance.discount_amount = Decimal('0.00')
-        form.instance.total_amount = subtotal + form.instance.tax_amount + form.instance.shipping_cost - form.instance.discount_amount
-        
-        # Save the order first
-        response = super().form_valid(form)
-        
-        # Create order items from the selected medicines
-        for medicine_data in medicines_data:
-            OrderItem.objects.create(
-                order=self.object,
-                medicine=medicine_data['medicine'],
-                quantity=medicine_data['quantity'],
-                unit=medicine_data.get('unit', 'pieces'),
-                unit_price=medicine_data['unit_price'],
-                total_price=medicine_data['total_price']
-            )
-            
-            # Update stock and check for low stock alerts
-            medicine = medicine_data['medicine']
-            medicine.current_stock -= medicine_data['quantity']
-            medicine.save()
-            
-            # Check if stock is now low and create notifications
-            from common.services import NotificationService
-            if medicine.current_stock <= medicine.reorder_point:
-                NotificationService.notify_low_stock(medicine, medicine.current_stock)
-        
-        # Send notifications for order placement
-        from common.services import NotificationService
-        NotificationService.notify_order_placed(self.object)
+        # Save the order, its items and the stock reservations together
+        try:
+            self.object = OrderPlacementService.place_order(form.instance, line_formset.lines())
+        except InsufficientStockError as e:
+            messages.error(self.request, str(e))
+            return self.form_invalid(form, line_formset)
+        response = redirect(self.get_success_url())
         
         # Clear the cart after successful order creation
-        try:
-            cart = Cart.objects.get(sales_rep=self.request.user)
-            cart.items.all().delete()
+        if CartService.clear(self.request.user):
             messages.success(self.request, 'Sales order created successfully and cart cleared!')
-        except Cart.DoesNotExist:
+        else:
             messages.success(self.request, 'Sales order created successfully!')
         
         return response
@@ -358,6 +372,8 @@ class OrderDetailView(LoginRequiredMixin, DetailView):
             from .payment_utils import get_payment_context
             payment_context = get_payment_context(self.object)
             context.update(payment_context)
+            # Lets a resubmitted manual payment form be recognised as a retry
+            context['idempotency_key'] = new_idempotency_key()
             
             # Get active payment gateway for public key (if available)
             try:
@@ -434,7 +450,11 @@ class OrderCancelView(LoginRequiredMixin, UpdateView):
     
     def form_valid(self, form):
         self.object.status = 'cancelled'
-        self.object.save()
+        try:
+            self.object.save()
+        except (OrderConflictError, InvalidTransitionError) as e:
+            messages.error(self.request, str(e))
+            return redirect('orders:order_detail', pk=self.object.pk)
         messages.success(self.request, 'Order cancelled successfully!')
         return redirect('orders:order_detail', pk=self.object.pk)
 
@@ -452,11 +472,9 @@ class CartView(LoginRequiredMixin, TemplateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart, created = Cart.objects.get_or_create(sales_rep=self.request.user)
-        cart_items = cart.items.select_related('medicine').all()
+        cart_items, _, cart_subtotal = CartService.get_contents(self.request.user)
         
         # Calculate cart totals
-        cart_subtotal = sum(item.total_price for item in cart_items)
         cart_tax = cart_subtotal * Decimal('0.08')  # 8% tax
         cart_shipping = Decimal('10.00')  # Fixed shipping cost
         cart_total = cart_subtotal + cart_tax + cart_shipping
@@ -484,18 +502,9 @@ class CartAddView(LoginRequiredMixin, CreateView):
         return super().dispatch(request, *args, **kwargs)
     
     def form_valid(self, form):
-        cart, created = Cart.objects.get_or_create(sales_rep=self.request.user)
-        form.instance.cart = cart
-        
-        # Check if item already exists in cart
-        existing_item = CartItem.objects.filter(cart=cart, medicine=form.instance.medicine).first()
-        if existing_item:
-            existing_item.quantity += form.instance.quantity
-            existing_item.save()
-            messages.success(self.request, 'Item quantity updated in cart!')
-        else:
-            form.save()
-            messages.success(self.request, 'Item added to cart!')
+        # Merges with an existing line for the same medicine
+        CartService.add_item(self.request.user, form.cleaned_data['medicine'], form.cleaned_data['quantity'])
+        messages.success(self.request, 'Item added to cart!')
         
         return redirect(self.success_url)
 
@@ -512,12 +521,12 @@ class CartRemoveView(LoginRequiredMixin, DeleteView):
         return super().dispatch(request, *args, **kwargs)
     
     def get_queryset(self):
-        cart, created = Cart.objects.get_or_create(sales_rep=self.request.user)
-        return CartItem.objects.filter(cart=cart)
+        return CartItem.objects.filter(cart__sales_rep=self.request.user)
     
-    def delete(self, request, *args, **kwargs):
-        messages.success(request, 'Item removed from cart!')
-        return super().delete(request, *args, **kwargs)
+    def form_valid(self, form):
+        CartService.remove_item(self.request.user, self.object.pk)
+        messages.success(self.request, 'Item removed from cart!')
+        return redirect(self.success_url)
 
 
 class CartUpdateView(LoginRequiredMixin, UpdateView):
@@ -533,12 +542,12 @@ class CartUpdateView(LoginRequiredMixin, UpdateView):
         return super().dispatch(request, *args, **kwargs)
     
     def get_queryset(self):
-        cart, created = Cart.objects.get_or_create(sales_rep=self.request.user)
-        return CartItem.objects.filter(cart=cart)
+        return CartItem.objects.filter(cart__sales_rep=self.request.user)
     
     def form_valid(self, form):
+        CartService.update_item(self.request.user, self.object.pk, form.cleaned_data['quantity'])
         messages.success(self.request, 'Cart updated!')
-        return super().form_valid(form)
+        return redirect(self.success_url)
 
 
 class CartClearView(LoginRequiredMixin, TemplateView):
@@ -553,13 +562,11 @@ class CartClearView(LoginRequiredMixin, TemplateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        cart, created = Cart.objects.get_or_create(sales_rep=self.request.user)
-        context['cart_items'] = cart.items.select_related('medicine').all()
+        context['cart_items'], _, _ = CartService.get_contents(self.request.user)
         return context
     
     def post(self, request, *args, **kwargs):
-        cart, created = Cart.objects.get_or_create(sales_rep=request.user)
-        cart.items.all().delete()
+        CartService.clear(request.user)
         messages.success(request, 'Cart cleared!')
         return redirect('orders:cart')
 
@@ -601,6 +608,17 @@ class PrescriptionVerifyView(LoginRequiredMixin, UpdateView):
         if not (request.user.is_pharmacist_admin or request.user.is_admin):
             messages.error(request, 'Prescription verification is only available for pharmacists and administrators.')
             return redirect('home')
+        
+        # Leave prescriptions another pharmacist took from the queue to them
+        order = get_object_or_404(Order.objects.select_related('verification_claimed_by'), pk=kwargs['pk'])
+        holder = PrescriptionQueueService.claimed_by_other(order, request.user)
+        if holder is not None:
+            messages.warning(
+                request,
+                f'{holder.get_full_name() or holder.username} is verifying this prescription. '
+                'It goes back to the queue if they stop working on it.'
+            )
+            return redirect('orders:pharmacist_order_detail', pk=order.pk)
         return super().dispatch(request, *args, **kwargs)
     
     def get_queryset(self):
@@ -608,12 +626,29 @@ class PrescriptionVerifyView(LoginRequiredMixin, UpdateView):
         return Order.objects.all()
     
     def form_valid(self, form):
+        # Only the fields this form owns are written; the queue changes the
+        # claim columns with plain updates that a full save would overwrite
+        order = form.save(commit=False)
+        update_fields = ['prescription_verified', 'internal_notes', 'updated_at']
         if form.cleaned_data['prescription_verified']:
-            form.instance.verified_by = self.request.user
-            form.instance.verified_at = timezone.now()
+            order.verified_by = self.request.user
+            order.verified_at = timezone.now()
+            order.verification_claimed_by = None
+            order.verification_lease_expires_at = None
+            update_fields += ['verified_by', 'verified_at', 'verification_claimed_by', 'verification_lease_expires_at']
+        
+        try:
+            order.save(update_fields=update_fields)
+        except OrderConflictError as e:
+            messages.error(self.request, str(e))
+            return redirect('orders:prescription_verify', pk=order.pk)
+        self.object = order
         
         messages.success(self.request, 'Prescription verification updated!')
-        return super().form_valid(form)
+        return redirect(self.get_success_url())
+    
+    def get_success_url(self):
+        return reverse('orders:pharmacist_order_detail', kwargs={'pk': self.object.pk})
 
 
 # API Views
@@ -630,35 +665,153 @@ class OrderListAPIView(APIView):
             # Sales reps can only see their own orders
             orders = Order.objects.filter(sales_rep=user).order_by('-created_at')
         
-        # Pagination
-        page = int(request.GET.get('page', 1))
-        per_page = int(request.GET.get('per_page', 20))
+        orders = OrderSearchService.search(orders, request.GET.get('search'))
+        orders = OrderListSerializer.plan(orders)
         
-        paginator = Paginator(orders, per_page)
-        page_obj = paginator.get_page(page)
+        # Cursor pagination: deep pages cost the same as the first
+        per_page = min(int(request.GET.get('per_page', 20)), 100)
         
-        orders_data = []
-        for order in page_obj:
-            orders_data.append({
-                'id': order.id,
-                'order_number': order.order_number,
-                'status': order.status,
-                'payment_status': order.payment_status,
-                'total_amount': float(order.total_amount),
-                'created_at': order.created_at,
-                'delivery_method': order.delivery_method,
-            })
+        paginator = KeysetPaginator(orders, per_page)
+        try:
+            page_obj = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'orders': OrderListSerializer(page_obj, many=True).data,
+            'pagination': keyset_page_data(page_obj, include_count=request.GET.get('count') == 'true'),
+        })
+
+
+def _order_ids(data):
+    """The "order_ids" list of a request body as ints, or None if it is malformed"""
+    order_ids = data.get('order_ids') if isinstance(data, dict) else None
+    if not isinstance(order_ids, list):
+        return None
+    try:
+        return [int(order_id) for order_id in order_ids]
+    except (TypeError, ValueError):
+        return None
+
+
+class PrescriptionQueueAPIView(APIView):
+    """
+    Prescription verification queue - pharmacist/admin only
+    
+    GET lists the prescriptions the pharmacist has claimed; POST {"count": n}
+    claims the next n. Claims lapse after PRESCRIPTION_CLAIM_LEASE_SECONDS
+    unless renewed through the heartbeat endpoint.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        if not (request.user.is_pharmacist_admin or request.user.is_admin):
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        return self._claims_response(request.user)
+    
+    def post(self, request):
+        if not (request.user.is_pharmacist_admin or request.user.is_admin):
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            count = int(request.data.get('count', 1))
+        except (TypeError, ValueError, AttributeError):
+            count = 0
+        if not 1 <= count <= PrescriptionQueueService.MAX_CLAIMS:
+            return Response(
+                {'error': f'Claim between 1 and {PrescriptionQueueService.MAX_CLAIMS} prescriptions'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        PrescriptionQueueService.claim(request.user, count)
+        return self._claims_response(request.user)
+    
+    @staticmethod
+    def _claims_response(user):
+        return Response({
+            'claimed': PrescriptionClaimSerializer(PrescriptionQueueService.claimed_by(user), many=True).data,
+            'waiting': PrescriptionQueueService.queue().count(),
+            'lease_seconds': settings.PRESCRIPTION_CLAIM_LEASE_SECONDS,
+        })
+
+
+class PrescriptionQueueHeartbeatAPIView(APIView):
+    """Renew the pharmacist's claims - POST {"order_ids": [...]}"""
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        if not (request.user.is_pharmacist_admin or request.user.is_admin):
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
         
+        order_ids = _order_ids(request.data)
+        if order_ids is None:
+            return Response({'error': 'Send an "order_ids" list'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        held = PrescriptionQueueService.heartbeat(request.user, order_ids)
         return Response({
-            'orders': orders_data,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total_pages': paginator.num_pages,
-                'total_count': paginator.count,
-                'has_next': page_obj.has_next(),
-                'has_previous': page_obj.has_previous(),
+            'held': held,
+            'lost': [order_id for order_id in order_ids if order_id not in held],
+        })
+
+
+class PrescriptionQueueReleaseAPIView(APIView):
+    """Hand the pharmacist's claims back to the queue - POST {"order_ids": [...]}"""
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        if not (request.user.is_pharmacist_admin or request.user.is_admin):
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        
+        order_ids = _order_ids(request.data)
+        if order_ids is None:
+            return Response({'error': 'Send an "order_ids" list'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({'released': PrescriptionQueueService.release(request.user, order_ids)})
+
+
+class OrderBatchCreateAPIView(APIView):
+    """
+    API endpoint for syncing orders a sales rep took offline - sales reps only
+    
+    POST {"orders": [{"client_reference": "...", "lines": [{"medicine_id": 1, "quantity": 2, "unit_price": "12.50"}], ...}]}
+    answers with one result per order, in the order sent.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        if not request.user.is_sales_rep:
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        
+        payloads = request.data.get('orders') if isinstance(request.data, dict) else None
+        if not isinstance(payloads, list) or not payloads:
+            return Response({'error': 'Send a non-empty "orders" list'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            results = OrderBatchIngestService.ingest(request.user, payloads)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results_data = []
+        for result in results:
+            data = {
+                'client_reference': result['client_reference'],
+                'status': result['status'],
             }
+            order = result['order']
+            if order is not None:
+                data.update({
+                    'id': order.id,
+                    'order_number': order.order_number,
+                    'order_status': order.status,
+                    'total_amount': float(order.total_amount),
+                })
+            if result['errors']:
+                data['errors'] = result['errors']
+            results_data.append(data)
+        
+        return Response({
+            'created': sum(1 for result in results if result['status'] == 'created'),
+            'results': results_data,
         })
 
 
@@ -669,46 +822,25 @@ class OrderDetailAPIView(APIView):
     def get(self, request, pk):
         try:
             user = request.user
+            orders = OrderDetailSerializer.plan(Order.objects.all())
             if user.is_pharmacist_admin or user.is_admin:
                 # Pharmacist/Admin and Admin can view any order
-                order = Order.objects.get(pk=pk)
+                order = orders.get(pk=pk)
             else:
                 # Sales reps can only view their own orders
-                order = Order.objects.get(pk=pk, sales_rep=user)
-            items_data = []
-            for item in order.items.all():
-                items_data.append({
-                    'medicine': {
-                        'id': item.medicine.id,
-                        'name': item.medicine.name,
-                        'strength': item.medicine.strength,
-                    },
-                    'quantity': item.quantity,
-                    'unit_price': float(item.unit_price),
-                    'total_price': float(item.total_price),
-                })
+                order = orders.get(pk=pk, sales_rep=user)
             
-            return Response({
-                'id': order.id,
-                'order_number': order.order_number,
-                'status': order.status,
-                'payment_status': order.payment_status,
-                'subtotal': float(order.subtotal),
-                'tax_amount': float(order.tax_amount),
-                'shipping_cost': float(order.shipping_cost),
-                'discount_amount': float(order.discount_amount),
-                'total_amount': float(order.total_amount),
-                'delivery_method': order.delivery_method,
-                'delivery_address': order.delivery_address,
-                'prescription_required': order.prescription_required,
-                'prescription_verified': order.prescription_verified,
-                'created_at': order.created_at,
-                'items': items_data,
-            })
+            return Response(OrderDetailSerializer(order).data)
         except Order.DoesNotExist:
             return Response({'error': 'Order not found'}, status=status.HTTP_404_NOT_FOUND)
 
 
+def _cart_totals(user):
+    """Cart totals returned with every cart change, for updating badges in place"""
+    total_items, total_amount = CartService.get_totals(user)
+    return {'total_items': total_items, 'total_amount': float(total_amount)}
+
+
 class CartAPIView(APIView):
     """API view for cart - only for sales reps"""
     permission_classes = [IsAuthenticated]
@@ -717,9 +849,9 @@ class CartAPIView(APIView):
         if not request.user.is_sales_rep:
             return Response({'error': 'Cart access is only available for sales representatives'}, status=status.HTTP_403_FORBIDDEN)
         
-        cart, created = Cart.objects.get_or_create(sales_rep=request.user)
+        cart_items, total_items, total_amount = CartService.get_contents(request.user)
         items_data = []
-        for item in cart.items.select_related('medicine').all():
+        for item in cart_items:
             items_data.append({
                 'id': item.id,
                 'medicine': {
@@ -734,11 +866,22 @@ class CartAPIView(APIView):
         
         return Response({
             'items': items_data,
-            'total_amount': float(cart.total_amount),
-            'total_items': cart.total_items,
+            'total_amount': float(total_amount),
+            'total_items': total_items,
         })
 
 
+class CartBadgeAPIView(APIView):
+    """API view for the navbar cart count - only for sales reps"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        if not request.user.is_sales_rep:
+            return Response({'error': 'Cart access is only available for sales representatives'}, status=status.HTTP_403_FORBIDDEN)
+        
+        return Response({'total_items': CartService.get_badge_count(request.user)})
+
+
 class CartAddAPIView(APIView):
     """API view for adding item to cart - only for sales reps"""
     permission_classes = [IsAuthenticated]
@@ -753,21 +896,13 @@ class CartAddAPIView(APIView):
         try:
             from inventory.models import Medicine
             medicine = Medicine.objects.get(id=medicine_id, is_active=True, is_available=True)
+            CartService.add_item(request.user, medicine, quantity)
             
-            cart, created = Cart.objects.get_or_create(sales_rep=request.user)
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                medicine=medicine,
-                defaults={'quantity': quantity}
-            )
-            
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
-            
-            return Response({'message': 'Item added to cart successfully'})
+            return Response({'message': 'Item added to cart successfully', **_cart_totals(request.user)})
         except Medicine.DoesNotExist:
             return Response({'error': 'Medicine not found'}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 class CartRemoveAPIView(APIView):
@@ -779,10 +914,8 @@ class CartRemoveAPIView(APIView):
             return Response({'error': 'Cart access is only available for sales representatives'}, status=status.HTTP_403_FORBIDDEN)
         
         try:
-            cart, created = Cart.objects.get_or_create(sales_rep=request.user)
-            cart_item = CartItem.objects.get(id=item_id, cart=cart)
-            cart_item.delete()
-            return Response({'message': 'Item removed from cart successfully'})
+            CartService.remove_item(request.user, item_id)
+            return Response({'message': 'Item removed from cart successfully', **_cart_totals(request.user)})
         except CartItem.DoesNotExist:
             return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -798,23 +931,24 @@ class CartUpdateAPIView(APIView):
         quantity = request.data.get('quantity')
         
         try:
-            cart, created = Cart.objects.get_or_create(sales_rep=request.user)
-            cart_item = CartItem.objects.get(id=item_id, cart=cart)
-            cart_item.quantity = quantity
-            cart_item.save()
-            return Response({'message': 'Cart updated successfully'})
+            CartService.update_item(request.user, item_id, quantity)
+            return Response({'message': 'Cart updated successfully', **_cart_totals(request.user)})
         except CartItem.DoesNotExist:
             return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
 # Pharmacist/Admin Order Management Views
 
-class PharmacistOrderListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class PharmacistOrderListView(LoginRequiredMixin, UserPassesTestMixin, KeysetPaginationMixin, CSVExportMixin, ListView):
     """View for pharmacist/admin to see all orders"""
     model = Order
     template_name = 'orders/pharmacist_order_list.html'
     context_object_name = 'orders'
     paginate_by = 20
+    export_columns = ORDER_EXPORT_COLUMNS
+    export_filename = 'orders'
     
     def test_func(self):
         return self.request.user.is_pharmacist_admin or self.request.user.is_admin
@@ -842,12 +976,7 @@ class PharmacistOrderListView(LoginRequiredMixin, UserPassesTestMixin, ListView)
                 pass  # Invalid medicine ID, skip filter
         
         # Search by order number or customer name
-        search = self.request.GET.get('search')
-        if search:
-            queryset = queryset.filter(
-                Q(order_number__icontains=search) |
-                Q(customer_name__icontains=search)
-            )
+        queryset = OrderSearchService.search(queryset, self.request.GET.get('search'))
         
         return queryset
     
@@ -858,7 +987,6 @@ class PharmacistOrderListView(LoginRequiredMixin, UserPassesTestMixin, ListView)
         
         context['status_choices'] = Order.STATUS_CHOICES
         context['payment_status_choices'] = Order.PAYMENT_STATUS_CHOICES
-        context['medicines'] = Medicine.objects.filter(is_active=True).order_by('name')
         
         # Get current filter values
         current_status = self.request.GET.get('status', '')
@@ -869,6 +997,10 @@ class PharmacistOrderListView(LoginRequiredMixin, UserPassesTestMixin, ListView)
         context['current_status'] = current_status
         context['current_payment_status'] = current_payment_status
         context['current_medicine'] = current_medicine
+        # The medicine filter is an autocomplete picker; only the chosen medicine is loaded
+        context['current_medicine_obj'] = (
+            Medicine.objects.filter(pk=current_medicine).first() if current_medicine.isdigit() else None
+        )
         context['search_query'] = search_query
         
         # Build query string for pagination (excluding 'page' parameter)
@@ -883,10 +1015,45 @@ class PharmacistOrderListView(LoginRequiredMixin, UserPassesTestMixin, ListView)
             query_params['search'] = search_query
         
         context['query_string'] = urlencode(query_params)
+        context['bulk_status_form'] = OrderBulkStatusForm()
         
         return context
 
 
+class PharmacistOrderBulkStatusView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """Move the orders selected on the pharmacist order list to one status"""
+    http_method_names = ['post']
+    
+    def test_func(self):
+        return self.request.user.is_pharmacist_admin or self.request.user.is_admin
+    
+    def post(self, request):
+        # Return to the list with the filters the pharmacist was using
+        next_url = request.POST.get('next', '')
+        if not url_has_allowed_host_and_scheme(next_url, allowed_hosts={request.get_host()}):
+            next_url = reverse('orders:pharmacist_order_list')
+        
+        form = OrderBulkStatusForm(request.POST)
+        if not form.is_valid():
+            for errors in form.errors.values():
+                messages.error(request, errors[0])
+            return redirect(next_url)
+        
+        new_status = form.cleaned_data['status']
+        updated, skipped = OrderBulkTransitionService.transition(
+            form.cleaned_data['order_ids'], new_status, request.user,
+            notes=form.cleaned_data['notes'], request=request
+        )
+        
+        status_display = dict(Order.STATUS_CHOICES)[new_status]
+        if updated:
+            messages.success(request, f'{len(updated)} order(s) moved to {status_display}.')
+        if skipped:
+            details = '; '.join(f'{number}: {reason}' for number, reason in skipped.items())
+            messages.warning(request, f'{len(skipped)} order(s) were not changed - {details}')
+        return redirect(next_url)
+
+
 class PharmacistOrderDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
     """View for pharmacist/admin to see order details"""
     model = Order
@@ -975,16 +1142,25 @@ class OrderStatusUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView)
             messages.error(self.request, 'Cannot set order status to "Delivered" unless payment status is "Paid". Please verify the payment first.')
             return self.form_invalid(form)
         
-        # Get old values for history
-        old_status = self.object.status
-        old_payment_status = self.object.payment_status
+        # Capture the diff before saving resets the tracked values
+        order = form.instance
+        changes = order.changes()
+        old_status = order.previous_value('status')
+        old_payment_status = order.previous_value('payment_status')
+        
+        # Save against the version the user was looking at
+        if form.cleaned_data.get('version') is not None:
+            order.version = form.cleaned_data['version']
         
         # Save the form - this will use get_success_url() for redirect
-        response = super().form_valid(form)
+        try:
+            response = super().form_valid(form)
+        except (OrderConflictError, InvalidTransitionError, InsufficientStockError) as e:
+            messages.error(self.request, f'{e} The latest order details are shown below.')
+            return redirect('orders:order_status_update', pk=order.pk)
         
         # Create status history if status changed
-        if old_status != self.object.status or old_payment_status != self.object.payment_status:
-            from .models import OrderStatusHistory
+        if 'status' in changes or 'payment_status' in changes:
             OrderStatusHistory.objects.create(
                 order=self.object,
                 old_status=old_status,
@@ -995,6 +1171,12 @@ class OrderStatusUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView)
                 changed_by=self.request.user
             )
         
+        from audits.services import AuditService
+        AuditService.log_changes(
+            self.object, changes, request=self.request,
+            description=f"Order {self.object.order_number} status updated"
+        )
+        
         messages.success(self.request, 'Order status updated successfully!')
         return response
 
@@ -1010,11 +1192,12 @@ class OrderFulfillmentDashboardView(LoginRequiredMixin, UserPassesTestMixin, Tem
         context = super().get_context_data(**kwargs)
         
         # Order statistics
-        total_orders = Order.objects.count()
-        pending_orders = Order.objects.filter(status='pending').count()
-        processing_orders = Order.objects.filter(status='processing').count()
-        ready_orders = Order.objects.filter(status='ready_for_pickup').count()
-        delivered_orders = Order.objects.filter(status='delivered').count()
+        counts = OrderStatusCounterService.get_counts()
+        total_orders = counts['total']
+        pending_orders = counts['pending']
+        processing_orders = counts['processing']
+        ready_orders = counts['ready_for_pickup']
+        delivered_orders = counts['delivered']
         
         # Recent orders - prioritize pending orders first, then order by creation date
         recent_orders = Order.objects.annotate(
@@ -1030,12 +1213,7 @@ class OrderFulfillmentDashboardView(LoginRequiredMixin, UserPassesTestMixin, Tem
         ).order_by('status_priority', '-created_at')[:10]
         
         # Orders by status
-        orders_by_status = {}
-        for status_code, status_name in Order.STATUS_CHOICES:
-            orders_by_status[status_code] = {
-                'name': status_name,
-                'count': Order.objects.filter(status=status_code).count()
-            }
+        orders_by_status = OrderStatusCounterService.by_status(counts)
         
         context.update({
             'total_orders': total_orders,
@@ -1045,11 +1223,95 @@ class OrderFulfillmentDashboardView(LoginRequiredMixin, UserPassesTestMixin, Tem
             'delivered_orders': delivered_orders,
             'recent_orders': recent_orders,
             'orders_by_status': orders_by_status,
+            'orders_to_pick': counts['confirmed'],
         })
         
         return context
 
 
+class PickListFilterMixin(LoginRequiredMixin, UserPassesTestMixin):
+    """Pharmacist/admin views over the orders chosen with a PickListForm"""
+    
+    def test_func(self):
+        return self.request.user.is_pharmacist_admin or self.request.user.is_admin
+    
+    def get_orders(self):
+        self.filter_form = PickListForm(self.request.GET or None)
+        filters = {}
+        if self.filter_form.is_bound and self.filter_form.is_valid():
+            filters = {
+                'statuses': self.filter_form.cleaned_data['status'],
+                'date_from': self.filter_form.cleaned_data['date_from'],
+                'date_to': self.filter_form.cleaned_data['date_to'],
+            }
+        return PickListService.orders(**filters)
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'filter_form': self.filter_form,
+            'filter_query': self.request.GET.urlencode(),
+        })
+        return context
+
+
+class PickListView(PickListFilterMixin, TemplateView):
+    """Medicines to pick for the chosen orders, totalled across orders"""
+    template_name = 'orders/pick_list.html'
+    
+    def get_context_data(self, **kwargs):
+        orders = self.get_orders()
+        lines = PickListService.pick_list(orders)
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'lines': lines,
+            'order_count': len({entry['order_number'] for line in lines for entry in line['orders']}),
+            'total_quantity': sum(line['total_quantity'] for line in lines),
+            'generated_at': timezone.now(),
+        })
+        return context
+
+
+class PackingSlipsView(PickListFilterMixin, TemplateView):
+    """Printable packing slip per chosen order"""
+    template_name = 'orders/packing_slips.html'
+    
+    def get_context_data(self, **kwargs):
+        orders = PickListService.packing_slips(self.get_orders())
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'orders': orders,
+            'generated_at': timezone.now(),
+        })
+        return context
+
+
+class OrderBulkStatusAPIView(APIView):
+    """API endpoint for moving several orders to one status - pharmacist/admin only"""
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        if not (request.user.is_pharmacist_admin or request.user.is_admin):
+            return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
+        
+        form = OrderBulkStatusForm(request.data)
+        if not form.is_valid():
+            return Response({'errors': form.errors}, status=status.HTTP_400_BAD_REQUEST)
+        
+        updated, skipped = OrderBulkTransitionService.transition(
+            form.cleaned_data['order_ids'], form.cleaned_data['status'], request.user,
+            notes=form.cleaned_data['notes'], request=request
+        )
+        
+        return Response({
+            'updated': [
+                {'id': order.id, 'order_number': order.order_number, 'status': order.status, 'version': order.version}
+                for order in updated
+            ],
+            'skipped': skipped,
+        })
+
+
 class PharmacistDashboardAPIView(APIView):
     """API endpoint for pharmacist dashboard statistics - real-time updates"""
     permission_classes = [IsAuthenticated]
@@ -1059,21 +1321,25 @@ class PharmacistDashboardAPIView(APIView):
         if not (request.user.is_pharmacist_admin or request.user.is_admin):
             return Response({'error': 'Access denied'}, status=status.HTTP_403_FORBIDDEN)
         
+        from common.services import ChangeVersionService
+        
+        # Nothing to rebuild if no order has changed since the client's copy
+        etag = ChangeVersionService.etag([ChangeVersionService.ORDERS_SCOPE], request.get_full_path())
+        not_modified = ChangeVersionService.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        
         # Order statistics
-        total_orders = Order.objects.count()
-        pending_orders = Order.objects.filter(status='pending').count()
-        processing_orders = Order.objects.filter(status='processing').count()
-        ready_orders = Order.objects.filter(status='ready_for_pickup').count()
-        delivered_orders = Order.objects.filter(status='delivered').count()
-        cancelled_orders = Order.objects.filter(status='cancelled').count()
+        counts = OrderStatusCounterService.get_counts()
+        total_orders = counts['total']
+        pending_orders = counts['pending']
+        processing_orders = counts['processing']
+        ready_orders = counts['ready_for_pickup']
+        delivered_orders = counts['delivered']
+        cancelled_orders = counts['cancelled']
         
         # Orders by status
-        orders_by_status = {}
-        for status_code, status_name in Order.STATUS_CHOICES:
-            orders_by_status[status_code] = {
-                'name': status_name,
-                'count': Order.objects.filter(status=status_code).count()
-            }
+        orders_by_status = OrderStatusCounterService.by_status(counts)
         
         # Recent orders - prioritize pending orders first
         recent_orders = Order.objects.annotate(
@@ -1104,7 +1370,7 @@ class PharmacistDashboardAPIView(APIView):
                 'created_at_display': order.created_at.strftime('%b %d, %Y %H:%M'),
             })
         
-        return Response({
+        response = Response({
             'statistics': {
                 'total_orders': total_orders,
                 'pending_orders': pending_orders,
@@ -1116,6 +1382,8 @@ class PharmacistDashboardAPIView(APIView):
             'orders_by_status': orders_by_status,
             'recent_orders': recent_orders_data,
         })
+        response['ETag'] = etag
+        return response
 
 
 class SalesRepDashboardAPIView(APIView):
@@ -1127,18 +1395,29 @@ class SalesRepDashboardAPIView(APIView):
         if request.user.is_pharmacist_admin or request.user.is_admin:
             return Response({'error': 'This endpoint is for sales representatives only'}, status=status.HTTP_403_FORBIDDEN)
         
+        from common.services import ChangeVersionService
+        
+        # Nothing to rebuild if none of this sales rep's orders have changed
+        etag = ChangeVersionService.etag(
+            [ChangeVersionService.orders_scope(request.user.id)], request.user.id, request.get_full_path()
+        )
+        not_modified = ChangeVersionService.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        
         # Get all orders for this sales rep
         user_orders = Order.objects.filter(sales_rep=request.user)
         
         # Order statistics
-        total_orders = user_orders.count()
-        pending_orders = user_orders.filter(status='pending').count()
-        processing_orders = user_orders.filter(status='processing').count()
-        confirmed_orders = user_orders.filter(status='confirmed').count()
-        ready_orders = user_orders.filter(status='ready_for_pickup').count()
-        shipped_orders = user_orders.filter(status='shipped').count()
-        delivered_orders = user_orders.filter(status='delivered').count()
-        cancelled_orders = user_orders.filter(status='cancelled').count()
+        counts = OrderStatusCounterService.get_counts(sales_rep=request.user)
+        total_orders = counts['total']
+        pending_orders = counts['pending']
+        processing_orders = counts['processing']
+        confirmed_orders = counts['confirmed']
+        ready_orders = counts['ready_for_pickup']
+        shipped_orders = counts['shipped']
+        delivered_orders = counts['delivered']
+        cancelled_orders = counts['cancelled']
         
         # Calculate total revenue (delivered + paid orders)
         from django.db.models import Sum
@@ -1148,15 +1427,10 @@ class SalesRepDashboardAPIView(APIView):
         ).aggregate(total=Sum('total_amount'))['total'] or Decimal('0.00')
         
         # Orders by status breakdown
-        orders_by_status = {}
-        for status_code, status_name in Order.STATUS_CHOICES:
-            orders_by_status[status_code] = {
-                'name': status_name,
-                'count': user_orders.filter(status=status_code).count()
-            }
+        orders_by_status = OrderStatusCounterService.by_status(counts)
         
         # Get filtered orders based on query parameters (for table updates)
-        filtered_orders = user_orders
+        filtered_orders = SalesRepOrderSerializer.plan(user_orders)
         
         # Apply status filter if provided
         status_filter = request.GET.get('status')
@@ -1168,7 +1442,7 @@ class SalesRepDashboardAPIView(APIView):
         if date_from:
             try:
                 date_from_obj = datetime.strptime(date_from, '%Y-%m-%d').date()
-                filtered_orders = filtered_orders.filter(created_at__date__gte=date_from_obj)
+                filtered_orders = filtered_orders.filter(**date_range_lookups('created_at', start=date_from_obj))
             except ValueError:
                 pass
         
@@ -1176,7 +1450,7 @@ class SalesRepDashboardAPIView(APIView):
         if date_to:
             try:
                 date_to_obj = datetime.strptime(date_to, '%Y-%m-%d').date()
-                filtered_orders = filtered_orders.filter(created_at__date__lte=date_to_obj)
+                filtered_orders = filtered_orders.filter(**date_range_lookups('created_at', end=date_to_obj))
             except ValueError:
                 pass
         
@@ -1192,33 +1466,19 @@ class SalesRepDashboardAPIView(APIView):
                     default=6,
                     output_field=IntegerField()
                 )
-            ).order_by('status_priority', '-created_at')
+            )
+            ordering = ('status_priority', '-created_at', '-id')
         else:
-            filtered_orders = filtered_orders.order_by('-created_at')
-        
-        # Paginate orders
-        from django.core.paginator import Paginator
-        page = int(request.GET.get('page', 1))
-        paginator = Paginator(filtered_orders, 20)
-        page_obj = paginator.get_page(page)
-        
-        # Build orders data
-        orders_data = []
-        for order in page_obj:
-            orders_data.append({
-                'id': order.id,
-                'order_number': order.order_number,
-                'status': order.status,
-                'status_display': order.get_status_display(),
-                'payment_status': order.payment_status,
-                'payment_status_display': order.get_payment_status_display(),
-                'items_count': order.items.count(),
-                'total_amount': float(order.total_amount),
-                'created_at': order.created_at.isoformat(),
-                'created_at_display': order.created_at.strftime('%b %d, %Y %H:%M'),
-            })
+            ordering = ('-created_at', '-id')
         
-        return Response({
+        # Same cursor pagination as the order list page, so the rows match
+        paginator = KeysetPaginator(filtered_orders, 20, ordering=ordering)
+        try:
+            page_obj = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        response = Response({
             'statistics': {
                 'total_orders': total_orders,
                 'pending_orders': pending_orders,
@@ -1231,18 +1491,15 @@ class SalesRepDashboardAPIView(APIView):
                 'total_revenue': float(total_revenue),
             },
             'orders_by_status': orders_by_status,
-            'orders': orders_data,
-            'pagination': {
-                'current_page': page_obj.number,
-                'total_pages': paginator.num_pages,
-                'has_next': page_obj.has_next(),
-                'has_previous': page_obj.has_previous(),
-            },
+            'orders': SalesRepOrderSerializer(page_obj, many=True).data,
+            'pagination': keyset_page_data(page_obj),
         })
+        response['ETag'] = etag
+        return response
 
 
 # Payment Views
-class CreatePaymentIntentView(LoginRequiredMixin, APIView):
+class CreatePaymentIntentView(LoginRequiredMixin, IdempotentMixin, APIView):
     """Create payment intent for Stripe payment"""
     permission_classes = [IsAuthenticated]
     
@@ -1304,10 +1561,14 @@ class CreatePaymentIntentView(LoginRequiredMixin, APIView):
             return JsonResponse({'error': str(e)}, status=500)
 
 
-class ProcessPaymentView(LoginRequiredMixin, APIView):
+class ProcessPaymentView(LoginRequiredMixin, IdempotentMixin, APIView):
     """Process payment confirmation after Stripe payment"""
     permission_classes = [IsAuthenticated]
     
+    def should_store_response(self, response):
+        # A payment that has not succeeded yet may be checked again with the same key
+        return response.status_code == 200
+    
     def post(self, request, order_id):
         """Process payment confirmation"""
         try:
@@ -1334,38 +1595,41 @@ class ProcessPaymentView(LoginRequiredMixin, APIView):
             
             # Update order payment status
             if status_result['status'] == 'succeeded':
-                order.payment_status = 'paid'
-                order.save()
-                
-                # Create transaction record
                 from transactions.models import Transaction, PaymentMethod, PaymentGateway
+                
+                # The payment already went through, so a concurrent edit of the
+                # order is retried rather than failing; the order and its
+                # transaction record are written together
                 try:
-                    payment_method = PaymentMethod.objects.filter(is_active=True).first()
-                    if not payment_method:
-                        payment_method = PaymentMethod.objects.create(
-                            name='Credit Card',
-                            description='Payment via Stripe',
-                            is_active=True
-                        )
-                    
-                    gateway = PaymentGatewayFactory.get_active_gateway()
-                    
-                    Transaction.objects.create(
-                        order=order,
-                        payment_method=payment_method,
-                        payment_gateway=gateway,
-                        transaction_type='payment',
-                        status='completed',
-                        amount=order.total_amount,
-                        net_amount=order.total_amount,
-                        gateway_transaction_id=payment_intent_id,
-                        gateway_response=status_result.get('response', {}),
-                        notes=f'Payment processed via {gateway.gateway_type if gateway else "Stripe"}'
-                    )
-                except Exception as e:
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.error(f"Error creating transaction record: {e}")
+                    with db_transaction.atomic():
+                        save_order_change(order, lambda o: setattr(o, 'payment_status', 'paid'))
+                        
+                        # Create transaction record, once per payment intent
+                        if not Transaction.objects.filter(order=order, gateway_transaction_id=payment_intent_id).exists():
+                            payment_method = PaymentMethod.objects.filter(is_active=True).first()
+                            if not payment_method:
+                                payment_method = PaymentMethod.objects.create(
+                                    name='Credit Card',
+                                    description='Payment via Stripe',
+                                    is_active=True
+                                )
+                            
+                            gateway = PaymentGatewayFactory.get_active_gateway()
+                            
+                            Transaction.objects.create(
+                                order=order,
+                                payment_method=payment_method,
+                                payment_gateway=gateway,
+                                transaction_type='payment',
+                                status='completed',
+                                amount=order.total_amount,
+                                net_amount=order.total_amount,
+                                gateway_transaction_id=payment_intent_id,
+                                gateway_response=status_result.get('response', {}),
+                                notes=f'Payment processed via {gateway.gateway_type if gateway else "Stripe"}'
+                            )
+                except OrderConflictError as e:
+                    return JsonResponse({'error': str(e)}, status=409)
                 
                 # Send notification
                 from common.services import NotificationService
@@ -1397,7 +1661,7 @@ class ProcessPaymentView(LoginRequiredMixin, APIView):
             return JsonResponse({'error': str(e)}, status=500)
 
 
-class ManualPaymentSubmitView(LoginRequiredMixin, View):
+class ManualPaymentSubmitView(LoginRequiredMixin, IdempotentMixin, View):
     """Submit manual payment proof"""
     
     def post(self, request, order_id):
@@ -1431,27 +1695,34 @@ class ManualPaymentSubmitView(LoginRequiredMixin, View):
             payment_info += f"Submitted by: {request.user.get_full_name() or request.user.username}\n"
             payment_info += f"Submitted at: {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
             
-            # Update order internal notes
-            if order.internal_notes:
-                order.internal_notes += f"\n\n{payment_info}"
-            else:
-                order.internal_notes = payment_info
-            
-            # Handle payment proof file upload if provided
-            if 'payment_proof' in request.FILES:
-                from common.models import FileUpload
-                proof_file = request.FILES['payment_proof']
-                FileUpload.objects.create(
-                    file_type='invoice',
-                    file=proof_file,
-                    original_filename=proof_file.name,
-                    file_size=proof_file.size,
-                    mime_type=proof_file.content_type,
-                    uploaded_by=request.user,
-                    content_object=order
-                )
+            def add_payment_info(order):
+                if order.internal_notes:
+                    order.internal_notes += f"\n\n{payment_info}"
+                else:
+                    order.internal_notes = payment_info
             
-            order.save()
+            # The proof upload is only kept if the order notes are saved too
+            try:
+                with db_transaction.atomic():
+                    # Handle payment proof file upload if provided
+                    if 'payment_proof' in request.FILES:
+                        from common.models import FileUpload
+                        proof_file = request.FILES['payment_proof']
+                        FileUpload.objects.create(
+                            file_type='invoice',
+                            file=proof_file,
+                            original_filename=proof_file.name,
+                            file_size=proof_file.size,
+                            mime_type=proof_file.content_type,
+                            uploaded_by=request.user,
+                            content_object=order
+                        )
+                    
+                    # Update order internal notes
+                    save_order_change(order, add_payment_info)
+            except OrderConflictError as e:
+                messages.error(request, str(e))
+                return redirect('orders:order_detail', pk=order.pk)
             
             # Send notification to admin
             from common.services import NotificationService
@@ -1512,25 +1783,36 @@ class VerifyGatewayPaymentView(LoginRequiredMixin, UserPassesTestMixin, View):
             
             # Update transaction status (Stripe uses 'succeeded', other gateways may vary)
             if payment_status['status'] in ['succeeded', 'completed']:
-                transaction.status = 'completed'
-                transaction.completed_at = timezone.now()
-                transaction.save()
-                
-                # Update order payment status
+                # The order and its transaction are marked paid together or not at all
                 old_payment_status = order.payment_status
-                order.payment_status = 'paid'
-                order.save()
+                try:
+                    with db_transaction.atomic():
+                        order.payment_status = 'paid'
+                        order.save()
+                        
+                        transaction.status = 'completed'
+                        transaction.completed_at = timezone.now()
+                        payment_changes = transaction.changes()
+                        transaction.save()
+                        
+                        # Create status history
+                        OrderStatusHistory.objects.create(
+                            order=order,
+                            old_status=order.status,
+                            new_status=order.status,
+                            old_payment_status=old_payment_status,
+                            new_payment_status='paid',
+                            notes=f'Payment verified via {transaction.payment_gateway.display_name}',
+                            changed_by=request.user
+                        )
+                except (OrderConflictError, InvalidTransitionError) as e:
+                    messages.error(request, str(e))
+                    return redirect('orders:pharmacist_order_detail', pk=order.pk)
                 
-                # Create status history
-                from .models import OrderStatusHistory
-                OrderStatusHistory.objects.create(
-                    order=order,
-                    old_status=order.status,
-                    new_status=order.status,
-                    old_payment_status=old_payment_status,
-                    new_payment_status='paid',
-                    notes=f'Payment verified via {transaction.payment_gateway.display_name}',
-                    changed_by=request.user
+                from audits.services import AuditService
+                AuditService.log_changes(
+                    transaction, payment_changes, request=request,
+                    description=f"Transaction {transaction.transaction_id} verified via {transaction.payment_gateway.display_name}"
                 )
                 
                 # Send notification to sales rep
@@ -1574,51 +1856,56 @@ class VerifyManualPaymentView(LoginRequiredMixin, UserPassesTestMixin, View):
             messages.info(request, 'This order has already been paid.')
             return redirect('orders:pharmacist_order_detail', pk=order.pk)
         
-        # Verify payment
-        old_payment_status = order.payment_status
-        order.payment_status = 'paid'
-        order.save()
-        
-        # Create transaction record for manual payment
         from transactions.models import Transaction, PaymentMethod
         
+        # The order is only marked paid together with its transaction record
+        old_payment_status = order.payment_status
+        verified_by = request.user.get_full_name() or request.user.username
         try:
-            payment_method = PaymentMethod.objects.filter(name__icontains='manual').first()
-            if not payment_method:
-                payment_method = PaymentMethod.objects.filter(name__icontains='bank').first()
-            if not payment_method:
-                payment_method = PaymentMethod.objects.create(
-                    name='Manual/Bank Transfer',
-                    description='Manual payment via bank transfer',
-                    is_active=True
+            with db_transaction.atomic():
+                order.payment_status = 'paid'
+                order.save()
+                
+                payment_method = PaymentMethod.objects.filter(name__icontains='manual').first()
+                if not payment_method:
+                    payment_method = PaymentMethod.objects.filter(name__icontains='bank').first()
+                if not payment_method:
+                    payment_method = PaymentMethod.objects.create(
+                        name='Manual/Bank Transfer',
+                        description='Manual payment via bank transfer',
+                        is_active=True
+                    )
+                
+                Transaction.objects.create(
+                    order=order,
+                    payment_method=payment_method,
+                    transaction_type='payment',
+                    status='completed',
+                    amount=order.total_amount,
+                    net_amount=order.total_amount,
+                    completed_at=timezone.now(),
+                    notes=f'Manual payment verified by {verified_by}'
                 )
-            
-            Transaction.objects.create(
-                order=order,
-                payment_method=payment_method,
-                transaction_type='payment',
-                status='completed',
-                amount=order.total_amount,
-                net_amount=order.total_amount,
-                completed_at=timezone.now(),
-                notes=f'Manual payment verified by {request.user.get_full_name() or request.user.username}'
-            )
+                
+                # Create status history
+                OrderStatusHistory.objects.create(
+                    order=order,
+                    old_status=order.status,
+                    new_status=order.status,
+                    old_payment_status=old_payment_status,
+                    new_payment_status='paid',
+                    notes=f'Manual payment verified by {verified_by}',
+                    changed_by=request.user
+                )
+        except (OrderConflictError, InvalidTransitionError) as e:
+            messages.error(request, str(e))
+            return redirect('orders:pharmacist_order_detail', pk=order.pk)
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
-            logger.error(f"Error creating manual payment transaction: {e}")
-        
-        # Create status history
-        from .models import OrderStatusHistory
-        OrderStatusHistory.objects.create(
-            order=order,
-            old_status=order.status,
-            new_status=order.status,
-            old_payment_status=old_payment_status,
-            new_payment_status='paid',
-            notes=f'Manual payment verified by {request.user.get_full_name() or request.user.username}',
-            changed_by=request.user
-        )
+            logger.error(f"Error verifying manual payment for order {order.order_number}: {e}")
+            messages.error(request, 'The payment could not be verified. The order was left unchanged.')
+            return redirect('orders:pharmacist_order_detail', pk=order.pk)
         
         # Send notification to sales rep
         from common.services import NotificationService
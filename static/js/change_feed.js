@@ -0,0 +1,93 @@
+/**
+ * Change Feed
+ * Opens one server-sent events stream per page and tells subscribers when
+ * orders, payments or notifications change, so pages refetch on demand
+ * instead of polling on a timer.
+ *
+ * Usage:
+ *   if (window.changeFeed && window.changeFeed.supported) {
+ *       window.changeFeed.subscribe(['order_status', 'payment'], (events) => refresh());
+ *
+ * Callbacks receive every event of a burst, oldest first, as
+ * { type, data } objects.
+ *   }
+ */
+
+class ChangeFeed {
+    constructor() {
+        this.streamUrl = '/common/api/changes/';
+        this.eventTypes = ['order_status', 'payment', 'notification'];
+        this.debounceDelay = 300; // Collapse bursts of events into one callback
+        this.supported = typeof window.EventSource !== 'undefined';
+        this.source = null;
+        this.lastEventId = null;
+        this.subscribers = [];
+
+        if (this.supported) {
+            // Close the stream while the page is hidden and resume it from the
+            // last event seen when the page is shown again
+            document.addEventListener('visibilitychange', () => {
+                if (document.hidden) {
+                    this.disconnect();
+                } else if (this.subscribers.length) {
+                    this.connect();
+                }
+            });
+        }
+    }
+
+    subscribe(eventTypes, callback) {
+        if (!this.supported) return false;
+
+        this.subscribers.push({ eventTypes, callback, timer: null, pending: [] });
+        this.connect();
+        return true;
+    }
+
+    connect() {
+        if (this.source || document.hidden) return;
+
+        const url = this.lastEventId ? `${this.streamUrl}?cursor=${this.lastEventId}` : this.streamUrl;
+        this.source = new EventSource(url);
+        // Opening cursor of the stream, so a reconnect after the page was
+        // hidden resumes from it even when no change has arrived yet
+        this.source.addEventListener('cursor', (event) => {
+            this.lastEventId = event.lastEventId || this.lastEventId;
+        });
+        this.eventTypes.forEach(type => {
+            this.source.addEventListener(type, (event) => this.dispatch(type, event));
+        });
+    }
+
+    disconnect() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+    }
+
+    dispatch(type, event) {
+        this.lastEventId = event.lastEventId || this.lastEventId;
+
+        let data = {};
+        try {
+            data = JSON.parse(event.data);
+        } catch (error) {
+            console.error('Invalid change feed event:', error);
+        }
+
+        this.subscribers
+            .filter(subscriber => subscriber.eventTypes.includes(type))
+            .forEach(subscriber => {
+                subscriber.pending.push({ type, data });
+                clearTimeout(subscriber.timer);
+                subscriber.timer = setTimeout(() => {
+                    const events = subscriber.pending;
+                    subscriber.pending = [];
+                    subscriber.callback(events);
+                }, this.debounceDelay);
+            });
+    }
+}
+
+window.changeFeed = new ChangeFeed();
@@ -74,7 +74,7 @@ function removeFromCart(medicineId) {
 
 function updateCartCount() {
     $.ajax({
-        url: '/orders/api/cart/',
+        url: '/orders/api/cart/badge/',
         method: 'GET',
         success: function(response) {
             $('#cart-count').text(response.total_items || 0);
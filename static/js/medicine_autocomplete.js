@@ -0,0 +1,85 @@
+// Medicine picker backed by the catalog autocomplete API
+//
+// Markup: a .medicine-picker element holding a text input.medicine-search and
+// a hidden input.medicine-id that is submitted. Add data-orderable="1" to the
+// picker to only offer medicines that can be ordered. Choosing a result fills
+// in both inputs and triggers 'medicine:selected' on the picker with the
+// result ({id, name, strength, unit_price, available_stock}).
+
+(function($) {
+    const AUTOCOMPLETE_URL = '/inventory/api/medicines/autocomplete/';
+    const DEBOUNCE_MS = 200;
+
+    function medicineLabel(medicine) {
+        return medicine.strength ? `${medicine.name} (${medicine.strength})` : medicine.name;
+    }
+
+    function menuFor(picker) {
+        let menu = picker.find('.medicine-results');
+        if (!menu.length) {
+            menu = $('<div class="dropdown-menu medicine-results w-100"></div>');
+            picker.append(menu);
+        }
+        return menu;
+    }
+
+    function showResults(picker, results) {
+        const menu = menuFor(picker).empty();
+        if (!results.length) {
+            menu.append('<span class="dropdown-item-text text-muted">No medicines found</span>');
+        }
+        results.forEach(function(medicine) {
+            const item = $('<button type="button" class="dropdown-item d-flex justify-content-between"></button>');
+            item.append($('<span></span>').text(medicineLabel(medicine)));
+            item.append($('<small class="text-muted ms-3"></small>').text(
+                `₱${medicine.unit_price.toFixed(2)} · ${medicine.available_stock} in stock`
+            ));
+            item.data('medicine', medicine);
+            menu.append(item);
+        });
+        menu.addClass('show');
+    }
+
+    function search(picker, term) {
+        const request = picker.data('request');
+        if (request) {
+            request.abort();
+        }
+        picker.data('request', $.ajax({
+            url: AUTOCOMPLETE_URL,
+            data: {q: term, orderable: picker.data('orderable') || ''},
+            success: function(data) {
+                showResults(picker, data.results);
+            }
+        }));
+    }
+
+    $(document).on('input', '.medicine-picker .medicine-search', function() {
+        const picker = $(this).closest('.medicine-picker');
+        const term = $(this).val().trim();
+
+        // Typing replaces the previous choice until a result is picked
+        picker.find('.medicine-id').val('');
+        clearTimeout(picker.data('timer'));
+        if (!term) {
+            menuFor(picker).removeClass('show');
+            picker.trigger('medicine:selected', [null]);
+            return;
+        }
+        picker.data('timer', setTimeout(function() { search(picker, term); }, DEBOUNCE_MS));
+    });
+
+    $(document).on('click', '.medicine-picker .medicine-results .dropdown-item', function() {
+        const picker = $(this).closest('.medicine-picker');
+        const medicine = $(this).data('medicine');
+        picker.find('.medicine-id').val(medicine.id);
+        picker.find('.medicine-search').val(medicineLabel(medicine));
+        menuFor(picker).removeClass('show');
+        picker.trigger('medicine:selected', [medicine]);
+    });
+
+    $(document).on('click', function(event) {
+        $('.medicine-picker').not($(event.target).closest('.medicine-picker'))
+            .find('.medicine-results').removeClass('show');
+    });
+})(jQuery);
@@ -1,15 +1,17 @@
 /**
  * Real-time Dashboard Updates for Pharmacist/Admin Order Fulfillment Dashboard
- * Polls the API endpoint and updates dashboard statistics in real-time
+ * Refetches dashboard statistics when the change feed reports an order or
+ * payment change, falling back to polling where server-sent events are unavailable
  */
 
 class RealtimeDashboard {
     constructor() {
         this.apiUrl = '/orders/api/pharmacist/dashboard/';
-        this.pollInterval = 5000; // 5 seconds
+        this.pollInterval = 5000; // 5 seconds, fallback only
         this.pollTimer = null;
         this.lastCheckTime = null;
         this.isPolling = false;
+        this.etag = null; // Sent as If-None-Match so unchanged data comes back as 304
         
         this.init();
     }
@@ -33,8 +35,12 @@ class RealtimeDashboard {
         // Initial fetch
         this.fetchDashboardData();
         
-        // Start polling
-        this.pollTimer = setInterval(() => this.fetchDashboardData(), this.pollInterval);
+        // Refetch when an order changes; poll only without server-sent events
+        const subscribed = window.changeFeed &&
+            window.changeFeed.subscribe(['order_status', 'payment'], () => this.fetchDashboardData());
+        if (!subscribed) {
+            this.pollTimer = setInterval(() => this.fetchDashboardData(), this.pollInterval);
+        }
         
         // Re-fetch when window regains focus (e.g., tab switch)
         document.addEventListener('visibilitychange', () => {
@@ -52,18 +58,29 @@ class RealtimeDashboard {
         try {
             this.isPolling = true;
             
+            const headers = {
+                'X-Requested-With': 'XMLHttpRequest',
+            };
+            if (this.etag) {
+                headers['If-None-Match'] = this.etag;
+            }
+            
             const response = await fetch(this.apiUrl, {
                 method: 'GET',
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest',
-                },
-                credentials: 'same-origin'
+                headers: headers,
+                credentials: 'same-origin',
+                cache: 'no-store'
             });
             
+            if (response.status === 304) {
+                return; // Nothing changed since the last response
+            }
+            
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             
+            this.etag = response.headers.get('ETag');
             const data = await response.json();
             
             // Update dashboard with new data
@@ -1,15 +1,18 @@
 /**
  * Real-time Notification System
- * Polls for new notifications and updates the UI automatically
+ * Fetches new notifications when the change feed reports one and updates the
+ * UI automatically, falling back to polling where server-sent events are unavailable
  */
 
 class RealtimeNotifications {
     constructor() {
         this.apiUrl = '/common/api/notifications/';
-        this.pollInterval = 10000; // 10 seconds
+        this.pollInterval = 10000; // 10 seconds, fallback only
         this.pollTimer = null;
         this.lastCheckTime = null;
         this.isPolling = false;
+        this.etag = null; // Sent as If-None-Match so unchanged data comes back as 304
+        this.isSubscribed = false;
         this.notificationWidget = null;
         this.notificationCount = null;
         
@@ -36,15 +39,21 @@ class RealtimeNotifications {
         // Initial load
         this.fetchNotifications();
         
-        // Start polling
-        this.startPolling();
+        // Fetch when a notification arrives; poll only without server-sent events
+        this.isSubscribed = Boolean(window.changeFeed &&
+            window.changeFeed.subscribe(['notification'], () => this.fetchNotifications(true)));
+        if (!this.isSubscribed) {
+            this.startPolling();
+        }
         
         // Stop polling when page is hidden (to save resources)
         document.addEventListener('visibilitychange', () => {
             if (document.hidden) {
                 this.stopPolling();
             } else {
-                this.startPolling();
+                if (!this.isSubscribed) {
+                    this.startPolling();
+                }
                 this.fetchNotifications(); // Immediately check when page becomes visible
             }
         });
@@ -83,18 +92,29 @@ class RealtimeNotifications {
             
             url += '?' + params.toString();
             
+            const headers = {
+                'X-Requested-With': 'XMLHttpRequest',
+            };
+            if (this.etag) {
+                headers['If-None-Match'] = this.etag;
+            }
+            
             const response = await fetch(url, {
                 method: 'GET',
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest',
-                },
-                credentials: 'same-origin'
+                headers: headers,
+                credentials: 'same-origin',
+                cache: 'no-store'
             });
             
+            if (response.status === 304) {
+                return; // Nothing changed since the last response
+            }
+            
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             
+            this.etag = response.headers.get('ETag');
             const data = await response.json();
             
             // Update last check time
@@ -1,14 +1,17 @@
 /**
  * Real-time Dashboard Updates for Sales Representative's "My Orders" Dashboard
- * Polls the API endpoint and updates dashboard statistics and order list in real-time
+ * Refetches dashboard statistics and the order list when the change feed reports
+ * an order or payment change, falling back to polling where server-sent events
+ * are unavailable
  */
 
 class RealtimeSalesRepDashboard {
     constructor() {
         this.apiUrl = '/orders/api/sales-rep/dashboard/';
-        this.pollInterval = 5000; // 5 seconds
+        this.pollInterval = 5000; // 5 seconds, fallback only
         this.pollTimer = null;
         this.isPolling = false;
+        this.etag = null; // Sent as If-None-Match so unchanged data comes back as 304
         
         this.init();
     }
@@ -32,8 +35,12 @@ class RealtimeSalesRepDashboard {
         // Initial fetch
         this.fetchDashboardData();
         
-        // Start polling
-        this.pollTimer = setInterval(() => this.fetchDashboardData(), this.pollInterval);
+        // Refetch when an order changes; poll only without server-sent events
+        const subscribed = window.changeFeed &&
+            window.changeFeed.subscribe(['order_status', 'payment'], () => this.fetchDashboardData());
+        if (!subscribed) {
+            this.pollTimer = setInterval(() => this.fetchDashboardData(), this.pollInterval);
+        }
         
         // Re-fetch when window regains focus (e.g., tab switch)
         document.addEventListener('visibilitychange', () => {
@@ -55,29 +62,40 @@ class RealtimeSalesRepDashboard {
             const statusFilter = document.getElementById('status')?.value || '';
             const dateFrom = document.getElementById('date_from')?.value || '';
             const dateTo = document.getElementById('date_to')?.value || '';
-            const currentPage = this.getCurrentPage();
+            const cursor = new URLSearchParams(window.location.search).get('cursor');
             
             // Build query string with filters
             const params = new URLSearchParams();
             if (statusFilter) params.append('status', statusFilter);
             if (dateFrom) params.append('date_from', dateFrom);
             if (dateTo) params.append('date_to', dateTo);
-            if (currentPage > 1) params.append('page', currentPage);
+            if (cursor) params.append('cursor', cursor); // Same page the list is showing
             
             const url = this.apiUrl + (params.toString() ? '?' + params.toString() : '');
             
+            const headers = {
+                'X-Requested-With': 'XMLHttpRequest',
+            };
+            if (this.etag) {
+                headers['If-None-Match'] = this.etag;
+            }
+            
             const response = await fetch(url, {
                 method: 'GET',
-                headers: {
-                    'X-Requested-With': 'XMLHttpRequest',
-                },
-                credentials: 'same-origin'
+                headers: headers,
+                credentials: 'same-origin',
+                cache: 'no-store'
             });
             
+            if (response.status === 304) {
+                return; // Nothing changed since the last response
+            }
+            
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
             
+            this.etag = response.headers.get('ETag');
             const data = await response.json();
             
             // Update dashboard with new data
@@ -91,19 +109,6 @@ class RealtimeSalesRepDashboard {
         }
     }
     
-    getCurrentPage() {
-        // Try to get current page from pagination
-        const activePageLink = document.querySelector('.pagination .page-item.active .page-link');
-        if (activePageLink) {
-            const text = activePageLink.textContent.trim();
-            const match = text.match(/Page (\d+)/);
-            if (match) {
-                return parseInt(match[1]);
-            }
-        }
-        return 1;
-    }
-    
     updateDashboard(data) {
         if (!data || !data.statistics) {
             return;
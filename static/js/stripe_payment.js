@@ -9,6 +9,9 @@ class StripePaymentHandler {
         this.paymentIntentId = null;
         this.clientSecret = null;
         this.orderId = null;
+        // Sent with every attempt to create this page's payment intent, so a
+        // retried request gets the same intent back instead of a second one
+        this.intentIdempotencyKey = crypto.randomUUID();
         
         // Initialize Stripe if public key is available
         this.initStripe();
@@ -46,6 +49,7 @@ class StripePaymentHandler {
                 method: 'POST',
                 headers: {
                     'X-CSRFToken': this.getCsrfToken(),
+                    'Idempotency-Key': `intent-${orderId}-${this.intentIdempotencyKey}`,
                     'Content-Type': 'application/json',
                 },
                 credentials: 'same-origin'
@@ -180,6 +184,8 @@ class StripePaymentHandler {
                 method: 'POST',
                 headers: {
                     'X-CSRFToken': this.getCsrfToken(),
+                    // One payment intent is confirmed at most once
+                    'Idempotency-Key': `process-${this.paymentIntentId}`,
                     'Content-Type': 'application/x-www-form-urlencoded',
                 },
                 body: `payment_intent_id=${encodeURIComponent(this.paymentIntentId)}`,
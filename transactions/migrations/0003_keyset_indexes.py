@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_keyset_indexes'),
+        ('transactions', '0002_paymentgateway_transaction_payment_gateway'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['created_at', 'id'], name='transaction_created_d05e33_idx'),
+        ),
+    ]
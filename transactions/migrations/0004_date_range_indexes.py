@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-19 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_date_range_indexes'),
+        ('transactions', '0003_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('status', 'completed')), fields=['created_at', 'amount'], name='transactions_revenue_idx'),
+        ),
+    ]
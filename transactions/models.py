@@ -2,6 +2,8 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+from common.models import ChangeTrackingMixin
+
 
 class PaymentMethod(models.Model):
     """
@@ -78,7 +80,7 @@ class PaymentGateway(models.Model):
         return self.get_gateway_type_display()
 
 
-class Transaction(models.Model):
+class Transaction(ChangeTrackingMixin, models.Model):
     """
     Payment transactions
     """
@@ -130,6 +132,12 @@ class Transaction(models.Model):
             models.Index(fields=['transaction_id']),
             models.Index(fields=['order', 'status']),
             models.Index(fields=['status', 'created_at']),
+            # Revenue over a date range only reads completed transactions; with
+            # the amount in the index the sum needs no table lookups
+            models.Index(fields=['created_at', 'amount'], condition=models.Q(status='completed'),
+                         name='transactions_revenue_idx'),
+            # Keyset pagination (common.pagination.KeysetPaginator)
+            models.Index(fields=['created_at', 'id']),
         ]
     
     def __str__(self):
@@ -0,0 +1,24 @@
+import datetime
+
+from rest_framework import serializers
+
+from common.serializers import QueryPlanMixin
+from .models import Transaction
+
+
+class TransactionListSerializer(QueryPlanMixin, serializers.ModelSerializer):
+    """Row of the transaction list API"""
+    order_number = serializers.CharField(source='order.order_number')
+    payment_method = serializers.CharField(source='payment_method.name')
+    amount = serializers.FloatField()
+    created_at = serializers.DateTimeField(default_timezone=datetime.timezone.utc)
+
+    select_related = ('order', 'payment_method')
+    only_fields = (
+        'transaction_id', 'amount', 'status', 'created_at',
+        'order', 'order__order_number', 'payment_method', 'payment_method__name',
+    )
+
+    class Meta:
+        model = Transaction
+        fields = ['id', 'transaction_id', 'order_number', 'payment_method', 'amount', 'status', 'created_at']
@@ -0,0 +1,25 @@
+"""
+Signals for transactions
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from common.services import ChangeVersionService
+from orders.models import Order
+from .models import Transaction
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+def bump_payment_version(sender, instance, **kwargs):
+    """
+    Invalidate dashboard ETags that show payments and revenue
+    """
+    try:
+        sales_rep_id = instance.order.sales_rep_id
+    except Order.DoesNotExist:
+        sales_rep_id = None
+    ChangeVersionService.bump(
+        ChangeVersionService.ORDERS_SCOPE,
+        ChangeVersionService.orders_scope(sales_rep_id) if sales_rep_id else None,
+    )
@@ -12,6 +12,7 @@ import json
 from .models import PaymentMethod, Transaction, Refund, SalesReport
 from accounts.models import User
 from orders.models import Order
+from common.testing import QueryCountAssertionsMixin
 
 User = get_user_model()
 
@@ -105,3 +106,38 @@ class TransactionModelTests(TestCase):
         transaction = Transaction.objects.create(**self.transaction_data)
         self.assertTrue(transaction.transaction_id.startswith('TXN-'))
         self.assertEqual(len(transaction.transaction_id), 16)  # TXN- + 12 hex chars
+
+
+class TransactionListAPITests(QueryCountAssertionsMixin, TestCase):
+    """Test cases for the transaction list API"""
+    
+    def setUp(self):
+        """Set up test data"""
+        self.user = User.objects.create_user(username='salesrep', password='testpass123', role='sales_rep')
+        self.client = Client()
+        self.client.force_login(self.user)
+    
+    def _add_transactions(self, count):
+        for _ in range(count):
+            order = Order.objects.create(
+                sales_rep=self.user, customer_name='John Doe',
+                subtotal=Decimal('100.00'), total_amount=Decimal('100.00')
+            )
+            payment_method = PaymentMethod.objects.create(name=f'Method {order.pk}', is_active=True)
+            Transaction.objects.create(
+                order=order, payment_method=payment_method, transaction_type='payment',
+                amount=Decimal('100.00'), net_amount=Decimal('100.00')
+            )
+    
+    def test_list_queries_do_not_grow_with_page_size(self):
+        """Test each row's order and payment method are joined rather than queried"""
+        self.assertConstantQueries(
+            lambda: self.client.get('/transactions/api/transactions/?per_page=50'), self._add_transactions
+        )
+        
+        row = self.client.get('/transactions/api/transactions/').json()['transactions'][0]
+        transaction = Transaction.objects.select_related('order', 'payment_method').latest('created_at')
+        self.assertEqual(row['transaction_id'], transaction.transaction_id)
+        self.assertEqual(row['order_number'], transaction.order.order_number)
+        self.assertEqual(row['payment_method'], transaction.payment_method.name)
+        self.assertEqual(row['amount'], 100.0)
@@ -6,7 +6,6 @@ from django.urls import reverse_lazy, reverse
 from django.contrib import messages
 from django.db.models import Q, Sum, F, Count
 from django.http import JsonResponse
-from django.core.paginator import Paginator
 from django.utils import timezone
 from datetime import datetime, timedelta, date
 
@@ -15,7 +14,11 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 
+from common.dates import date_range_lookups
+from common.exports import CSVExportMixin
+from common.pagination import InvalidCursor, KeysetPaginator, KeysetPaginationMixin, keyset_page_data
 from .models import Transaction, PaymentMethod, Refund, SalesReport
+from .serializers import TransactionListSerializer
 
 
 # Dashboard View
@@ -27,7 +30,7 @@ class TransactionDashboardView(LoginRequiredMixin, TemplateView):
         context = super().get_context_data(**kwargs)
         
         # Get transaction statistics
-        today = timezone.now().date()
+        today = timezone.localdate()
         this_month = today.replace(day=1)
         
         total_transactions = Transaction.objects.count()
@@ -42,7 +45,7 @@ class TransactionDashboardView(LoginRequiredMixin, TemplateView):
         
         monthly_revenue = Transaction.objects.filter(
             status='completed',
-            created_at__date__gte=this_month
+            **date_range_lookups('created_at', start=this_month)
         ).aggregate(total=Sum('amount'))['total'] or 0
         
         # Recent transactions
@@ -66,12 +69,29 @@ class TransactionDashboardView(LoginRequiredMixin, TemplateView):
 
 
 # Transaction Management Views
-class TransactionListView(LoginRequiredMixin, ListView):
+class TransactionListView(LoginRequiredMixin, KeysetPaginationMixin, CSVExportMixin, ListView):
     """List all transactions"""
     model = Transaction
     template_name = 'transactions/transaction_list.html'
     context_object_name = 'transactions'
     paginate_by = 20
+    export_columns = [
+        ('Transaction ID', 'transaction_id'),
+        ('Created', 'created_at'),
+        ('Order number', 'order__order_number'),
+        ('Payment method', 'payment_method__name'),
+        ('Type', 'transaction_type'),
+        ('Status', 'status'),
+        ('Amount', 'amount'),
+        ('Processing fee', 'processing_fee'),
+        ('Net amount', 'net_amount'),
+        ('Completed', 'completed_at'),
+    ]
+    export_filename = 'transactions'
+    
+    def export_allowed(self):
+        # Finance exports are for pharmacists and admins
+        return self.request.user.is_pharmacist_admin or self.request.user.is_admin
     
     def get_queryset(self):
         queryset = Transaction.objects.select_related('order', 'payment_method').order_by('-created_at')
@@ -204,7 +224,7 @@ class SalesReportView(LoginRequiredMixin, TemplateView):
         
         if not start_date or not end_date:
             # Default to last 30 days
-            end_date = timezone.now().date()
+            end_date = timezone.localdate()
             start_date = end_date - timedelta(days=30)
         else:
             start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -213,7 +233,7 @@ class SalesReportView(LoginRequiredMixin, TemplateView):
         # Get sales data
         transactions = Transaction.objects.filter(
             status='completed',
-            created_at__date__range=[start_date, end_date]
+            **date_range_lookups('created_at', start_date, end_date)
         )
         
         total_revenue = transactions.aggregate(total=Sum('amount'))['total'] or 0
@@ -257,12 +277,12 @@ class FinancialReportView(LoginRequiredMixin, TemplateView):
         # Monthly revenue trend (last 12 months)
         monthly_data = []
         for i in range(12):
-            month_start = timezone.now().date().replace(day=1) - timedelta(days=30*i)
+            month_start = timezone.localdate().replace(day=1) - timedelta(days=30*i)
             month_end = month_start + timedelta(days=30)
             
             month_revenue = Transaction.objects.filter(
                 status='completed',
-                created_at__date__range=[month_start, month_end]
+                **date_range_lookups('created_at', month_start, month_end)
             ).aggregate(total=Sum('amount'))['total'] or 0
             
             monthly_data.append({
@@ -286,42 +306,25 @@ class TransactionListAPIView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        transactions = Transaction.objects.select_related('order', 'payment_method').order_by('-created_at')
+        transactions = TransactionListSerializer.plan(Transaction.objects.order_by('-created_at'))
         
         # Filter by status
         status_filter = request.GET.get('status')
         if status_filter:
             transactions = transactions.filter(status=status_filter)
         
-        # Pagination
-        page = int(request.GET.get('page', 1))
-        per_page = int(request.GET.get('per_page', 20))
-        
-        paginator = Paginator(transactions, per_page)
-        page_obj = paginator.get_page(page)
+        # Cursor pagination: deep pages cost the same as the first
+        per_page = min(int(request.GET.get('per_page', 20)), 100)
         
-        transactions_data = []
-        for transaction in page_obj:
-            transactions_data.append({
-                'id': transaction.id,
-                'transaction_id': transaction.transaction_id,
-                'order_number': transaction.order.order_number,
-                'payment_method': transaction.payment_method.name,
-                'amount': float(transaction.amount),
-                'status': transaction.status,
-                'created_at': transaction.created_at,
-            })
+        paginator = KeysetPaginator(transactions, per_page)
+        try:
+            page_obj = paginator.page(request.GET.get('cursor'))
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({
-            'transactions': transactions_data,
-            'pagination': {
-                'page': page,
-                'per_page': per_page,
-                'total_pages': paginator.num_pages,
-                'total_count': paginator.count,
-                'has_next': page_obj.has_next(),
-                'has_previous': page_obj.has_previous(),
-            }
+            'transactions': TransactionListSerializer(page_obj, many=True).data,
+            'pagination': keyset_page_data(page_obj, include_count=request.GET.get('count') == 'true'),
         })
 
 
@@ -388,7 +391,7 @@ class SalesReportAPIView(APIView):
         end_date = request.GET.get('end_date')
         
         if not start_date or not end_date:
-            end_date = timezone.now().date()
+            end_date = timezone.localdate()
             start_date = end_date - timedelta(days=30)
         else:
             start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -396,7 +399,7 @@ class SalesReportAPIView(APIView):
         
         transactions = Transaction.objects.filter(
             status='completed',
-            created_at__date__range=[start_date, end_date]
+            **date_range_lookups('created_at', start_date, end_date)
         )
         
         total_revenue = transactions.aggregate(total=Sum('amount'))['total'] or 0